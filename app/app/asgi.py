@@ -9,8 +9,10 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
+# views run in bounded read/write thread pools instead of django's single
+# sync thread; see core/asgi.py
+from core.asgi import get_asgi_application  # noqa: E402
+
 application = get_asgi_application()
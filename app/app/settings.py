@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,10 +42,16 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'core',
     'user',
-    'recipe'
+    'recipe',
+    'song',
+    'upload'
 ]
 
 MIDDLEWARE = [
+    # /healthz and /readyz are answered before anything else runs (see core/health.py)
+    'core.health.HealthCheckMiddleware',
+    # before the rest so everything a GET reads (sessions too) comes from the same database
+    'core.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,16 +86,100 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
 # these variables make it easy to change via docker; i.e. if you put your app into production you just have to change the variables in your dockerfile to have it work
+# under asgi (app/asgi.py) views run in these thread pools per process, reads (GET/HEAD/OPTIONS) and writes apart
+# so slow writes cant hold up reads; see core/asgi.py
+ASGI_READ_THREADS = int(os.environ.get('ASGI_READ_THREADS', 32))
+ASGI_WRITE_THREADS = int(os.environ.get('ASGI_WRITE_THREADS', 8))
+
+# background work like resizing uploaded images runs in a thread pool in each process (see core/tasks.py)
+BACKGROUND_THREAD_WORKERS = int(os.environ.get('BACKGROUND_THREAD_WORKERS', 2))
+
+# every thread that can query holds at most one connection: the asgi pools, the background pool and the main thread
+DB_THREADS = ASGI_READ_THREADS + ASGI_WRITE_THREADS + BACKGROUND_THREAD_WORKERS + 1
+DB_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))  # app/gunicorn.conf.py sets it
+# DB_POOL=1 puts a connection back in a pool in the process at the end of each request (CONN_MAX_AGE=0) instead of
+# disconnecting, so a slot of MAX_CONNECTIONS is only held while a request runs (see core/db/__init__.py). off by
+# default until it has run against a real postgres; without it every thread keeps its own connection for
+# DB_CONN_MAX_AGE seconds and holds its slot that long
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+# connections for all the gunicorn workers together, split evenly between them. unset each worker may open one per
+# thread so no thread ever waits for a connection; postgres then needs DB_WORKERS * DB_THREADS of its max_connections
+# (100 by default). set it to stay under that: with DB_POOL=1 requests past a worker's share wait up to
+# DB_POOL_TIMEOUT for a connection, without the pool a share below DB_THREADS would leave threads waiting on
+# connections that are never given back so it is refused
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', DB_WORKERS * DB_THREADS))
+DB_WORKER_CONNECTIONS = max(1, DB_MAX_CONNECTIONS // DB_WORKERS)
+if not DB_POOL and DB_WORKER_CONNECTIONS < DB_THREADS:
+    raise ImproperlyConfigured(
+        f'DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS} gives each of the {DB_WORKERS} workers {DB_WORKER_CONNECTIONS} '
+        f'connections but they have {DB_THREADS} threads; raise it, lower the thread counts or set DB_POOL=1.'
+    )
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'POOL': DB_POOL,
+        'MAX_CONNECTIONS': DB_WORKER_CONNECTIONS,
+        'POOL_TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # seconds a connection can sit unused before it is checked with a SELECT 1 ahead of being used again
+        'HEALTH_CHECK_AFTER': int(os.environ.get('DB_HEALTH_CHECK_AFTER', 30)),
+    }
+}
+
+# read replicas of default (DB_REPLICA_HOSTS=host1,host2:5433), same database name/user/password; GET/HEAD/OPTIONS
+# requests read from them (see core/routers.py)
+DATABASE_REPLICAS = ()
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 2))
+for i, replica_host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica_host.strip().partition(':')
+    DATABASES[f'replica_{i}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port,
+        # a replica that is down fails its health check (core/routers.py) quickly instead of hanging on connect
+        OPTIONS=dict(DATABASES['default'].get('OPTIONS', {}), connect_timeout=REPLICA_CONNECT_TIMEOUT),
+        TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS += (f'replica_{i}',)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# a replica further behind than this (seconds) isnt read from, checked at most every REPLICA_CHECK_INTERVAL seconds
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+# a user reads from default for this long after they write so they see their own changes (stored in API_CACHE_ALIAS,
+# make that a shared cache when there is more than one worker)
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+# /readyz also fails while migrations are waiting to be applied
+READINESS_CHECK_MIGRATIONS = os.environ.get('READINESS_CHECK_MIGRATIONS', '1') == '1'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# local memory by default; point CACHE_BACKEND/CACHE_LOCATION at memcached (or any django cache backend e.g. django_redis) in production
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# cache used for the per user api responses and how long (seconds) they live
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+
+# in process cache of auth tokens (see core/authentication.py); set AUTH_TOKEN_CACHE_ALIAS to a cache alias all
+# workers share (i.e. redis/memcached) so deleting a token or deactivating a user reaches every worker straight away
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS') or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -142,3 +233,59 @@ MEDIA_ROOT = '/Users/ryzm/Desktop/®/Web Dev/Generic-API/app/media'
 STATIC_ROOT = '/Users/ryzm/Desktop/®/Web Dev/Generic-API/app/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+# default number of rows in a page; clients can ask for up to API_MAX_PAGE_SIZE rows with ?page_size=
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# how many matches the tag/ingredient autocomplete returns by default and at most (?limit=)
+API_AUTOCOMPLETE_LIMIT = 10
+API_AUTOCOMPLETE_MAX_LIMIT = 50
+
+# ASGI_READ_THREADS, ASGI_WRITE_THREADS and BACKGROUND_THREAD_WORKERS are with the database settings above since
+# they decide how many connections a process needs
+# cpu heavy work (i.e. song analysis) runs in a pool of processes so it doesnt block the request threads
+BACKGROUND_PROCESS_WORKERS = int(os.environ.get(
+    'BACKGROUND_PROCESS_WORKERS', max(1, (os.cpu_count() or 2) // 2)
+))
+# run background tasks inline instead; handy for tests
+BACKGROUND_TASKS_EAGER = os.environ.get('BACKGROUND_TASKS_EAGER') == '1'
+
+# longest side (px) of the recipe image thumbnail and webp copy
+RECIPE_IMAGE_THUMBNAIL_SIZE = 300
+RECIPE_IMAGE_WEBP_SIZE = 1600
+
+# how often (seconds) each process checks for songs analyzed by other processes (see song/index.py)
+SONG_INDEX_REFRESH_INTERVAL = int(os.environ.get('SONG_INDEX_REFRESH_INTERVAL', 5))
+# each refresh also reads the songs updated this many seconds before the newest one it has, so a song whose
+# analysis committed late (after a newer one was indexed) isnt missed; longer than any transaction that saves a song
+SONG_INDEX_REFRESH_OVERLAP = int(os.environ.get('SONG_INDEX_REFRESH_OVERLAP', 60))
+SONG_SIMILAR_MAX_LIMIT = 100
+
+# chunked uploads (see the upload app); biggest chunk a single request can send and biggest whole file
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+
+# most items a /bulk/ request can have and how many rows go in each insert/update query
+API_BULK_MAX_ITEMS = int(os.environ.get('API_BULK_MAX_ITEMS', 10000))
+API_BULK_BATCH_SIZE = 500
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'core.authentication.CachedTokenAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'recipe.pagination.RecipeCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # orjson when it is installed, the stdlib otherwise; see core/renderers.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
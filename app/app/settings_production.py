@@ -0,0 +1,53 @@
+"""
+settings for serving real traffic; everything not here comes from
+app/settings.py
+
+    DJANGO_SETTINGS_MODULE=app.settings_production \
+        gunicorn app.asgi:application
+"""
+import os
+from django.core.exceptions import ImproperlyConfigured
+from app.settings import *  # noqa
+from app.settings import REST_FRAMEWORK
+
+# DEBUG also keeps every sql query of a request in memory (connection.queries)
+# and renders tracebacks
+DEBUG = False
+
+# no fallbacks: the dev key in app/settings.py is public and without hosts
+# any Host header would be trusted
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set the SECRET_KEY environment variable.')
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('ALLOWED_HOSTS', '').split(',')
+    if host.strip()
+]
+if not ALLOWED_HOSTS:
+    raise ImproperlyConfigured(
+        'Set ALLOWED_HOSTS to a comma separated list of host names.'
+    )
+
+# json only; the browsable api renders html (forms, every related object for
+# the select boxes) on each GET
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_RENDERER_CLASSES=(
+    'core.renderers.FastJSONRenderer',
+))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('LOG_LEVEL', 'INFO')
+    },
+    'loggers': {
+        # sql logging only ever happens with DEBUG but make sure it stays off
+        # even if LOG_LEVEL=DEBUG
+        'django.db.backends': {'level': 'INFO', 'propagate': True},
+    },
+}
@@ -21,6 +21,9 @@ from django.conf import settings
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
-    path('api/recipe/', include('recipe.urls'))
+    path('api/recipe/', include('recipe.urls')),
+    path('api/song/', include('song.urls')),
+    path('api/upload/', include('upload.urls')),
+    path('api/', include('core.urls'))
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 # last line allows us to serve media files as part of our static setup and lets us view this files in dev mode w/o having to set up our own server
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""asgi handler that runs django's views in bounded thread pools
+
+django 3.0 has no async views; its ASGIHandler runs every view through
+sync_to_async which (asgiref >= 3.3) puts them all on one shared thread, so
+one slow query holds up every other request in the process. this handler
+keeps what asgi is good at on the event loop (reading request bodies and
+sending responses to slow clients) and runs each view in a pool: reads
+(list/retrieve...) and writes get separate pools so slow uploads/bulk writes
+cant starve reads
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import django
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.http import FileResponse
+from django.urls import set_script_prefix
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PooledASGIHandler(ASGIHandler):
+    """ASGIHandler that runs GET/HEAD/OPTIONS in a read pool and everything
+    else in a write pool
+    """
+
+    def __init__(self, read_threads=None, write_threads=None):
+        super().__init__()
+        self.read_executor = ThreadPoolExecutor(
+            read_threads or settings.ASGI_READ_THREADS,
+            thread_name_prefix='asgi-read'
+        )
+        self.write_executor = ThreadPoolExecutor(
+            write_threads or settings.ASGI_WRITE_THREADS,
+            thread_name_prefix='asgi-write'
+        )
+
+    def executor(self, scope):
+        if scope['method'] in READ_METHODS:
+            return self.read_executor
+        return self.write_executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await super().__call__(scope, receive, send)
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        set_script_prefix(self.get_script_prefix(scope))
+        # copy the context so anything set on the loop (i.e. the script
+        # prefix) is seen in the pool thread
+        response = await asyncio.get_event_loop().run_in_executor(
+            self.executor(scope),
+            contextvars.copy_context().run,
+            self.handle,
+            scope,
+            body_file
+        )
+        await self.send_response(response, send)
+
+    def handle(self, scope, body_file):
+        """build the response in a pool thread
+
+        everything that can touch the db happens here so the connection
+        closed (or kept, with CONN_MAX_AGE) at the end is the one the request
+        used; django's own request_finished runs on the loop where it is a
+        no-op
+        """
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        try:
+            request, error_response = self.create_request(scope, body_file)
+            if request is None:
+                return error_response
+            response = self.get_response(request)
+            response._handler_class = self.__class__
+            if isinstance(response, FileResponse):
+                response.block_size = self.chunk_size
+            return response
+        finally:
+            close_old_connections()
+
+
+def get_asgi_application():
+    """PooledASGIHandler version of django.core.asgi.get_asgi_application"""
+    django.setup(set_prefix=False)
+    return PooledASGIHandler()
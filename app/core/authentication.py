@@ -0,0 +1,151 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches, DEFAULT_CACHE_ALIAS
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """thread safe LRU of token key => (user, token) where every entry
+    expires after a ttl
+
+    every token has a generation kept in a django cache (the shared alias if
+    given, else the default one) and each entry remembers the generation it
+    was cached under. a hit is only used while that generation is still the
+    current one, so invalidating a token in one process drops it in every
+    process that reads the same cache
+    """
+
+    def __init__(self, max_size, ttl, shared_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()
+        # user pk => token keys so a user can be dropped without a full scan
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        return caches[self.shared_alias or DEFAULT_CACHE_ALIAS]
+
+    def _generation_key(self, key):
+        # never put the raw token in the cache key
+        return 'auth:token:%s' % hashlib.sha256(key.encode()).hexdigest()
+
+    def generation(self, key):
+        """return the current generation of a token (None if never bumped)"""
+        return self._shared().get(self._generation_key(key))
+
+    def get(self, key):
+        """return a copy of the cached (user, token) for a key or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, generation, value = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+        # checked outside the lock since it can be a network round trip
+        if self.generation(key) != generation:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        # copy so one request changing request.user cant leak into another
+        return copy.deepcopy(value)
+
+    def set(self, key, value, generation):
+        """cache (user, token) under the generation read before loading it"""
+        user, token = value
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires, generation, copy.deepcopy(value))
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """drop a key from the local cache; caller must hold the lock"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_pk = entry[2][0].pk
+        keys = self._keys_by_user.get(user_pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_pk]
+
+    def invalidate(self, *keys):
+        """drop tokens here and in every process sharing the cache
+
+        inside a transaction it is bumped again once it commits so a request
+        that read the old rows in between doesnt keep them cached
+        """
+        self._bump(keys)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(partial(self._bump, keys))
+
+    def _bump(self, keys):
+        # outlives any entry cached under the old generation; once it
+        # expires those entries have expired too
+        generation = uuid.uuid4().hex
+        self._shared().set_many(
+            {self._generation_key(key): generation for key in keys},
+            self.ttl * 2
+        )
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def invalidate_user(self, user_pk, keys=()):
+        """drop every token of a user; keys are their tokens in the db"""
+        with self._lock:
+            keys = set(keys) | set(self._keys_by_user.get(user_pk, ()))
+        self.invalidate(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+token_cache = TokenCache(
+    max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+    shared_alias=settings.AUTH_TOKEN_CACHE_ALIAS
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """token authentication that remembers tokens instead of querying
+    Token + User on every request
+
+    core/signals.py bumps the generation of a token when it is deleted or
+    its user is saved/deleted. that reaches other processes only if
+    AUTH_TOKEN_CACHE_ALIAS points at a cache they share, otherwise they
+    notice after AUTH_TOKEN_CACHE_TTL seconds. request.user is a cached copy
+    so views that write the user have to load it again
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        # read before the db so a change that lands in between isnt cached
+        # under its new generation
+        generation = token_cache.generation(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token), generation)
+        return user, token
@@ -0,0 +1,272 @@
+"""database backends (ENGINE 'core.db.postgresql' or 'core.db.sqlite3') that
+cap how many connections each process opens and can pool them
+
+django keeps one connection per thread. with CONN_MAX_AGE it is kept between
+requests, which saves the connect/auth handshake but means a process holds as
+many connections as it has threads (the asgi pools in core/asgi.py, the
+background pool...) and a few workers can use up postgres' max_connections.
+these backends add to DATABASES:
+
+    MAX_CONNECTIONS     most connections the process may have open; past that
+                        a thread waits for one to be closed
+    POOL                when a thread closes its connection (the end of each
+                        request with CONN_MAX_AGE=0) it is kept for the next
+                        thread to use instead of disconnecting
+    POOL_TIMEOUT        seconds a thread waits for a connection before giving
+                        up with an OperationalError
+    HEALTH_CHECK_AFTER  a connection idle for longer than this (seconds) is
+                        checked before it is used again, so one the server
+                        dropped doesnt fail a request
+
+pool_stats() gives the numbers for every alias in this process
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_POOL_TIMEOUT = 10
+DEFAULT_HEALTH_CHECK_AFTER = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """thread safe limit on open connections, optionally keeping closed ones
+    to hand out again
+    """
+
+    def __init__(self, max_size, timeout, health_check_after, reuse=True):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.reuse = reuse
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (raw connection, time it was released) newest last
+        self._idle = deque()
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def acquire(self, connect, is_usable, error_class):
+        """return an idle connection (checked with is_usable if it sat for a
+        while) or a new one from connect()
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                logger.warning(
+                    'no database connection free after %ss (%s in use)',
+                    self.timeout,
+                    self.max_size
+                )
+                raise error_class(
+                    f'All {self.max_size} database connections of this '
+                    f'process are in use.'
+                )
+        try:
+            conn = self._pop_usable(is_usable)
+            if conn is None:
+                conn = connect()
+                with self._lock:
+                    self.created += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        return conn
+
+    def _pop_usable(self, is_usable):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, released_at = self._idle.pop()
+            idle = time.monotonic() - released_at
+            if idle < self.health_check_after or is_usable(conn):
+                with self._lock:
+                    self.reused += 1
+                return conn
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def release(self, conn, reusable=True):
+        """give back a connection from acquire; kept for the next acquire if
+        it can be, closed otherwise
+        """
+        try:
+            if self.reuse and reusable:
+                try:
+                    # never hand out a connection in the middle of someone
+                    # else's transaction
+                    conn.rollback()
+                except Exception:
+                    self._discard(conn)
+                else:
+                    with self._lock:
+                        self._idle.append((conn, time.monotonic()))
+            else:
+                conn.close()
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def close_idle(self):
+        """disconnect every idle connection"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return
+                conn, _ = self._idle.pop()
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+            }
+
+
+def get_pool(alias, settings_dict):
+    """return the process wide pool of a database (created on first use)"""
+    # keyed by where it connects to so the test runner switching NAME to the
+    # test database gets a new pool
+    key = (alias,) + tuple(
+        settings_dict.get(name) for name in ('HOST', 'PORT', 'NAME', 'USER')
+    )
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                max_size=(
+                    settings_dict.get('MAX_CONNECTIONS')
+                    or DEFAULT_MAX_CONNECTIONS
+                ),
+                timeout=settings_dict.get(
+                    'POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT
+                ),
+                health_check_after=settings_dict.get(
+                    'HEALTH_CHECK_AFTER', DEFAULT_HEALTH_CHECK_AFTER
+                ),
+                reuse=bool(settings_dict.get('POOL')),
+            )
+        return _pools[key]
+
+
+def pool_stats():
+    """return the stats of every pool this process has used, with the alias
+    and database name it is for
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return [
+        dict(alias=key[0], database=key[3], **pool.stats())
+        for key, pool in pools.items()
+    ]
+
+
+class PooledDatabaseWrapperMixin:
+    """mixed into a backend's DatabaseWrapper to take its connections from
+    get_pool
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._idle_since = time.monotonic()
+        # the pool the open connection came from; settings_dict can change
+        # while it is open (the test runner switches NAME to the test
+        # database) so it must go back to this one, not whatever pool the
+        # settings say now
+        self._connection_pool = None
+
+    @property
+    def pool(self):
+        if self._connection_pool is not None:
+            return self._connection_pool
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+        connect = super().get_new_connection
+        conn = pool.acquire(
+            lambda: connect(conn_params),
+            self._raw_is_usable,
+            self.Database.OperationalError
+        )
+        self._connection_pool = pool
+        return conn
+
+    def _raw_is_usable(self, conn):
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is not None:
+            pool, self._connection_pool = self._connection_pool, None
+            # closed inside atomic() django keeps pointing at it until the
+            # block exits so it cant go to anyone else
+            pool.release(
+                self.connection,
+                reusable=not self.in_atomic_block and not self.errors_occurred
+            )
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # django 3.0 only checks a kept connection after an error; one the
+        # server dropped while it sat between requests would fail the next
+        # query
+        now = time.monotonic()
+        if (
+            self.connection is not None
+            and not self.in_atomic_block
+            and now - self._idle_since > self.pool.health_check_after
+            and not self.is_usable()
+        ):
+            self.close()
+        self._idle_since = now
+
+
+def close_idle_connections():
+    """disconnect the idle pooled connections of every alias (i.e. before
+    forking workers)
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
@@ -0,0 +1,9 @@
+from django.db.backends.postgresql import base
+from core.db import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """postgresql with a per process connection limit/pool
+
+    see core/db/__init__.py
+    """
@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+from core.db import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """sqlite with a per process connection limit/pool
+
+    see core/db/__init__.py
+    """
@@ -0,0 +1,95 @@
+"""database readiness checks for wait_for_db and the /healthz and /readyz
+probes
+
+only raw connections and the migration loader are used, never a model, so
+nothing here depends on auth or on the tables being there
+"""
+import logging
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.migrations.executor import MigrationExecutor
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = '/healthz'
+READY_PATH = '/readyz'
+
+# aliases whose migrations were all applied last time; a running process
+# doesnt get new migrations so no need to load them from disk for every probe
+# once they are
+_migrated = set()
+
+
+def check_database(alias=DEFAULT_DB_ALIAS):
+    """connect (if needed) and run SELECT 1; raises DatabaseError when the
+    database cant be used
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def unapplied_migrations(alias=DEFAULT_DB_ALIAS):
+    """return the names ('app.migration') of the migrations not applied to a
+    database
+    """
+    if alias in _migrated:
+        return []
+    executor = MigrationExecutor(connections[alias])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    unapplied = [
+        f'{migration.app_label}.{migration.name}' for migration, _ in plan
+    ]
+    if not unapplied:
+        _migrated.add(alias)
+    return unapplied
+
+
+def readiness_error(alias=DEFAULT_DB_ALIAS, check_migrations=True):
+    """return why a database isnt ready to serve requests or None if it is"""
+    try:
+        check_database(alias)
+        if check_migrations:
+            unapplied = unapplied_migrations(alias)
+            if unapplied:
+                return (
+                    f'{len(unapplied)} unapplied migrations '
+                    f'(i.e. {unapplied[0]})'
+                )
+    except Exception as exc:
+        # anything the driver raises (not only DatabaseError, i.e. a bad host
+        # name) means not ready
+        return f'{type(exc).__name__}: {exc}'.strip()
+    return None
+
+
+class HealthCheckMiddleware:
+    """answer the liveness (/healthz) and readiness (/readyz) probes before
+    any other middleware
+
+    they dont need auth, sessions, csrf or the replica routing, and a probe
+    sent to the pod's ip would be turned away by ALLOWED_HOSTS
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == HEALTH_PATH:
+            # the process is up and answering, nothing else
+            return JsonResponse({'status': 'ok'})
+        if request.path == READY_PATH:
+            error = readiness_error(
+                check_migrations=settings.READINESS_CHECK_MIGRATIONS
+            )
+            if error:
+                logger.warning('not ready: %s', error)
+                data = {'status': 'unavailable'}
+                # the reason can name hosts/databases so it is only shown while
+                # debugging
+                if settings.DEBUG:
+                    data['error'] = error
+                return JsonResponse(data, status=503)
+            return JsonResponse({'status': 'ok'})
+        return self.get_response(request)
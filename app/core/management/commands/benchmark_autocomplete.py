@@ -0,0 +1,60 @@
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Tag
+from core.management.commands.seed_recipes import BATCH_SIZE
+from recipe.autocomplete import autocomplete
+
+SYLLABLES = (
+    'ba', 'ko', 'mi', 'sal', 'ter', 'veg', 'an', 'pep', 'ro', 'chi', 'ken',
+    'lu', 'da', 'no'
+)
+
+
+class Command(BaseCommand):
+    """django command to time the tag autocomplete for a user with a lot of
+    tags
+
+    everything is seeded in a transaction that is rolled back at the end
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _name(self, rng):
+        words = (
+            ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            for _ in range(rng.randint(1, 3))
+        )
+        return ' '.join(word.capitalize() for word in words)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark@test.com', 'password'
+            )
+            self.stdout.write(f'seeding {options["tags"]} tags...')
+            Tag.objects.bulk_create(
+                [
+                    Tag(user=user, name=self._name(rng))
+                    for _ in range(options['tags'])
+                ],
+                batch_size=BATCH_SIZE
+            )
+            tags = Tag.objects.filter(user=user).only('id', 'name')
+            for text in ('v', 'veg', 'salter', 'chiken', 'pepro mida'):
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    count = len(list(autocomplete(tags, text, 10)))
+                    timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    f'{text!r:<15} {statistics.median(timings):>8.2f} ms '
+                    f'{count:>4} matches'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,78 @@
+import io
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from core import renderers
+from core.models import Recipe
+from core.management.commands.seed_recipes import seed_recipes
+from recipe.serializers import RecipeSerializer
+
+
+class Command(BaseCommand):
+    """django command to compare drf's json renderer/parser with
+    core/renderers.py on recipe list payloads
+
+    everything is seeded in a transaction that is rolled back at the end
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000]
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def _time(self, func, repeat):
+        """return the median time of func in ms"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def _report(self, name, size, ms, nbytes):
+        self.stdout.write(
+            f'{name:<20} {size:>7} recipes {ms:>9.2f} ms '
+            f'{nbytes / ms / 1000:>8.1f} MB/s'
+        )
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            self.stdout.write(
+                'orjson is not installed, the fast renderer/parser fall back '
+                'to the stdlib'
+            )
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark@test.com', 'password'
+            )
+            self.stdout.write(f'seeding {max(options["sizes"])} recipes...')
+            seed_recipes(user, max(options['sizes']))
+            recipes = Recipe.objects.filter(user=user).prefetch_related(
+                'tags', 'ingredients'
+            )
+            for size in options['sizes']:
+                data = RecipeSerializer(recipes[:size], many=True).data
+                for name, renderer, parser in (
+                    ('stdlib', JSONRenderer(), JSONParser()),
+                    (
+                        'fast',
+                        renderers.FastJSONRenderer(),
+                        renderers.FastJSONParser()
+                    ),
+                ):
+                    body = renderer.render(data)
+                    ms = self._time(
+                        lambda: renderer.render(data), options['repeat']
+                    )
+                    self._report(f'{name} render', size, ms, len(body))
+                    ms = self._time(
+                        lambda: parser.parse(io.BytesIO(body)),
+                        options['repeat']
+                    )
+                    self._report(f'{name} parse', size, ms, len(body))
+            transaction.set_rollback(True)
@@ -0,0 +1,66 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Recipe
+from core.management.commands.seed_recipes import seed_recipes
+from recipe.filters import filter_by_related, MATCH_ANY, MATCH_ALL
+
+
+class Command(BaseCommand):
+    """django command to time the recipe tag/ingredient filters on a seeded
+    dataset
+
+    everything is seeded in a transaction that is rolled back at the end
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _time(self, queryset, repeat):
+        """return the median time in ms and the row count of a queryset"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = len(list(queryset.values_list('id', flat=True)))
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), count
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'benchmark@test.com', 'password'
+            )
+            self.stdout.write(f'seeding {options["recipes"]} recipes...')
+            seed_recipes(user, options['recipes'])
+            tag_ids = set(user.tag_set.values_list('id', flat=True)[:3])
+            ingredient_ids = set(
+                user.ingredient_set.values_list('id', flat=True)[:3]
+            )
+            recipes = Recipe.objects.filter(user=user)
+
+            cases = {
+                # the old implementation; join through both m2m tables
+                'join tags+ingredients (legacy)': recipes.filter(
+                    tags__id__in=tag_ids
+                ).filter(ingredients__id__in=ingredient_ids),
+                'join tags+ingredients + distinct': recipes.filter(
+                    tags__id__in=tag_ids
+                ).filter(ingredients__id__in=ingredient_ids).distinct(),
+                'tags any': filter_by_related(
+                    recipes, 'tags', tag_ids, MATCH_ANY
+                ),
+                'tags all': filter_by_related(
+                    recipes, 'tags', tag_ids, MATCH_ALL
+                ),
+                'tags any + ingredients any': filter_by_related(
+                    filter_by_related(recipes, 'tags', tag_ids, MATCH_ANY),
+                    'ingredients', ingredient_ids, MATCH_ANY
+                ),
+            }
+            for name, queryset in cases.items():
+                ms, count = self._time(queryset, options['repeat'])
+                self.stdout.write(f'{name:<35} {ms:>10.1f} ms {count:>8} rows')
+            transaction.set_rollback(True)
@@ -0,0 +1,107 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+from core.management.commands.seed_recipes import seed_recipes
+
+
+class Command(BaseCommand):
+    """django command to measure the throughput of a running server on the
+    recipe list
+
+    run it next to the server with the same database settings (i.e.
+    docker-compose exec app python manage.py benchmark_server); a user with
+    --recipes recipes is seeded and committed for the run and deleted after
+    it. every client is a thread with its own keep alive connection sending
+    the same requests so runs are comparable
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000')
+        parser.add_argument('--path', default='/api/recipe/recipes/')
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--warmup', type=int, default=200)
+
+    def _client(self, url, path, headers, count, timings, errors):
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            conn_class = http.client.HTTPSConnection
+        else:
+            conn_class = http.client.HTTPConnection
+        conn = conn_class(parts.hostname, parts.port, timeout=30)
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        errors.append(response.status)
+                except (OSError, http.client.HTTPException) as exc:
+                    errors.append(exc)
+                    conn.close()
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            conn.close()
+
+    def _run(self, options, headers, total):
+        """send total requests split over the clients; returns (seconds,
+        timings, errors)
+        """
+        timings, errors = [], []
+        concurrency = options['concurrency']
+        threads = [
+            threading.Thread(target=self._client, args=(
+                options['url'], options['path'], headers,
+                total // concurrency + (i < total % concurrency),
+                timings, errors
+            ))
+            for i in range(concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, sorted(timings), errors
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create_user(
+            'benchmark-server@test.com', 'password'
+        )
+        try:
+            token = Token.objects.create(user=user)
+            self.stdout.write(f'seeding {options["recipes"]} recipes...')
+            seed_recipes(user, options['recipes'])
+            headers = {
+                'Authorization': f'Token {token.key}',
+                'Accept': 'application/json'
+            }
+            self._run(options, headers, options['warmup'])
+            elapsed, timings, errors = self._run(
+                options, headers, options['requests']
+            )
+        finally:
+            user.delete()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+        self.stdout.write(
+            f'{options["url"]}{options["path"]} x{options["requests"]} '
+            f'({options["concurrency"]} clients)'
+        )
+        self.stdout.write(
+            f'{len(timings) / elapsed:.1f} req/s  '
+            f'p50 {statistics.median(timings):.1f} ms  '
+            f'p95 {percentile(0.95):.1f} ms  '
+            f'p99 {percentile(0.99):.1f} ms  errors {len(errors)}'
+        )
+        if errors:
+            self.stdout.write(f'first error: {errors[0]!r}')
@@ -0,0 +1,46 @@
+import statistics
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from song.features import FEATURE_SIZE, FEATURE_DTYPE
+from song.index import SongIndex
+
+
+class Command(BaseCommand):
+    """django command to time similar song lookups on an index of random
+    feature vectors
+
+    nothing is written to the db
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--songs', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        songs, users = options['songs'], options['users']
+        rng = np.random.default_rng(0)
+        index = SongIndex(refresh_interval=None)
+
+        start = time.perf_counter()
+        user_ids = rng.integers(1, users + 1, songs)
+        index.add_many(
+            np.arange(1, songs + 1),
+            user_ids,
+            rng.random((songs, FEATURE_SIZE), dtype=FEATURE_DTYPE) * 100
+        )
+        ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'indexed {songs} songs in {ms:.1f} ms')
+
+        timings = []
+        for song_id in rng.integers(1, songs + 1, options['repeat']):
+            user_id = int(user_ids[song_id - 1])
+            start = time.perf_counter()
+            index.similar(int(song_id), user_id, options['limit'])
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'similar: median {statistics.median(timings):.2f} ms, '
+            f'max {max(timings):.2f} ms over {options["repeat"]} lookups'
+        )
@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import (
+    Ingredient, Recipe, CatalogIngredient, normalize_ingredient_name
+)
+from recipe import cache, stats
+from recipe.signals import suppressed, touch
+
+
+def link_batch(rows, batch_size):
+    """point (id, user id, name) ingredient rows at the catalog and merge the
+    ones a user already has
+
+    returns (linked, merged)
+    """
+    catalog_ids = CatalogIngredient.objects.resolve(
+        [name for _, _, name in rows]
+    )
+    rows = [
+        (pk, user_id, catalog_ids[normalize_ingredient_name(name)])
+        for pk, user_id, name in rows
+    ]
+    # the ingredient a user keeps for each catalog entry; one they already have
+    # that is linked, else their oldest
+    keepers = {}
+    for pk, user_id, catalog_id in Ingredient.objects.filter(
+        user_id__in={user_id for _, user_id, _ in rows},
+        catalog_id__in=set(catalog_ids.values())
+    ).values_list('id', 'user_id', 'catalog_id'):
+        keepers[(user_id, catalog_id)] = pk
+    merge = {}
+    link = []
+    for pk, user_id, catalog_id in rows:
+        keeper = keepers.setdefault((user_id, catalog_id), pk)
+        if keeper == pk:
+            link.append(Ingredient(pk=pk, catalog_id=catalog_id))
+        else:
+            merge[pk] = keeper
+
+    if merge:
+        # move the duplicates' recipes over to the ingredient that is kept
+        Link = Recipe.ingredients.through
+        links = Link.objects.filter(
+            ingredient_id__in=list(merge)
+        ).values_list('recipe_id', 'ingredient_id')
+        moved = {
+            (recipe_id, merge[ingredient_id])
+            for recipe_id, ingredient_id in links
+        }
+        recipe_ids = {recipe_id for recipe_id, _ in moved}
+        existing = set(Link.objects.filter(
+            recipe_id__in=recipe_ids, ingredient_id__in=set(merge.values())
+        ).values_list('recipe_id', 'ingredient_id'))
+        Link.objects.bulk_create(
+            [Link(recipe_id=r, ingredient_id=i) for r, i in moved - existing],
+            batch_size=batch_size
+        )
+        duplicates = Ingredient.objects.filter(pk__in=list(merge))
+        users = set(duplicates.values_list('user_id', flat=True))
+        duplicates.delete()
+        # what the signals would have done for each deleted ingredient, once
+        # for the batch
+        touch(Recipe.objects.filter(pk__in=recipe_ids))
+        touch(Ingredient.objects.filter(pk__in=set(merge.values())))
+        # the kept ingredients took over the duplicates' recipes
+        stats.refresh(Ingredient, set(merge.values()))
+        for user_id in users:
+            cache.invalidate(user_id, cache.INGREDIENTS, cache.RECIPES)
+    Ingredient.objects.bulk_update(link, ['catalog'], batch_size=batch_size)
+    return len(link), len(merge)
+
+
+class Command(BaseCommand):
+    """django command to link the ingredients from before the catalog to it,
+    merging each user's duplicates
+
+    works through them in batches, each in its own transaction, so it can be
+    stopped and run again at any point
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        linked = merged = 0
+        while True:
+            rows = list(Ingredient.objects.filter(
+                catalog__isnull=True
+            ).order_by('id').values_list('id', 'user_id', 'name')[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic(), suppressed():
+                batch_linked, batch_merged = link_batch(rows, batch_size)
+            linked += batch_linked
+            merged += batch_merged
+            self.stdout.write(
+                f'linked {linked}, merged {merged} duplicates...'
+            )
+        entries = CatalogIngredient.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Linked {linked} ingredients to {entries} catalog entries, '
+            f'merged {merged} duplicates'
+        ))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import ChunkedUpload, ChunkedUploadPart
+
+
+class Command(BaseCommand):
+    """django command to delete chunked uploads that were never finished"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        uploads = ChunkedUpload.objects.filter(created_at__lt=cutoff)
+        parts = ChunkedUploadPart.objects.filter(upload__in=uploads)
+        for name in parts.values_list('file', flat=True).iterator():
+            default_storage.delete(name)
+        count, _ = uploads.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} uploads'))
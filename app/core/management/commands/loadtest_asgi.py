@@ -0,0 +1,218 @@
+import asyncio
+import io
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.contrib.auth import get_user_model
+from django.core import signals
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from core.asgi import PooledASGIHandler
+from core.management.commands.seed_recipes import seed_recipes
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """django command to compare how many concurrent reads a process serves
+    as a threaded wsgi server, with django's ASGIHandler and with
+    core.asgi.PooledASGIHandler
+
+    requests are sent straight to the handlers (no server or sockets) with
+    every query slowed down by --db-latency and every client taking
+    --client-latency to read its response. the data is seeded (and committed,
+    the handlers use their own connections) and deleted at the end so point it
+    at a scratch database
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument(
+            '--db-latency', type=float, default=20,
+            help='ms added to every query'
+        )
+        parser.add_argument(
+            '--client-latency', type=float, default=50,
+            help='ms a client takes to read a response'
+        )
+        parser.add_argument('--wsgi-threads', type=int, default=8)
+        parser.add_argument('--host', default='localhost')
+
+    def _slow_query(self, execute, sql, params, many, context):
+        time.sleep(self.db_latency)
+        return execute(sql, params, many, context)
+
+    def _add_db_latency(self, **kwargs):
+        # connections are per thread so this runs at the start of every
+        # request on the thread that handles it
+        if self._slow_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self._slow_query)
+
+    def _paths(self, recipe_ids, count):
+        rng = random.Random(0)
+        paths = []
+        for _ in range(count):
+            if rng.random() < 0.5:
+                page_size = rng.randint(10, 50)
+                paths.append((
+                    '/api/recipe/recipes/',
+                    f'fields=id,title,price&page_size={page_size}'
+                ))
+            else:
+                recipe_id = rng.choice(recipe_ids)
+                paths.append((f'/api/recipe/recipes/{recipe_id}/', ''))
+        return paths
+
+    async def _asgi_request(self, app, path, query):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [
+                (b'host', self.host.encode()),
+                (b'authorization', f'Token {self.token}'.encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': (self.host, 80),
+        }
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                # the client reading the response; only holds up the event
+                # loop's task, not a thread
+                await asyncio.sleep(self.client_latency)
+
+        await app(scope, receive, send)
+        return status[0]
+
+    def _wsgi_request(self, app, path, query):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'HTTP_AUTHORIZATION': f'Token {self.token}',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.version': (1, 0),
+        }
+        status = []
+
+        def start_response(s, headers, exc_info=None):
+            status.append(int(s.split()[0]))
+
+        body = app(environ, start_response)
+        try:
+            for _ in body:
+                pass
+            # a threaded server's worker is stuck writing to the client until
+            # it has read everything
+            time.sleep(self.client_latency)
+        finally:
+            body.close()
+        return status[0]
+
+    async def _run(self, name, request, paths, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        timings, errors = [], 0
+
+        async def one(path, query):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                if await request(path, query) != 200:
+                    errors += 1
+                timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(path, query) for path, query in paths))
+        elapsed = time.perf_counter() - start
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{name:<8} {len(paths) / elapsed:>8.1f} req/s  '
+            f'p50 {p50:>8.1f} ms  p95 {p95:>8.1f} ms  errors {errors}'
+        )
+
+    def handle(self, *args, **options):
+        self.db_latency = options['db_latency'] / 1000
+        self.client_latency = options['client_latency'] / 1000
+        self.host = options['host']
+        user = get_user_model().objects.create_user(
+            'loadtest@test.com', 'password'
+        )
+        try:
+            self.token = Token.objects.create(user=user).key
+            self.stdout.write(f'seeding {options["recipes"]} recipes...')
+            seed_recipes(user, options['recipes'])
+            recipe_ids = list(
+                Recipe.objects.filter(user=user).values_list('id', flat=True)
+            )
+            paths = self._paths(recipe_ids, options['requests'])
+            signals.request_started.connect(self._add_db_latency)
+            try:
+                self._run_all(paths, options)
+            finally:
+                signals.request_started.disconnect(self._add_db_latency)
+                self.db_latency = 0
+        finally:
+            user.delete()
+
+    def _run_all(self, paths, options):
+        concurrency = options['concurrency']
+        wsgi = WSGIHandler()
+        wsgi_threads = ThreadPoolExecutor(options['wsgi_threads'])
+        pooled = PooledASGIHandler()
+
+        async def wsgi_request(path, query):
+            return await asyncio.get_event_loop().run_in_executor(
+                wsgi_threads, self._wsgi_request, wsgi, path, query
+            )
+
+        async def run():
+            await self._run('wsgi', wsgi_request, paths, concurrency)
+            await self._run(
+                'asgi',
+                partial(self._asgi_request, ASGIHandler()),
+                paths,
+                concurrency
+            )
+            await self._run(
+                'pooled',
+                partial(self._asgi_request, pooled),
+                paths,
+                concurrency
+            )
+
+        try:
+            asyncio.run(run())
+        finally:
+            wsgi_threads.shutdown()
+            pooled.read_executor.shutdown()
+            pooled.write_executor.shutdown()
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Tag, Ingredient
+from recipe import cache
+from recipe.stats import refresh
+
+
+class Command(BaseCommand):
+    """django command to recompute the recipe counts and totals of every tag
+    and ingredient from the recipes
+
+    for filling them in the first time or fixing them if they ever drift; each
+    batch is its own transaction
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Tag, Ingredient):
+            done = 0
+            last_pk = 0
+            while True:
+                pks = list(model.objects.filter(
+                    pk__gt=last_pk
+                ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                with transaction.atomic():
+                    refresh(model, pks)
+                last_pk = pks[-1]
+                done += len(pks)
+            self.stdout.write(
+                f'repaired {done} {model._meta.verbose_name_plural}'
+            )
+        # the responses cached before the repair have the old numbers; bump
+        # every user's tags/ingredients
+        user_ids = set()
+        for model in (Tag, Ingredient):
+            user_ids.update(
+                model.objects.values_list('user_id', flat=True).distinct()
+            )
+        for user_id in user_ids:
+            cache.invalidate(user_id, cache.TAGS, cache.INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS('Recipe stats repaired'))
@@ -0,0 +1,130 @@
+import random
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from core.models import (
+    Tag, Ingredient, Recipe, CatalogIngredient, normalize_ingredient_name
+)
+from recipe import stats
+
+BATCH_SIZE = 500
+
+
+def seed_recipes(
+    user, recipes, tags=200, ingredients=500, per_recipe=5, seed=0
+):
+    """bulk create recipes with random tags and ingredients for a user
+
+    the tags and ingredients are only created if the user doesnt have them yet
+    so it can be run again for the same user; each run adds `recipes` more
+    """
+    rng = random.Random(seed)
+    tag_names = [f'Tag {i}' for i in range(tags)]
+    existing_tags = _tag_ids(user, tag_names)
+    Tag.objects.bulk_create(
+        [
+            Tag(user=user, name=name)
+            for name in tag_names if name not in existing_tags
+        ],
+        batch_size=BATCH_SIZE
+    )
+    # bulk_create only sets pks on postgres so read them back to be safe on
+    # sqlite
+    tag_ids = list(_tag_ids(user, tag_names).values())
+
+    names = [f'Ingredient {i}' for i in range(ingredients)]
+    catalog_ids = CatalogIngredient.objects.resolve(names)
+    existing = set(
+        Ingredient.objects.filter(
+            user=user, catalog_id__in=catalog_ids.values()
+        ).values_list('catalog_id', flat=True)
+    )
+    new_ingredients = []
+    for name in names:
+        catalog_id = catalog_ids[normalize_ingredient_name(name)]
+        if catalog_id not in existing:
+            new_ingredients.append(
+                Ingredient(user=user, name=name, catalog_id=catalog_id)
+            )
+    Ingredient.objects.bulk_create(new_ingredients, batch_size=BATCH_SIZE)
+    ingredient_ids = list(
+        Ingredient.objects.filter(
+            user=user, catalog_id__in=catalog_ids.values()
+        ).values_list('id', flat=True)
+    )
+
+    # only the recipes made by this run get links; earlier ones keep theirs
+    last_id = Recipe.objects.filter(user=user).aggregate(
+        last=Max('id')
+    )['last'] or 0
+    Recipe.objects.bulk_create(
+        [
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=rng.randint(5, 240),
+                price=rng.randint(100, 99999) / 100
+            )
+            for i in range(recipes)
+        ],
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = Recipe.objects.filter(
+        user=user, id__gt=last_id
+    ).values_list('id', flat=True)
+    TagLink = Recipe.tags.through
+    IngredientLink = Recipe.ingredients.through
+    tag_links = []
+    ingredient_links = []
+    for recipe_id in recipe_ids.iterator():
+        for tag_id in rng.sample(tag_ids, min(per_recipe, len(tag_ids))):
+            tag_links.append(TagLink(recipe_id=recipe_id, tag_id=tag_id))
+        for ingredient_id in rng.sample(
+            ingredient_ids, min(per_recipe, len(ingredient_ids))
+        ):
+            ingredient_links.append(IngredientLink(
+                recipe_id=recipe_id, ingredient_id=ingredient_id
+            ))
+    TagLink.objects.bulk_create(tag_links, batch_size=BATCH_SIZE)
+    IngredientLink.objects.bulk_create(ingredient_links, batch_size=BATCH_SIZE)
+    # bulk_create skips the m2m signals that keep the recipe counts/totals
+    stats.refresh(Tag, tag_ids)
+    stats.refresh(Ingredient, ingredient_ids)
+
+
+def _tag_ids(user, names):
+    """return name => id of the user's tags with those names"""
+    return dict(
+        Tag.objects.filter(user=user, name__in=names).values_list('name', 'id')
+    )
+
+
+class Command(BaseCommand):
+    """django command to fill the database with fake recipes for a user"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='seed@test.com')
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user, created = get_user_model().objects.get_or_create(
+            email=options['email']
+        )
+        if created:
+            user.set_password('password')
+            user.save()
+        with transaction.atomic():
+            seed_recipes(
+                user,
+                options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                per_recipe=options['per_recipe']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {options["recipes"]} recipes for {user.email}'
+        ))
@@ -1,19 +1,59 @@
+import random
 import time
-from django.db import connections
-from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.core.management.base import BaseCommand, CommandError
+from core.health import readiness_error
 
 class Command(BaseCommand):
-    """django command to pause execution until databse is available"""
+    """django command to pause execution until the database accepts queries
+
+    actually connects and runs SELECT 1 (optionally also checks every
+    migration is applied), retrying with exponential backoff and jitter until
+    --timeout seconds have passed
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='seconds to wait in total'
+        )
+        parser.add_argument(
+            '--migrations', action='store_true',
+            help='also wait for the migrations to be applied'
+        )
+        parser.add_argument(
+            '--backoff', type=float, default=0.1,
+            help='seconds to wait after the first failure'
+        )
+        parser.add_argument('--max-backoff', type=float, default=5)
 
     def handle(self, *args, **options):
         self.stdout.write('waiting for database...')
-        db_conn = None
-        # try to connect to the databse; if it fails then dj will throw an operationalerror and write and wait for 1 second
-        while not db_conn:
-            try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting for 1 second...')
-                time.sleep(1)
-        self.stdout.write(self.style.SUCCESS('DATABASE AVAILABLE!!!!!!!'))
\ No newline at end of file
+        deadline = time.monotonic() + options['timeout']
+        attempt = 0
+        while True:
+            error = readiness_error(
+                options['database'], check_migrations=options['migrations']
+            )
+            if error is None:
+                break
+            # dont reuse a connection left over from a failed try
+            connections[options['database']].close()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandError(
+                    f'Database unavailable after {options["timeout"]}s: '
+                    f'{error}'
+                )
+            # full jitter so containers started together dont all retry in step
+            backoff = min(
+                options['max_backoff'], options['backoff'] * 2 ** attempt
+            )
+            delay = min(remaining, random.uniform(0, backoff))
+            self.stdout.write(
+                f'Database unavailable ({error}), waiting {delay:.2f}s...'
+            )
+            time.sleep(delay)
+            attempt += 1
+        self.stdout.write(self.style.SUCCESS('DATABASE AVAILABLE!!!!!!!'))
@@ -0,0 +1,17 @@
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_song_status_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='peaks',
+            field=models.FileField(blank=True, editable=False, upload_to=core.models.song_peaks_path),
+        ),
+    ]
@@ -0,0 +1,132 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Recipe.search_vector is kept up to date by the database so it is right no matter how a recipe, its links or a
+# tag/ingredient name get written (save, bulk_create, queryset.update, raw sql):
+#   - any insert/update of a recipe recomputes its vector (title A, tag names B, ingredient names C)
+#   - adding/removing tags or ingredients and renaming a tag/ingredient rewrite the affected recipes
+#     (SET title = title) which goes through the recipe trigger
+# only postgres has tsvectors; on anything else (sqlite in the tests) the column stays null and
+# recipe/search.py falls back to substring matching
+CREATE_SQL = """
+CREATE FUNCTION core_recipe_search_vector(recipe_id integer, title text) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce($2, '')), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' ') FROM core_recipe_tags rt
+            JOIN core_tag t ON t.id = rt.tag_id WHERE rt.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' ') FROM core_recipe_ingredients ri
+            JOIN core_ingredient i ON i.id = ri.ingredient_id WHERE ri.recipe_id = $1
+        ), '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION core_recipe_search_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_search_vector(NEW.id, NEW.title);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_update BEFORE INSERT OR UPDATE ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_update();
+
+-- statement level with transition tables so adding 20 tags to a recipe rewrites it once, not 20 times
+CREATE FUNCTION core_recipe_links_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET title = title WHERE id IN (SELECT recipe_id FROM changed_links);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_added AFTER INSERT ON core_recipe_tags
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_tags_removed AFTER DELETE ON core_recipe_tags
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_added AFTER INSERT ON core_recipe_ingredients
+    REFERENCING NEW TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_removed AFTER DELETE ON core_recipe_ingredients
+    REFERENCING OLD TABLE AS changed_links
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+
+CREATE FUNCTION core_tag_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET title = title
+        WHERE id IN (SELECT recipe_id FROM core_recipe_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_ingredient_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET title = title
+        WHERE id IN (SELECT recipe_id FROM core_recipe_ingredients WHERE ingredient_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_renamed AFTER UPDATE OF name ON core_tag
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE PROCEDURE core_tag_renamed();
+CREATE TRIGGER core_ingredient_renamed AFTER UPDATE OF name ON core_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name) EXECUTE PROCEDURE core_ingredient_renamed();
+
+-- fill in the recipes that already exist
+UPDATE core_recipe SET title = title;
+
+CREATE INDEX core_recipe_search_idx ON core_recipe USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS core_recipe_search_idx;
+DROP TRIGGER IF EXISTS core_tag_renamed ON core_tag;
+DROP TRIGGER IF EXISTS core_ingredient_renamed ON core_ingredient;
+DROP TRIGGER IF EXISTS core_recipe_tags_added ON core_recipe_tags;
+DROP TRIGGER IF EXISTS core_recipe_tags_removed ON core_recipe_tags;
+DROP TRIGGER IF EXISTS core_recipe_ingredients_added ON core_recipe_ingredients;
+DROP TRIGGER IF EXISTS core_recipe_ingredients_removed ON core_recipe_ingredients;
+DROP TRIGGER IF EXISTS core_recipe_search_update ON core_recipe;
+DROP FUNCTION IF EXISTS core_tag_renamed();
+DROP FUNCTION IF EXISTS core_ingredient_renamed();
+DROP FUNCTION IF EXISTS core_recipe_links_changed();
+DROP FUNCTION IF EXISTS core_recipe_search_update();
+DROP FUNCTION IF EXISTS core_recipe_search_vector(integer, text);
+"""
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_song_peaks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # the gin index is made by create_triggers (after the backfill) since only postgres has it
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,49 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+# trigram gin indexes for the tag/ingredient autocomplete; btree_gin lets user_id go in the same index so a
+# lookup only ever reads the user's own names. postgres only, sqlite falls back to LIKE (see recipe/autocomplete.py)
+CREATE_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+CREATE INDEX core_tag_name_trgm_idx ON core_tag USING gin (user_id, name gin_trgm_ops);
+CREATE INDEX core_ingredient_name_trgm_idx ON core_ingredient USING gin (user_id, name gin_trgm_ops);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS core_tag_name_trgm_idx;
+DROP INDEX IF EXISTS core_ingredient_name_trgm_idx;
+"""
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='core_tag_name_trgm_idx', opclasses=['int4_ops', 'gin_trgm_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['user', 'name'], name='core_ingredient_name_trgm_idx', opclasses=['int4_ops', 'gin_trgm_ops']),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0015_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        # existing ingredients are linked (and deduplicated) by the build_ingredient_catalog command, in batches
+        migrations.AddField(
+            model_name='ingredient',
+            name='catalog',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='aliases', to='core.CatalogIngredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'catalog'), name='core_ingredient_user_catalog_uniq'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_catalogingredient'),
+    ]
+
+    # the counters start at 0; run repair_recipe_stats once to fill them in for existing recipes
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='total_time_minutes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='total_time_minutes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# the recipe trigger from 0014 recomputed the search vector (and its tag/ingredient subqueries) on every update,
+# including the updated_at touches from recipe/signals.py. only a write of title has to: save() and bulk_update
+# set it, and the link/rename triggers rewrite recipes with SET title = title so they still go through it
+CREATE_SQL = """
+DROP TRIGGER IF EXISTS core_recipe_search_update ON core_recipe;
+CREATE TRIGGER core_recipe_search_update BEFORE INSERT OR UPDATE OF title ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_update();
+"""
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS core_recipe_search_update ON core_recipe;
+CREATE TRIGGER core_recipe_search_update BEFORE INSERT OR UPDATE ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_update();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
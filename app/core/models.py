@@ -1,7 +1,10 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 # retrieve settings from django settings file
 from django.conf import settings
+import unicodedata
 import uuid
 import os
 
@@ -13,6 +16,12 @@ def song_file_path(instance, filename, generate_uuid=False):
         filename = f'{uuid.uuid4()}.{ext}'
     return os.path.join('uploads/songs/', filename)
 
+def song_peaks_path(instance, filename):
+    """generate file path for the waveform peaks sidecar of a song (see
+    song/peaks.py)
+    """
+    return os.path.join('uploads/songs/peaks/', f'{uuid.uuid4()}.peaks')
+
 def recipe_image_file_path(instance, filename):
     """generate file path for new recipe image"""
     # return extension of file
@@ -56,28 +65,184 @@ class User(AbstractBaseUser, PermissionsMixin):
     # sets username field 2 b email
     USERNAME_FIELD = 'email'
 
-class Tag(models.Model):
+class RecipeStats(models.Model):
+    """how many recipes a tag/ingredient is on and the totals of their times
+    and prices
+
+    kept up to date as recipes change (see recipe/stats.py);
+    repair_recipe_stats recomputes them from scratch
+    """
+    recipe_count = models.IntegerField(default=0)
+    # totals rather than averages so adding/removing one recipe is exact
+    total_time_minutes = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def avg_time_minutes(self):
+        if not self.recipe_count:
+            return None
+        return self.total_time_minutes / self.recipe_count
+
+    @property
+    def avg_price(self):
+        if not self.recipe_count:
+            return None
+        return self.total_price / self.recipe_count
+
+class Tag(RecipeStats):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # also bumped when it is added to/removed from a recipe (see
+    # recipe/signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        # the api always looks these up by user and sorts them by name
+        indexes = [
+            models.Index(
+                fields=['user', 'name'], name='core_tag_user_name_idx'
+            ),
+            # autocomplete (see recipe/autocomplete.py); postgres only, made
+            # in core/migrations/0015_name_trigram_index.py
+            GinIndex(
+                fields=['user', 'name'],
+                opclasses=['int4_ops', 'gin_trgm_ops'],
+                name='core_tag_name_trgm_idx'
+            ),
+        ]
     
     def __str__(self):
         return self.name
 
-class Ingredient(models.Model):
-    """Ingredient to be used for a recipe"""
+def normalize_ingredient_name(name):
+    """return what decides whether two ingredient names are the same
+    ingredient ('  Sea   SALT ' => 'sea salt')
+    """
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return ' '.join(name.split())[:255]
+
+class CatalogIngredientManager(models.Manager):
+
+    def resolve(self, names):
+        """return {normalized name: catalog id} for ingredient names, adding
+        the ones that arent in the catalog yet
+
+        a handful of queries however many names there are
+        """
+        # first spelling seen of each normalized name becomes the catalog's
+        # display name
+        spellings = {}
+        for name in names:
+            spellings.setdefault(
+                normalize_ingredient_name(name), ' '.join(name.split())
+            )
+        normalized = list(spellings)
+        ids = {}
+        for i in range(0, len(normalized), settings.API_BULK_BATCH_SIZE):
+            batch = normalized[i:i + settings.API_BULK_BATCH_SIZE]
+            ids.update(self.filter(normalized__in=batch).values_list(
+                'normalized', 'id'
+            ))
+            missing = [n for n in batch if n not in ids]
+            if missing:
+                # ignore_conflicts so two requests adding the same new name at
+                # once both succeed
+                self.bulk_create(
+                    [
+                        self.model(normalized=n, name=spellings[n])
+                        for n in missing
+                    ],
+                    ignore_conflicts=True
+                )
+                ids.update(self.filter(normalized__in=missing).values_list(
+                    'normalized', 'id'
+                ))
+        return ids
+
+class CatalogIngredient(models.Model):
+    """one row per distinct ingredient across every user; each user's
+    Ingredient is an alias of one of these
+    """
+    name = models.CharField(max_length=255)
+    normalized = models.CharField(max_length=255, unique=True)
+
+    objects = CatalogIngredientManager()
+
+    def __str__(self):
+        return self.name
+
+class Ingredient(RecipeStats):
+    """Ingredient to be used for a recipe; the user's own name for an entry
+    in the catalog
+    """
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # null only for ingredients from before the catalog until
+    # build_ingredient_catalog has been run
+    catalog = models.ForeignKey(
+        CatalogIngredient,
+        on_delete=models.PROTECT,
+        null=True,
+        related_name='aliases'
+    )
+    # also bumped when it is added to/removed from a recipe (see
+    # recipe/signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        # a user has each ingredient once however they spell it
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'catalog'],
+                name='core_ingredient_user_catalog_uniq'
+            )
+        ]
+        # the api always looks these up by user and sorts them by name
+        indexes = [
+            models.Index(
+                fields=['user', 'name'], name='core_ingredient_user_name_idx'
+            ),
+            # autocomplete (see recipe/autocomplete.py); postgres only, made
+            # in core/migrations/0015_name_trigram_index.py
+            GinIndex(
+                fields=['user', 'name'],
+                opclasses=['int4_ops', 'gin_trgm_ops'],
+                name='core_ingredient_name_trgm_idx'
+            ),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # the name may have changed so look the catalog entry up again; bulk
+        # writes do this in one go instead (see recipe/serializers.py)
+        self.catalog_id = CatalogIngredient.objects.resolve([self.name])[
+            normalize_ingredient_name(self.name)
+        ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.name
 
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = (
+    (IMAGE_PENDING, 'Pending'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+)
+
 class Recipe(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -90,6 +255,136 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # smaller copies of image made in the background after an upload (see
+    # recipe/images.py)
+    image_thumbnail = models.ImageField(
+        null=True, blank=True, upload_to=recipe_image_file_path
+    )
+    image_webp = models.FileField(
+        null=True, blank=True, upload_to=recipe_image_file_path
+    )
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_status = models.CharField(
+        max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True
+    )
+    # also bumped when its tags/ingredients change (see recipe/signals.py) so
+    # it can be used for etags
+    updated_at = models.DateTimeField(auto_now=True)
+    # title, tag names and ingredient names for ?search=; filled in by
+    # postgres triggers (see core/migrations/0014_recipe_search_vector.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'updated_at'],
+                name='core_recipe_user_updated_idx'
+            ),
+            GinIndex(fields=['search_vector'], name='core_recipe_search_idx'),
+        ]
+    
+    def __str__(self):
+        return self.title
+
+ANALYSIS_PENDING = 'pending'
+ANALYSIS_READY = 'ready'
+ANALYSIS_FAILED = 'failed'
+ANALYSIS_STATUS_CHOICES = (
+    (ANALYSIS_PENDING, 'Pending'),
+    (ANALYSIS_READY, 'Ready'),
+    (ANALYSIS_FAILED, 'Failed'),
+)
+
+class Song(models.Model):
+    """Song uploaded by a user; the audio features are filled in in the
+    background (see song/analysis.py)
+    """
+    # null only for songs that were added before songs belonged to users
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True
+    )
+    title = models.CharField(max_length=255)
+    file = models.FileField(null=True, upload_to=song_file_path)
+    duration = models.FloatField(null=True, blank=True)
+    tempo = models.FloatField(null=True, blank=True)
+    # i.e. 'A minor'
+    key = models.CharField(max_length=20, blank=True)
+    # float32 feature vector packed into bytes (see song/features.py)
+    features = models.BinaryField(null=True, editable=False)
+    # precomputed waveform peaks and spectrogram for the client's scrubber
+    # (see song/peaks.py)
+    peaks = models.FileField(
+        blank=True, editable=False, upload_to=song_peaks_path
+    )
+    analysis_status = models.CharField(
+        max_length=10, choices=ANALYSIS_STATUS_CHOICES, blank=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # the similarity index loads the songs analyzed since it last
+            # looked (see song/index.py)
+            models.Index(
+                fields=['analysis_status', 'updated_at'],
+                name='core_song_status_updated_idx'
+            )
+        ]
+    
+    def __str__(self):
+        return self.title
+
+def chunk_file_path(upload_id, offset):
+    """generate file path for one chunk of a chunked upload"""
+    return os.path.join('uploads/chunks/', str(upload_id), f'{offset:015d}')
+
+UPLOAD_ACTIVE = 'active'
+UPLOAD_COMPLETE = 'complete'
+UPLOAD_STATUS_CHOICES = (
+    (UPLOAD_ACTIVE, 'Active'),
+    (UPLOAD_COMPLETE, 'Complete'),
+)
+
+class ChunkedUpload(models.Model):
+    """a file being uploaded a chunk at a time (see the upload app)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    # what the file is for (i.e. recipe_image) and the id of the object it
+    # gets attached to
+    target = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    # total size the client says it will send; optional
+    size = models.BigIntegerField(null=True, blank=True)
+    # bytes received so far; the next chunk has to start here
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10, choices=UPLOAD_STATUS_CHOICES, default=UPLOAD_ACTIVE
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.filename
+
+class ChunkedUploadPart(models.Model):
+    """one chunk of a ChunkedUpload stored as its own file until the upload
+    is finalized
+    """
+    upload = models.ForeignKey(
+        ChunkedUpload,
+        on_delete=models.CASCADE,
+        related_name='parts'
+    )
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    file = models.CharField(max_length=255)
+    
+    class Meta:
+        # two requests sending the same chunk cant both win
+        unique_together = ('upload', 'offset')
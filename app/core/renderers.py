@@ -0,0 +1,84 @@
+import decimal
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+# orjson is a lot faster than the stdlib json module on big lists; without it
+# everything goes through json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """drf's encoder except decimals are written as strings
+
+    drf turns a Decimal into a float which can drift (i.e. 0.1 + 0.2);
+    serializers already give strings for DecimalFields so this only matters
+    for decimals put in response data by hand
+    """
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """orjson's hook for types it doesnt know (Decimal, lazy strings,
+    querysets...), same output as JSONEncoder
+    """
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """render with orjson when it is installed, otherwise the stdlib (through
+    drf's JSONRenderer)
+    """
+    encoder_class = JSONEncoder
+
+    def _use_orjson(self, accepted_media_type, renderer_context):
+        # orjson always writes utf-8 without spaces; anything else (i.e. the
+        # browsable api indenting) uses json
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return (
+            orjson is not None
+            and self.ensure_ascii is False
+            and self.compact
+            and indent is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or not self._use_orjson(accepted_media_type, renderer_context)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data, default=_default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+class FastJSONParser(JSONParser):
+    """parse with orjson when it is installed, otherwise the stdlib (through
+    drf's JSONParser)
+
+    floats are parsed the same by both (shortest repr) so a DecimalField gets
+    exactly the number that was sent
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
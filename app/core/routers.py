@@ -0,0 +1,213 @@
+"""send the reads of GET/HEAD/OPTIONS requests to read replicas
+(settings.DATABASE_REPLICAS)
+
+everything else (writes, reads while handling a POST, background tasks,
+management commands) uses default. a user who just wrote something reads from
+default for REPLICA_STICKY_SECONDS after so they always see their own change,
+and a replica that is down or more than REPLICA_MAX_LAG seconds behind is
+skipped until it catches up
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# how long which user a token/session belongs to is remembered
+REPLICA_USER_TIMEOUT = 24 * 60 * 60
+
+# seconds the replica is behind the primary; 0 when it has replayed everything
+# it received (an idle primary writes nothing so the last replay time would
+# grow forever) or when it isnt a replica at all
+POSTGRES_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery()
+        OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    )
+END
+"""
+
+# the replica the current request reads from (None => default)
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def replica_lag(alias):
+    """return how many seconds a replica is behind (raises DatabaseError when
+    it cant be reached)
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+        cursor.execute('SELECT 1')
+        return 0.0
+
+
+class ReplicaHealth:
+    """per process view of which replicas are up and caught up, rechecked
+    every REPLICA_CHECK_INTERVAL seconds
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # alias => (time checked, healthy)
+        self._status = {}
+        # aliases a thread is checking right now
+        self._checking = set()
+
+    def healthy(self, alias):
+        with self._lock:
+            checked_at, healthy = self._status.get(alias, (None, False))
+            if checked_at is not None and (
+                time.monotonic() - checked_at < settings.REPLICA_CHECK_INTERVAL
+            ):
+                return healthy
+            # one thread checks, the others go on with what was known (nothing
+            # yet => not healthy => default)
+            if alias in self._checking:
+                return healthy
+            self._checking.add(alias)
+        # the lock isnt held while connecting so a replica that is down only
+        # holds up the thread checking it (for at most its connect_timeout),
+        # not every request or the checks of the other replicas
+        try:
+            healthy = self.check(alias)
+        finally:
+            with self._lock:
+                self._checking.discard(alias)
+                self._status[alias] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError as exc:
+            logger.warning('replica %s is unavailable: %s', alias, exc)
+            return False
+        if lag > settings.REPLICA_MAX_LAG:
+            logger.warning('replica %s is %.1fs behind', alias, lag)
+            return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._status.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+def choose_replica():
+    """return a healthy replica alias or None"""
+    healthy = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if replica_health.healthy(alias)
+    ]
+    return random.choice(healthy) if healthy else None
+
+
+def _credentials_key(request):
+    """cache key of the token/session a request was sent with or None for
+    anonymous clients
+    """
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return 'replica-user:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def _sticky_key(user_id):
+    return f'replica-sticky:{user_id}'
+
+
+class ReplicaMiddleware:
+    """pick the database the reads of a request go to; keeps a user on
+    default for a while after they write
+
+    the api caches responses per user so stickiness is per user too, not per
+    token/session: a user's other clients reading a replica that hasnt caught
+    up would cache the old rows under the version the write bumped. auth runs
+    in the view, after the database is picked, so which user a token/session
+    belongs to is remembered from the requests it was sent with before; until
+    that is known its requests read from default
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _use_replica(self, cache, credentials_key):
+        if credentials_key is None:
+            return True
+        user_id = cache.get(credentials_key)
+        return user_id is not None and not cache.get(_sticky_key(user_id))
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        cache = caches[settings.API_CACHE_ALIAS]
+        credentials_key = _credentials_key(request)
+        alias = None
+        if (
+            request.method in SAFE_METHODS
+            and self._use_replica(cache, credentials_key)
+        ):
+            alias = choose_replica()
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if credentials_key is not None:
+            # drf sets request.user on the django request once it authenticates
+            user_id = getattr(getattr(request, 'user', None), 'pk', None)
+            if user_id is not None:
+                if (
+                    request.method not in SAFE_METHODS
+                    and response.status_code < 400
+                ):
+                    cache.set(
+                        _sticky_key(user_id),
+                        True,
+                        settings.REPLICA_STICKY_SECONDS
+                    )
+                if alias is None:
+                    # only while it isnt known (or after a write), not on
+                    # every replica read
+                    cache.set(credentials_key, user_id, REPLICA_USER_TIMEOUT)
+        return response
+
+
+class ReplicaRouter:
+    """database router for ReplicaMiddleware"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas are copies of default so objects read from any of them can
+        # be related
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,77 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread_pool = None
+_process_pool = None
+
+
+def get_thread_pool():
+    """return the process wide thread pool for background work (created on
+    first use)
+    """
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_THREAD_WORKERS,
+                thread_name_prefix='background'
+            )
+        return _thread_pool
+
+
+def get_process_pool():
+    """return the process wide process pool for cpu heavy work (created on
+    first use)
+    """
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # spawn instead of fork so the children dont inherit db
+            # connections or the thread pool's threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.BACKGROUND_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def run_in_process(fn, *args):
+    """run fn(*args) in the process pool and wait for its result
+
+    meant to be called from a background task so the cpu work doesnt hold the
+    GIL of a process serving requests. fn and its arguments/result have to be
+    picklable and fn shouldnt touch the db
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        return fn(*args)
+    return get_process_pool().submit(fn, *args).result()
+
+
+def _run(fn, *args):
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception('background task %s failed', fn.__name__)
+    finally:
+        # each worker thread gets its own db connections; dont leave them open
+        # between tasks
+        connections.close_all()
+
+
+def run_in_background(fn, *args):
+    """run fn(*args) in the thread pool once the current transaction commits
+
+    with BACKGROUND_TASKS_EAGER (i.e. in tests) fn runs straight away in the
+    calling thread
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        fn(*args)
+        return
+    transaction.on_commit(lambda: get_thread_pool().submit(_run, fn, *args))
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from django.core import signals
+from django.test import SimpleTestCase
+from core.asgi import PooledASGIHandler
+
+
+def request(app, method, path):
+    """send a request straight to an asgi app and return the response status"""
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver')],
+    }
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    async def run():
+        await app(scope, receive, send)
+        return status[0]
+    return run()
+
+
+class PooledASGIHandlerTests(SimpleTestCase):
+    """test the asgi handler runs views in its read/write pools"""
+
+    def setUp(self):
+        self.app = PooledASGIHandler(read_threads=2, write_threads=1)
+        self.threads = []
+        signals.request_started.connect(self._record_thread)
+
+    def tearDown(self):
+        signals.request_started.disconnect(self._record_thread)
+        self.app.read_executor.shutdown()
+        self.app.write_executor.shutdown()
+
+    def _record_thread(self, **kwargs):
+        self.threads.append(threading.current_thread().name)
+
+    def test_read_and_write_pools(self):
+        """test reads run in the read pool and writes in the write pool"""
+        status = asyncio.run(request(self.app, 'GET', '/api/recipe/recipes/'))
+        self.assertEqual(status, 401)
+        status = asyncio.run(request(self.app, 'POST', '/api/recipe/recipes/'))
+        self.assertEqual(status, 401)
+
+        self.assertTrue(self.threads[0].startswith('asgi-read'))
+        self.assertTrue(self.threads[1].startswith('asgi-write'))
+
+    def test_reads_concurrent(self):
+        """test two reads are handled at the same time, not one by one"""
+        # each request waits for the other one to start; if they ran one at a
+        # time the barrier would time out
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait(**kwargs):
+            barrier.wait()
+        signals.request_started.connect(wait)
+
+        async def run():
+            return await asyncio.gather(
+                request(self.app, 'GET', '/api/recipe/recipes/'),
+                request(self.app, 'GET', '/api/recipe/tags/')
+            )
+        try:
+            self.assertEqual(asyncio.run(run()), [401, 401])
+        finally:
+            signals.request_started.disconnect(wait)
+        self.assertFalse(barrier.broken)
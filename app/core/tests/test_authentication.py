@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.authentication import TokenCache, token_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """test the token auth cache"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password',
+            name='Test'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """test the token is only looked up in the db once"""
+        # the view itself loads the user once
+        with self.assertNumQueries(2):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_rejected(self):
+        """test a deleted token stops working straight away"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """test deactivating a user stops their cached token working"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_update_not_stale(self):
+        """test updating the user isnt hidden by the cached user"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'New name')
+
+    def test_password_change_not_reverted(self):
+        """test saving the user doesnt write back the cached copy"""
+        self.client.get(ME_URL)
+        # changed by another worker, so nothing here sees it
+        user = get_user_model().objects.get(pk=self.user.pk)
+        user.set_password('newpassword')
+        get_user_model().objects.filter(pk=user.pk).update(
+            password=user.password
+        )
+
+        res = self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('newpassword'))
+        self.assertFalse(self.user.check_password('password'))
+        self.assertEqual(self.user.name, 'New name')
+
+    def test_invalidated_in_other_process(self):
+        """test invalidating a token drops it from every process' cache"""
+        self.client.get(ME_URL)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        # another worker has its own local cache but shares the django one
+        other = TokenCache(max_size=10, ttl=60)
+
+        other.invalidate(self.token.key)
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_cache_bounded(self):
+        """test the oldest tokens are dropped once the cache is full"""
+        old_size = token_cache.max_size
+        token_cache.max_size = 1
+        try:
+            user2 = get_user_model().objects.create_user(
+                'test2@test.com',
+                'password'
+            )
+            token2 = Token.objects.create(user=user2)
+            self.client.get(ME_URL)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token2.key}')
+            self.client.get(ME_URL)
+
+            self.assertIsNone(token_cache.get(self.token.key))
+            self.assertIsNotNone(token_cache.get(token2.key))
+        finally:
+            token_cache.max_size = old_size
@@ -1,29 +1,192 @@
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
-from django.db.utils import OperationalError
+from django.core.management.base import CommandError
 from django.test import TestCase
+from core.management.commands.seed_recipes import seed_recipes
+from core.models import Ingredient, Recipe, Tag, CatalogIngredient
+
+READINESS_ERROR = 'core.management.commands.wait_for_db.readiness_error'
 
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
-        # need to simulate the connection to databse
-        # if receives operational error then db is not ready
-        # mocking the behavior 
-        # whenever this is called (i.e. the __getitem__ function); it will replace it with this funcion
-        # allows us to monitor how many times this shit is called
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
-    
-    # need to pass in ts to 
-    # replaces time.sleep function with a function that just returns true
-    # when connecting to db thre is a 1 second sleep so adding this overrides the function so we don't have to wait
+        """test the database is actually queried and it stops once it works"""
+        with patch(READINESS_ERROR) as check:
+            check.return_value = None
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(check.call_count, 1)
+
+    def test_wait_for_db_real_connection(self):
+        """test the check runs a query on the database"""
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command('wait_for_db', stdout=out)
+        self.assertIn('AVAILABLE', out.getvalue())
+
+    # sleeping is replaced so the retries dont take any time
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
-        """test waiting for db"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            # throw an operational error the first 5 times we try to connect to the db and then allow connection on the 6th try
-            gi.side_effect=[OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        """test waiting for db with a growing backoff"""
+        with patch(READINESS_ERROR) as check:
+            # unavailable the first 5 times and then available on the 6th try
+            check.side_effect = ['OperationalError: down'] * 5 + [None]
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(check.call_count, 6)
+        self.assertEqual(ts.call_count, 5)
+        # full jitter: each wait is somewhere below 0.1, 0.2, 0.4... seconds
+        for attempt, (args, _) in enumerate(ts.call_args_list):
+            self.assertLessEqual(args[0], 0.1 * 2 ** attempt)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """test it gives up after the timeout"""
+        with patch(READINESS_ERROR) as check, \
+                patch('time.monotonic', side_effect=[0, 1, 2, 3, 11]):
+            check.return_value = 'OperationalError: down'
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=10, stdout=StringIO())
+        self.assertEqual(check.call_count, 4)
+
+    def test_wait_for_db_migrations(self):
+        """test --migrations also waits for unapplied migrations"""
+        with patch('core.health.unapplied_migrations') as unapplied, \
+                patch('time.sleep', return_value=True):
+            unapplied.return_value = ['core.0001_initial']
+            with self.assertRaises(CommandError):
+                call_command(
+                    'wait_for_db',
+                    migrations=True,
+                    timeout=0,
+                    stdout=StringIO()
+                )
+        unapplied.assert_called()
+
+
+class BuildIngredientCatalogTests(TestCase):
+
+    def test_build_ingredient_catalog(self):
+        """test old ingredients get linked and each user's duplicates merged"""
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        # bulk_create skips Ingredient.save so these look like rows from before
+        # the catalog
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name='Salt'),
+            Ingredient(user=user, name='salt '),
+            Ingredient(user=user, name='Pepper'),
+            Ingredient(user=user2, name='SALT'),
+        ])
+        salt, salt_dupe = Ingredient.objects.filter(
+            user=user, name__icontains='salt'
+        ).order_by('id')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=1
+        )
+        recipe.ingredients.add(salt_dupe)
+        both = Recipe.objects.create(
+            user=user, title='Stew', time_minutes=5, price=1
+        )
+        both.ingredients.add(salt, salt_dupe)
+
+        call_command(
+            'build_ingredient_catalog', batch_size=2, stdout=StringIO()
+        )
+
+        self.assertFalse(
+            Ingredient.objects.filter(catalog__isnull=True).exists()
+        )
+        self.assertFalse(Ingredient.objects.filter(pk=salt_dupe.pk).exists())
+        self.assertEqual(list(recipe.ingredients.all()), [salt])
+        self.assertEqual(list(both.ingredients.all()), [salt])
+        self.assertEqual(Ingredient.objects.filter(user=user).count(), 2)
+        self.assertEqual(
+            Ingredient.objects.get(user=user2).catalog_id,
+            Ingredient.objects.get(pk=salt.pk).catalog_id
+        )
+        self.assertEqual(CatalogIngredient.objects.count(), 2)
+        salt.refresh_from_db()
+        self.assertEqual(
+            (salt.recipe_count, salt.total_time_minutes, salt.total_price),
+            (2, 10, 2)
+        )
+
+
+class SeedRecipesTests(TestCase):
+
+    def test_seed_recipes_stats(self):
+        """test seeded recipes are counted on their tags and ingredients"""
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+
+        seed_recipes(user, 10, tags=3, ingredients=3, per_recipe=2)
+
+        for model in (Tag, Ingredient):
+            for obj in model.objects.filter(user=user):
+                recipes = obj.recipe_set.all()
+                self.assertEqual(obj.recipe_count, recipes.count())
+                self.assertEqual(
+                    obj.total_time_minutes,
+                    sum(r.time_minutes for r in recipes)
+                )
+
+
+    def test_seed_recipes_again(self):
+        """test seeding the same user twice reuses their tags/ingredients"""
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        seed_recipes(user, 4, tags=3, ingredients=3, per_recipe=2)
+        links = {
+            recipe.pk: set(recipe.tags.all())
+            for recipe in Recipe.objects.filter(user=user)
+        }
+
+        seed_recipes(user, 4, tags=3, ingredients=3, per_recipe=2, seed=1)
+
+        self.assertEqual(Recipe.objects.filter(user=user).count(), 8)
+        self.assertEqual(Tag.objects.filter(user=user).count(), 3)
+        self.assertEqual(Ingredient.objects.filter(user=user).count(), 3)
+        for recipe in Recipe.objects.filter(pk__in=links):
+            self.assertEqual(set(recipe.tags.all()), links[recipe.pk])
+        for recipe in Recipe.objects.filter(user=user):
+            self.assertEqual(recipe.ingredients.count(), 2)
+
+
+class RepairRecipeStatsTests(TestCase):
+
+    def test_repair_recipe_stats(self):
+        """test the counts are recomputed from the recipes"""
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=10, price=3
+        )
+        recipe.tags.add(tag)
+        Tag.objects.filter(pk=tag.pk).update(
+            recipe_count=7, total_time_minutes=0
+        )
+        unused = Tag.objects.create(user=user, name='Unused', recipe_count=2)
+
+        call_command('repair_recipe_stats', batch_size=1, stdout=StringIO())
+
+        tag.refresh_from_db()
+        unused.refresh_from_db()
+        self.assertEqual(
+            (tag.recipe_count, tag.total_time_minutes, tag.total_price),
+            (1, 10, 3)
+        )
+        self.assertEqual(unused.recipe_count, 0)
@@ -0,0 +1,166 @@
+import os
+import tempfile
+from unittest.mock import MagicMock
+from django.contrib.auth import get_user_model
+from django.db import connection, OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.db import ConnectionPool
+from core.db.sqlite3.base import DatabaseWrapper
+
+DB_POOLS_URL = reverse('core:db-pools')
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """test the per process connection limit/pool"""
+
+    def _pool(self, **kwargs):
+        options = {'max_size': 2, 'timeout': 0.05, 'health_check_after': 30}
+        options.update(kwargs)
+        return ConnectionPool(**options)
+
+    def _acquire(self, pool, usable=True):
+        return pool.acquire(MagicMock, lambda conn: usable, OperationalError)
+
+    def test_reuse(self):
+        """test a released connection is handed out again"""
+        pool = self._pool()
+        conn = self._acquire(pool)
+        pool.release(conn)
+
+        self.assertIs(self._acquire(pool), conn)
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_no_reuse(self):
+        """test connections are closed on release when pooling is off"""
+        pool = self._pool(reuse=False)
+        conn = self._acquire(pool)
+        pool.release(conn)
+
+        conn.close.assert_called_once()
+        self.assertIsNot(self._acquire(pool), conn)
+
+    def test_limit(self):
+        """test past max_size connections acquire waits then fails"""
+        pool = self._pool()
+        conns = [self._acquire(pool), self._acquire(pool)]
+
+        with self.assertRaises(OperationalError):
+            self._acquire(pool)
+        stats = pool.stats()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+
+        pool.release(conns[0], reusable=False)
+        self._acquire(pool)
+        self.assertEqual(pool.stats()['in_use'], 2)
+
+    def test_failed_connect_frees_slot(self):
+        """test a connect that raises doesnt use up the limit"""
+        pool = self._pool(max_size=1)
+
+        def connect():
+            raise OperationalError('down')
+        with self.assertRaises(OperationalError):
+            pool.acquire(connect, lambda conn: True, OperationalError)
+
+        self._acquire(pool)
+
+    def test_health_check(self):
+        """test a connection idle for too long is checked, dropped if broken"""
+        pool = self._pool(health_check_after=0)
+        conn = self._acquire(pool)
+        pool.release(conn)
+
+        self.assertIsNot(self._acquire(pool, usable=False), conn)
+        conn.close.assert_called_once()
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    """test the backend takes its connections from the pool"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.settings_dict = dict(
+            connection.settings_dict,
+            ENGINE='core.db.sqlite3',
+            NAME=self.path,
+            POOL=True,
+            MAX_CONNECTIONS=1,
+            POOL_TIMEOUT=0.05,
+        )
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_connection_reused(self):
+        """test closing a connection hands it to the next one to connect"""
+        first = DatabaseWrapper(self.settings_dict, alias='pooltest')
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+
+        second = DatabaseWrapper(self.settings_dict, alias='pooltest')
+        second.ensure_connection()
+        self.assertIs(second.connection, raw)
+
+        # the only connection is taken
+        with self.assertRaises(OperationalError):
+            first.ensure_connection()
+        second.close()
+        first.pool.close_idle()
+
+    def test_released_to_own_pool(self):
+        """test a connection goes back to the pool it came from
+
+        even after settings_dict changed while it was open
+        """
+        wrapper = DatabaseWrapper(self.settings_dict, alias='pooltest')
+        wrapper.ensure_connection()
+        pool = wrapper.pool
+        # what the test runner does when it switches to the test database
+        wrapper.settings_dict['NAME'] = self.path + '-other'
+
+        wrapper.close()
+
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(pool.stats()['idle'], 1)
+        pool.close_idle()
+
+
+class DatabasePoolsApiTests(TestCase):
+    """test the pool stats endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_admin_only(self):
+        """test only staff can see the pools"""
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(user)
+
+        res = self.client.get(DB_POOLS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_pool_stats(self):
+        """test the stats of the pools are returned"""
+        user = get_user_model().objects.create_superuser(
+            'admin@test.com',
+            'password'
+        )
+        self.client.force_authenticate(user)
+
+        res = self.client.get(DB_POOLS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data['pools'], list)
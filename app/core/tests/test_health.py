@@ -0,0 +1,62 @@
+from unittest.mock import patch
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from core import health
+
+
+class HealthCheckTests(TestCase):
+    """test the /healthz and /readyz probes"""
+
+    def setUp(self):
+        health._migrated.clear()
+
+    def test_healthz(self):
+        """test the liveness probe answers without touching the db"""
+        with self.assertNumQueries(0):
+            res = self.client.get(health.HEALTH_PATH)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readyz(self):
+        """test the readiness probe queries the db and checks the migrations"""
+        res = self.client.get(health.READY_PATH)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readyz_migrations_checked_once(self):
+        """test the migrations arent loaded again once they are all applied"""
+        self.client.get(health.READY_PATH)
+
+        with patch('core.health.MigrationExecutor') as executor:
+            self.client.get(health.READY_PATH)
+        executor.assert_not_called()
+
+    def test_readyz_db_down(self):
+        """test the readiness probe fails when the db cant be queried"""
+        with patch(
+            'core.health.check_database', side_effect=OperationalError('down')
+        ):
+            res = self.client.get(health.READY_PATH)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['status'], 'unavailable')
+
+    @override_settings(DEBUG=False)
+    def test_readyz_unapplied_migrations(self):
+        """test pending migrations fail readiness, saying why only in debug"""
+        with patch(
+            'core.health.unapplied_migrations', return_value=['core.0099_new']
+        ):
+            res = self.client.get(health.READY_PATH)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json(), {'status': 'unavailable'})
+
+    @override_settings(ALLOWED_HOSTS=['api.example.com'])
+    def test_probes_skip_host_check(self):
+        """test a probe sent to the pod's ip isnt rejected by ALLOWED_HOSTS"""
+        res = self.client.get(health.HEALTH_PATH, HTTP_HOST='10.0.0.12:8000')
+
+        self.assertEqual(res.status_code, 200)
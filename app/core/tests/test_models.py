@@ -75,4 +75,40 @@ class ModelTests(TestCase):
         file_path = models.recipe_image_file_path(None, 'myimage.jpg')
         
         exp_path = f'uploads/recipe/{uuid}.jpg'
-        self.assertEqual(file_path, exp_path)
\ No newline at end of file
+        self.assertEqual(file_path, exp_path)
+    def test_normalize_ingredient_name(self):
+        """test case, spacing and unicode forms dont change the ingredient"""
+        self.assertEqual(
+            models.normalize_ingredient_name('  Sea   SALT '), 'sea salt'
+        )
+        self.assertEqual(
+            models.normalize_ingredient_name('Ｃafé'),
+            models.normalize_ingredient_name('café')
+        )
+
+    def test_ingredients_share_catalog_entry(self):
+        """test the same ingredient of two users points at one catalog entry"""
+        salt = models.Ingredient.objects.create(
+            user=sample_user(), name='Salt'
+        )
+        other = models.Ingredient.objects.create(
+            user=sample_user('test2@test.com'), name=' salt'
+        )
+
+        self.assertEqual(salt.catalog_id, other.catalog_id)
+        self.assertEqual(salt.catalog.name, 'Salt')
+        self.assertEqual(models.CatalogIngredient.objects.count(), 1)
+
+    def test_catalog_resolve(self):
+        """test resolving names adds the missing ones and reuses the rest"""
+        existing = models.CatalogIngredient.objects.create(
+            name='Salt', normalized='salt'
+        )
+
+        ids = models.CatalogIngredient.objects.resolve(
+            ['SALT', 'Pepper', 'pepper ']
+        )
+
+        self.assertEqual(ids['salt'], existing.id)
+        self.assertEqual(set(ids), {'salt', 'pepper'})
+        self.assertEqual(models.CatalogIngredient.objects.count(), 2)
@@ -0,0 +1,106 @@
+import io
+import json
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from core import renderers
+from core.models import Recipe
+from core.renderers import FastJSONRenderer, FastJSONParser
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class FastJSONTests(TestCase):
+    """test the json renderer/parser with and without orjson"""
+
+    data = {
+        'id': 1,
+        'title': 'Soup',
+        'price': Decimal('0.10'),
+        'total': Decimal('12345678901234.99'),
+        'name': _('Name'),
+        'tags': [1, 2],
+        'nested': {'unicode': 'crème brûlée'},
+    }
+
+    def _both(self):
+        """yield once with orjson (if installed) and once with the stdlib,
+        with the name of the one in use
+        """
+        if renderers.orjson is not None:
+            yield 'orjson'
+        with patch.object(renderers, 'orjson', None):
+            yield 'json'
+
+    def test_render(self):
+        """test decimals are rendered exactly as strings by both"""
+        for backend in self._both():
+            body = FastJSONRenderer().render(self.data)
+            self.assertEqual(json.loads(body), {
+                'id': 1,
+                'title': 'Soup',
+                'price': '0.10',
+                'total': '12345678901234.99',
+                'name': 'Name',
+                'tags': [1, 2],
+                'nested': {'unicode': 'crème brûlée'},
+            })
+
+    def test_render_none(self):
+        """test an empty response renders nothing"""
+        for backend in self._both():
+            self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_parse(self):
+        """test both parse the same"""
+        body = json.dumps({'price': 5.1, 'tags': [1], 'title': 'é'}).encode()
+        for backend in self._both():
+            self.assertEqual(
+                FastJSONParser().parse(io.BytesIO(body)),
+                {'price': 5.1, 'tags': [1], 'title': 'é'}
+            )
+
+    def test_parse_invalid(self):
+        """test bad json is a ParseError"""
+        for backend in self._both():
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(b'{"title": '))
+
+
+class FastJSONApiTests(TestCase):
+    """test the api goes through the fast renderer/parser"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_recipe_price_exact(self):
+        """test a price sent as a json number is stored without drift"""
+        res = self.client.post(
+            RECIPES_URL,
+            '{"title": "Soup", "time_minutes": 5, "price": 0.3, '
+            '"tags": [], "ingredients": []}',
+            content_type='application/json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.get().price, Decimal('0.30'))
+        self.assertEqual(json.loads(res.content)['price'], '0.30')
+
+    def test_invalid_json_rejected(self):
+        """test a broken body is a 400"""
+        res = self.client.post(
+            RECIPES_URL, '{"title": ', content_type='application/json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,141 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from core.models import Recipe
+from core.routers import ReplicaMiddleware, ReplicaRouter, replica_health
+
+REPLICAS = ('replica_0', 'replica_1')
+
+
+@override_settings(
+    DATABASE_REPLICAS=REPLICAS, REPLICA_MAX_LAG=5, REPLICA_CHECK_INTERVAL=60
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """test GETs read from a replica and everything else from default"""
+
+    def setUp(self):
+        cache.clear()
+        replica_health.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.lag = patch('core.routers.replica_lag', return_value=0).start()
+        self.addCleanup(patch.stopall)
+
+    def _read_db(self, method='get', status=200, user_id=None, **extra):
+        """return the db a request's reads went to; user_id is who the view
+        authenticates
+        """
+        dbs = []
+
+        def view(request):
+            dbs.append(self.router.db_for_read(Recipe))
+            if user_id is not None:
+                request.user = SimpleNamespace(pk=user_id)
+            return HttpResponse(status=status)
+        request = getattr(self.factory, method)(
+            '/api/recipe/recipes/', **extra
+        )
+        ReplicaMiddleware(view)(request)
+        return dbs[0]
+
+    def test_get_reads_replica(self):
+        """test a GET reads from one of the replicas"""
+        self.assertIn(self._read_db(), REPLICAS)
+
+    def test_post_reads_default(self):
+        """test reads while handling a write use default"""
+        self.assertIsNone(self._read_db('post'))
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_outside_request_reads_default(self):
+        """test reads outside of a request (tasks, commands) use default"""
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_unknown_credentials_read_default(self):
+        """test a token/session only reads a replica once its user is known"""
+        auth = {'HTTP_AUTHORIZATION': 'Token abc'}
+        self.assertIsNone(self._read_db(user_id=1, **auth))
+
+        self.assertIn(self._read_db(user_id=1, **auth), REPLICAS)
+
+    def test_read_your_writes(self):
+        """test a user reads from default for a while after they write"""
+        auth = {'HTTP_AUTHORIZATION': 'Token abc'}
+        other_auth = {'HTTP_AUTHORIZATION': 'Token def'}
+        for credentials in (auth, other_auth):
+            self._read_db(user_id=1, **credentials)
+        self.assertIn(self._read_db(user_id=1, **auth), REPLICAS)
+
+        self._read_db('post', user_id=1, **auth)
+        self.assertIsNone(self._read_db(user_id=1, **auth))
+        self.assertIsNone(self._read_db(user_id=1, **other_auth))
+        # other users arent affected
+        self._read_db(user_id=2, HTTP_AUTHORIZATION='Token xyz')
+        self.assertIn(
+            self._read_db(user_id=2, HTTP_AUTHORIZATION='Token xyz'), REPLICAS
+        )
+
+        # once the window is over
+        cache.delete('replica-sticky:1')
+        self.assertIn(self._read_db(user_id=1, **auth), REPLICAS)
+
+    def test_failed_write_not_sticky(self):
+        """test a write that failed doesnt keep the user on default"""
+        auth = {'HTTP_AUTHORIZATION': 'Token abc'}
+        self._read_db('post', status=400, user_id=1, **auth)
+
+        self.assertIn(self._read_db(user_id=1, **auth), REPLICAS)
+
+    def test_lagging_replica_skipped(self):
+        """test a replica too far behind isnt read from"""
+        self.lag.side_effect = lambda alias: 60 if alias == 'replica_0' else 0
+
+        for _ in range(10):
+            self.assertEqual(self._read_db(), 'replica_1')
+
+    def test_down_replicas_fall_back(self):
+        """test reads go to default when no replica can be reached"""
+        self.lag.side_effect = DatabaseError('down')
+
+        self.assertIsNone(self._read_db())
+
+    def test_health_cached(self):
+        """test replicas are checked once per REPLICA_CHECK_INTERVAL"""
+        for _ in range(5):
+            self._read_db()
+
+        self.assertEqual(self.lag.call_count, len(REPLICAS))
+
+    def test_down_replica_doesnt_block_others(self):
+        """test a replica being checked doesnt hold up the others' checks"""
+        checking = threading.Event()
+        release = threading.Event()
+
+        def lag(alias):
+            if alias == 'replica_0':
+                checking.set()
+                release.wait(5)
+                raise DatabaseError('timed out')
+            return 0
+        self.lag.side_effect = lag
+        thread = threading.Thread(
+            target=replica_health.healthy, args=('replica_0',)
+        )
+        thread.start()
+        checking.wait(5)
+        try:
+            # while replica_0 is still being checked
+            self.assertFalse(replica_health.healthy('replica_0'))
+            self.assertTrue(replica_health.healthy('replica_1'))
+        finally:
+            release.set()
+            thread.join()
+
+    def test_no_migrations_on_replicas(self):
+        """test migrate skips the replicas"""
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
@@ -0,0 +1,15 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.authentication import CachedTokenAuthentication
+from core.db import pool_stats
+
+class DatabasePoolsView(APIView):
+    """connection counts of the database pools of the process that answers
+    (see core/db/__init__.py)
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response({'pools': pool_stats()})
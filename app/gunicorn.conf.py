@@ -0,0 +1,61 @@
+"""gunicorn settings for serving the api in production (gunicorn reads
+./gunicorn.conf.py on its own)
+
+    DJANGO_SETTINGS_MODULE=app.settings_production \
+        gunicorn app.asgi:application
+
+everything can be overridden with GUNICORN_* env vars. `kill -HUP <master
+pid>` gracefully replaces the workers (each one finishes its requests first);
+with preload the code was imported by the master so new code needs a full
+restart, or GUNICORN_PRELOAD=0
+"""
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# uvicorn workers serve app.asgi (views run in thread pools per worker, see
+# core/asgi.py); set GUNICORN_WORKER_CLASS=gthread and serve
+# app.wsgi:application for plain threaded wsgi workers
+worker_class = os.environ.get(
+    'GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker'
+)
+# an asgi worker keeps every core busy with its thread pools so one per cpu;
+# wsgi workers block so the usual 2n + 1
+workers = int(os.environ.get(
+    'GUNICORN_WORKERS', cpus if 'uvicorn' in worker_class else 2 * cpus + 1
+))
+# app/settings.py splits DB_MAX_CONNECTIONS between the workers
+os.environ['GUNICORN_WORKERS'] = str(workers)
+# only used by gthread workers
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# import django once in the master so workers start fast and share its memory
+# (copy on write)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# recycle workers now and then so a slow leak (or a huge response) cant grow
+# one forever; jitter so they dont all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+# docker's /tmp can be a slow overlay; the worker heartbeat files are touched
+# all the time
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    """runs in the master before any worker is forked"""
+    # the preload may have opened db connections; a forked worker must never
+    # share its parent's socket
+    if server.cfg.preload_app:
+        from django.db import connections
+        from core.db import close_idle_connections
+        connections.close_all()
+        close_idle_connections()
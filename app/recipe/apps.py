@@ -3,3 +3,15 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        # connects the cache invalidation signals
+        from recipe import signals  # noqa
+        # name__trigram_similar for the autocomplete. django.contrib.postgres
+        # would register it too but that app imports psycopg2 when it loads,
+        # which sqlite test runs dont have
+        from django.contrib.postgres.lookups import TrigramSimilar
+        from django.db.models import CharField
+        from recipe.autocomplete import ILikeStartsWith
+        CharField.register_lookup(TrigramSimilar)
+        CharField.register_lookup(ILikeStartsWith)
@@ -0,0 +1,54 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.lookups import IStartsWith
+
+AUTOCOMPLETE_PARAM = 'q'
+# longer input doesnt narrow a tag/ingredient name down any further
+MAX_AUTOCOMPLETE_LENGTH = 100
+
+
+class ILikeStartsWith(IStartsWith):
+    """istartswith that is written as ILIKE 'text%' on postgres
+
+    django's istartswith is UPPER(name::text) LIKE UPPER('text%') there,
+    which the (user, name gin_trgm_ops) index cant answer; gin_trgm_ops does
+    support ILIKE. elsewhere it is the same as istartswith
+    """
+    lookup_name = 'ilike_startswith'
+
+    def get_rhs_op(self, connection, rhs):
+        if connection.vendor == 'postgresql':
+            return 'ILIKE %s' % rhs
+        return connection.operators[IStartsWith.lookup_name] % rhs
+
+
+def autocomplete(queryset, text, limit):
+    """return the top `limit` tags/ingredients for what the user has typed so
+    far
+
+    names starting with the text come first (shortest first), then on postgres
+    names that are merely similar (a typo or a word in the middle) by trigram
+    similarity. both conditions (ILIKE and %) are answered from the (user,
+    name) trigram gin index so it doesnt matter how many names the user has
+    """
+    text = ' '.join(text.split())[:MAX_AUTOCOMPLETE_LENGTH]
+    if not text:
+        return queryset.none()
+    queryset = queryset.annotate(prefix=Case(
+        When(name__ilike_startswith=text, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField()
+    ))
+    if connections[queryset.db].vendor == 'postgresql':
+        # name % text is the pg_trgm similarity operator
+        # (pg_trgm.similarity_threshold, 0.3 by default)
+        return queryset.filter(
+            Q(name__ilike_startswith=text) | Q(name__trigram_similar=text)
+        ).annotate(
+            similarity=TrigramSimilarity('name', text)
+        ).order_by('-prefix', '-similarity', 'name', 'id')[:limit]
+    # sqlite (the tests); no fuzzy matching, just anything containing the text
+    return queryset.filter(
+        name__icontains=text
+    ).order_by('-prefix', 'name', 'id')[:limit]
@@ -0,0 +1,74 @@
+import hashlib
+import time
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# resources that get their own cache namespace per user
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RESOURCES = (RECIPES, TAGS, INGREDIENTS)
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def _version_key(user_id, resource):
+    return f'api:{user_id}:{resource}:version'
+
+
+def get_version(user_id, resource):
+    """return the current version of a user's resource namespace"""
+    cache = get_cache()
+    key = _version_key(user_id, resource)
+    version = cache.get(key)
+    if version is None:
+        # start from the clock instead of 0 so an evicted version can never
+        # line up with old entries again
+        version = int(time.time() * 1000)
+        # add only sets it if another request didnt beat us to it
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(user_id, *resources):
+    """bump the version of a user's resources so all their cached responses
+    are skipped
+
+    inside a transaction it is bumped again once it commits: a request that
+    read the old rows in between would have cached them under the first new
+    version where they'd be served until API_CACHE_TIMEOUT
+    """
+    _bump(user_id, resources)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(_bump, user_id, resources))
+
+
+def _bump(user_id, resources):
+    cache = get_cache()
+    for resource in resources:
+        key = _version_key(user_id, resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # version was never set or got evicted
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def response_key(user_id, resource, action, path, query_params):
+    """build the cache key for a response
+
+    query params are sorted so ?a=1&b=2 and ?b=2&a=1 share an entry
+    """
+    params = sorted(
+        (name, value)
+        for name in query_params
+        for value in query_params.getlist(name)
+    )
+    digest = hashlib.md5(repr((path, params)).encode()).hexdigest()
+    version = get_version(user_id, resource)
+    return f'api:{user_id}:{resource}:{version}:{action}:{digest}'
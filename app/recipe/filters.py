@@ -0,0 +1,64 @@
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+# query param => m2m field on Recipe
+RELATED_FILTERS = ('tags', 'ingredients')
+
+
+def params_to_ints(qs, param):
+    """convert a comma separated string of IDs to a set of integers"""
+    try:
+        return {int(str_id) for str_id in qs.split(',') if str_id}
+    except ValueError:
+        raise ValidationError(
+            {param: 'Must be a comma separated list of IDs.'}
+        )
+
+
+def filter_by_related(queryset, relation, ids, match=MATCH_ANY):
+    """filter recipes by the IDs of a m2m relation (tags or ingredients)
+
+    any => recipe has at least one of the IDs
+    all => recipe has every one of the IDs
+    both only look at the m2m table in a subquery so a recipe is never
+    returned twice and no DISTINCT is needed
+    """
+    field = Recipe._meta.get_field(relation)
+    through = field.remote_field.through
+    # name of the fk on the m2m table that points at the tag/ingredient
+    target = field.m2m_reverse_field_name()
+    links = through.objects.filter(**{f'{target}_id__in': ids})
+    if match == MATCH_ALL:
+        # group the matching links by recipe and keep the recipes that have a
+        # link for every id
+        matching = links.values('recipe_id').annotate(
+            matched=Count(target)
+        ).filter(matched=len(ids)).values('recipe_id')
+        return queryset.filter(pk__in=matching)
+    return queryset.filter(Exists(links.filter(recipe_id=OuterRef('pk'))))
+
+
+def filter_recipes(queryset, query_params):
+    """apply the ?tags= and ?ingredients= filters
+
+    each with ?<name>_match=any|all
+    """
+    for relation in RELATED_FILTERS:
+        value = query_params.get(relation)
+        if not value:
+            continue
+        match_param = f'{relation}_match'
+        match = query_params.get(match_param, MATCH_ANY)
+        if match not in MATCH_MODES:
+            raise ValidationError(
+                {match_param: f'Must be one of: {", ".join(MATCH_MODES)}.'}
+            )
+        ids = params_to_ints(value, relation)
+        if ids:
+            queryset = filter_by_related(queryset, relation, ids, match)
+    return queryset
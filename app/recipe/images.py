@@ -0,0 +1,129 @@
+import io
+import os
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from core.models import Recipe, IMAGE_PENDING, IMAGE_READY, IMAGE_FAILED
+from core.tasks import run_in_background
+from recipe import cache
+
+# what a recipe's image fields get reset to when a new image is uploaded,
+# until process_recipe_image is done
+PENDING_IMAGE_FIELDS = {
+    'image_thumbnail': None,
+    'image_webp': None,
+    'image_width': None,
+    'image_height': None,
+    'image_status': IMAGE_PENDING,
+}
+
+
+def _encode(image, max_size, format, **options):
+    """return the bytes of a copy of image that fits in max_size x max_size"""
+    copy = image.copy()
+    copy.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # nothing is passed through from the original so exif/gps/etc are dropped
+    copy.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def _variant_name(image_name, suffix):
+    """uploads/recipe/<uuid>.jpg => uploads/recipe/<uuid>_<suffix>"""
+    root, _ = os.path.splitext(image_name)
+    return f'{root}_{suffix}'
+
+
+def _finish(recipe_id, image_name, **fields):
+    """store the results on the recipe unless a newer image was uploaded in
+    the meantime
+    """
+    # update() so the background thread doesnt overwrite fields changed by a
+    # request since
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        updated_at=timezone.now(),
+        **fields
+    )
+    if updated:
+        user_id = Recipe.objects.filter(pk=recipe_id).values_list(
+            'user_id', flat=True
+        ).first()
+        cache.invalidate(user_id, cache.RECIPES)
+    return updated
+
+
+def _delete(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def process_recipe_image(recipe_id, image_name):
+    """make the thumbnail and webp copies of a recipe image and record its
+    size
+    """
+    saved = []
+    try:
+        with default_storage.open(image_name, 'rb') as f:
+            image = Image.open(f)
+            # apply the exif rotation before it gets thrown away
+            image = ImageOps.exif_transpose(image)
+            image.load()
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB'
+            )
+        thumbnail = _encode(
+            image.convert('RGB'),
+            settings.RECIPE_IMAGE_THUMBNAIL_SIZE,
+            'JPEG',
+            quality=85,
+            optimize=True
+        )
+        webp = _encode(
+            image, settings.RECIPE_IMAGE_WEBP_SIZE, 'WEBP', quality=80
+        )
+        thumbnail_name = default_storage.save(
+            _variant_name(image_name, 'thumb.jpg'), ContentFile(thumbnail)
+        )
+        saved.append(thumbnail_name)
+        webp_name = default_storage.save(
+            _variant_name(image_name, 'web.webp'), ContentFile(webp)
+        )
+        saved.append(webp_name)
+
+        updated = _finish(
+            recipe_id,
+            image_name,
+            image_thumbnail=thumbnail_name,
+            image_webp=webp_name,
+            image_width=image.width,
+            image_height=image.height,
+            image_status=IMAGE_READY
+        )
+    except Exception:
+        # anything from a broken upload or a decompression bomb to a pillow
+        # built without webp; the recipe mustnt stay pending or keep half of
+        # its variants
+        _delete(saved)
+        _finish(recipe_id, image_name, image_status=IMAGE_FAILED)
+        raise
+    if not updated:
+        # the recipe got a new image (or was deleted) while this one was
+        # processing
+        _delete(saved)
+
+
+def set_recipe_image(recipe, image_name):
+    """point a recipe at an image that is already in storage and queue its
+    variants
+    """
+    recipe.image = image_name
+    for field, value in PENDING_IMAGE_FIELDS.items():
+        setattr(recipe, field, value)
+    recipe.save(
+        update_fields=['image', 'updated_at', *PENDING_IMAGE_FIELDS]
+    )
+    run_in_background(process_recipe_image, recipe.pk, image_name)
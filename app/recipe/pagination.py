@@ -0,0 +1,127 @@
+import json
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class RecipeCursorPagination(CursorPagination):
+    """keyset pagination for recipes ordered by newest first"""
+    # cursor pagination seeks straight to the last row it saw (WHERE id < x)
+    # instead of counting and offsetting so it stays fast no matter how many
+    # rows the user has
+    ordering = '-id'
+    # lets the client ask for a smaller/bigger page with ?page_size=
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class KeysetCursorPagination(RecipeCursorPagination):
+    """cursor pagination for an ordering whose first field isnt unique (i.e.
+    ('-name', '-id'))
+
+    drf only puts the value of ordering[0] in the cursor and skips the rows
+    that share it with an offset, so the tie breakers never reach the WHERE.
+    here the cursor holds the value of every field and the next page starts
+    right after that row: (name < x) OR (name = x AND id < y). the last field
+    has to be unique
+    """
+
+    def _position_values(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            return [instance[field] for field in fields]
+        return [getattr(instance, field) for field in fields]
+
+    def _get_position_from_instance(self, instance, ordering):
+        # compared as strings by drf to find the page edges; unique since the
+        # last field is
+        return json.dumps(self._position_values(instance, ordering))
+
+    def _seek(self, position, reverse):
+        """return the filter for the rows after (before if reverse) position"""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        seek = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if reverse != field.startswith('-') else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # same as CursorPagination.paginate_queryset except for how the
+        # position is filtered on
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._seek(current_position, reverse))
+
+        # one extra row to know if there is a next page
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class RecipeAttrCursorPagination(KeysetCursorPagination):
+    """keyset pagination for tags and ingredients ordered by name"""
+    # id is the tie breaker so two tags with the same name cant swap places
+    # or be skipped between pages
+    ordering = ('-name', '-id')
+
+
+class RecipeSearchCursorPagination(KeysetCursorPagination):
+    """keyset pagination for recipe search results ordered by best match
+    first (see recipe/search.py)
+    """
+    # plenty of results have the same rank (i.e. the same words in the title)
+    # so id breaks the ties
+    ordering = ('-rank', '-id')
@@ -0,0 +1,68 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+from core.models import Recipe
+
+SEARCH_PARAM = 'search'
+# text search config used by the trigger that fills Recipe.search_vector (see
+# core/migrations/0014_recipe_search_vector.py)
+SEARCH_CONFIG = 'english'
+# more words than this are ignored; a longer query doesnt find anything better
+# and costs more
+MAX_SEARCH_WORDS = 10
+
+
+def search_words(text):
+    """split a search into plain words (everything else would be tsquery
+    syntax)
+    """
+    return re.findall(r'[^\W_]+', text or '')[:MAX_SEARCH_WORDS]
+
+
+def prefix_tsquery(words):
+    """return a raw tsquery that matches recipes having every word as a
+    prefix (i.e. 'chick' finds 'chicken')
+    """
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def search_recipes(queryset, text):
+    """filter recipes to the ones matching a search and annotate each with a
+    rank (higher is better)
+
+    postgres uses the maintained search_vector (title weighted over tag names
+    over ingredient names) and its gin index. anything else (sqlite in the
+    tests) falls back to case insensitive substring matching
+    """
+    words = search_words(text)
+    if not words:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(
+            prefix_tsquery(words), config=SEARCH_CONFIG, search_type='raw'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            # ts_rank is a float4; as a double the value the cursor sends back
+            # (see recipe/pagination.py) compares equal to the row it came
+            # from
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+    for word in words:
+        # subqueries rather than joins so a recipe is never returned twice
+        queryset = queryset.filter(
+            Q(title__icontains=word) |
+            Q(pk__in=Recipe.tags.through.objects.filter(
+                tag__name__icontains=word
+            ).values('recipe_id')) |
+            Q(pk__in=Recipe.ingredients.through.objects.filter(
+                ingredient__name__icontains=word
+            ).values('recipe_id'))
+        )
+    # good enough to put title matches first
+    return queryset.annotate(rank=Case(
+        When(title__icontains=words[0], then=Value(1.0)),
+        default=Value(0.5),
+        output_field=FloatField()
+    ))
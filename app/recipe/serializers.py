@@ -1,46 +1,423 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from core.models import Tag, Ingredient, Recipe
+from rest_framework.relations import MANY_RELATION_KWARGS
+from core.models import (
+    Tag, Ingredient, Recipe, CatalogIngredient, normalize_ingredient_name
+)
 
-class TagSerializer(serializers.ModelSerializer):
+class BulkListSerializer(serializers.ListSerializer):
+    """list serializer that writes all of its items with a handful of bulk
+    queries
+
+    used for the /bulk/ endpoints; doesnt send post_save or m2m_changed so the
+    caller has to do that work
+    """
+
+    @property
+    def model(self):
+        return self.child.Meta.model
+
+    def to_internal_value(self, data):
+        # look up the related pks of every item at once; each item would
+        # otherwise run its own query per relation
+        related = [
+            field for field in self.child.fields.values()
+            if isinstance(field, BatchedManyRelatedField)
+            and not field.read_only
+        ]
+        if isinstance(data, list):
+            for field in related:
+                field.resolved = field.resolve(
+                    item.get(field.field_name)
+                    for item in data if isinstance(item, dict)
+                )
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in related:
+                field.resolved = None
+
+    def _pop_m2m(self, validated_data):
+        """take the m2m values out of each item
+
+        returns a list of {field name: objects}
+        """
+        names = [field.name for field in self.model._meta.many_to_many]
+        return [
+            {name: attrs.pop(name) for name in names if name in attrs}
+            for attrs in validated_data
+        ]
+
+    def _insert(self, objs):
+        """bulk insert objs and make sure they get their pks back"""
+        connection = connections[self.model.objects.db]
+        if connection.features.can_return_rows_from_bulk_insert:
+            return self.model.objects.bulk_create(
+                objs, batch_size=settings.API_BULK_BATCH_SIZE
+            )
+        # only postgres hands back the pks from a bulk insert; the m2m links
+        # need them so save one by one elsewhere (i.e. sqlite tests)
+        for obj in objs:
+            obj.save()
+        return objs
+
+    def _set_m2m(self, objs, m2m, replace):
+        """write all the m2m links with one insert per m2m table
+
+        replace => delete the existing links of the fields that were sent
+        first (i.e. for updates)
+        """
+        for field in self.model._meta.many_to_many:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            sent = [
+                (obj, values[field.name])
+                for obj, values in zip(objs, m2m) if field.name in values
+            ]
+            if not sent:
+                continue
+            if replace:
+                through.objects.filter(**{
+                    f'{source}_id__in': [obj.pk for obj, _ in sent]
+                }).delete()
+            links = {
+                (obj.pk, related.pk)
+                for obj, related_objs in sent for related in related_objs
+            }
+            through.objects.bulk_create(
+                [
+                    through(**{
+                        f'{source}_id': obj_pk, f'{target}_id': related_pk
+                    })
+                    for obj_pk, related_pk in links
+                ],
+                batch_size=settings.API_BULK_BATCH_SIZE
+            )
+
+    def create(self, validated_data):
+        m2m = self._pop_m2m(validated_data)
+        objs = self._insert([self.model(**attrs) for attrs in validated_data])
+        self._set_m2m(objs, m2m, replace=False)
+        return objs
+
+    def update(self, instances, validated_data):
+        """update instances[i] with validated_data[i]"""
+        m2m = self._pop_m2m(validated_data)
+        fields = set()
+        for obj, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+                fields.add(attr)
+        # bulk_update skips auto_now so do it by hand
+        field_names = {field.name for field in self.model._meta.fields}
+        if 'updated_at' in field_names:
+            now = timezone.now()
+            for obj in instances:
+                obj.updated_at = now
+            fields.add('updated_at')
+        self.model.objects.bulk_update(
+            instances, fields, batch_size=settings.API_BULK_BATCH_SIZE
+        )
+        self._set_m2m(instances, m2m, replace=True)
+        return instances
+
+def stats_requested(request):
+    return (
+        request is not None
+        and request.query_params.get('stats') in ('1', 'true')
+    )
+
+class RecipeStatsFieldsMixin(serializers.Serializer):
+    """adds how many recipes a tag/ingredient is on and their average
+    time/price when asked for with ?stats=1
+
+    the numbers are kept on the row (see recipe/stats.py) so they cost nothing
+    to read
+    """
+    recipe_count = serializers.IntegerField(read_only=True)
+    avg_time_minutes = serializers.FloatField(read_only=True)
+    avg_price = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    stats_fields = ('recipe_count', 'avg_time_minutes', 'avg_price')
+    # the model columns the stats fields are worked out from
+    stats_columns = ('recipe_count', 'total_time_minutes', 'total_price')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not stats_requested(self.context.get('request')):
+            for name in self.stats_fields:
+                fields.pop(name)
+        return fields
+
+class TagSerializer(RecipeStatsFieldsMixin, serializers.ModelSerializer):
     """serializer for tag objects"""
     
     class Meta:
         model = Tag
-        fields=('id', 'name')
+        fields=('id', 'name') + RecipeStatsFieldsMixin.stats_fields
         read_only_fields = ('id',)
+        list_serializer_class = BulkListSerializer
+
+class IngredientListSerializer(BulkListSerializer):
+    """bulk writes for ingredients; points them at the catalog with a few
+    queries for the whole batch
+
+    a name the user already has (however it is spelled) gives back their
+    existing ingredient instead of a duplicate
+    """
 
-class IngredientSerializer(serializers.ModelSerializer):
+    def _catalog_ids(self, validated_data):
+        """set catalog_id on every item that has a name"""
+        names = [attrs['name'] for attrs in validated_data if 'name' in attrs]
+        ids = CatalogIngredient.objects.resolve(names)
+        for attrs in validated_data:
+            if 'name' in attrs:
+                normalized = normalize_ingredient_name(attrs['name'])
+                attrs['catalog_id'] = ids[normalized]
+
+    def create(self, validated_data):
+        self._catalog_ids(validated_data)
+        catalog_ids = [attrs['catalog_id'] for attrs in validated_data]
+        existing = {}
+        for user_id in {attrs['user'].pk for attrs in validated_data}:
+            existing.update({
+                (user_id, obj.catalog_id): obj
+                for obj in Ingredient.objects.filter(
+                    user_id=user_id, catalog_id__in=catalog_ids
+                )
+            })
+        objs, new = [], []
+        for attrs in validated_data:
+            key = (attrs['user'].pk, attrs['catalog_id'])
+            if key not in existing:
+                existing[key] = Ingredient(**attrs)
+                new.append(existing[key])
+            objs.append(existing[key])
+        self._insert(new)
+        return objs
+
+    def update(self, instances, validated_data):
+        self._catalog_ids(validated_data)
+        renamed = {
+            obj.pk: attrs['catalog_id']
+            for obj, attrs in zip(instances, validated_data)
+            if 'catalog_id' in attrs
+        }
+        catalog_ids = list(renamed.values())
+        taken = Ingredient.objects.filter(
+            user_id__in={obj.user_id for obj in instances},
+            catalog_id__in=catalog_ids
+        ).exclude(pk__in=list(renamed)).exists()
+        if taken or len(set(catalog_ids)) != len(catalog_ids):
+            raise serializers.ValidationError(
+                'Cannot rename an ingredient to the name of another '
+                'ingredient.'
+            )
+        return super().update(instances, validated_data)
+
+class IngredientSerializer(RecipeStatsFieldsMixin,
+                           serializers.ModelSerializer):
     """serializer for ingredient objects"""
     
     class Meta:
         model = Ingredient
-        fields=('id', 'name')
+        fields=('id', 'name') + RecipeStatsFieldsMixin.stats_fields
         read_only_fields = ('id',)
+        list_serializer_class = IngredientListSerializer
+
+    def create(self, validated_data):
+        """return the user's existing ingredient if they already have this
+        one
+        """
+        normalized = normalize_ingredient_name(validated_data['name'])
+        existing = Ingredient.objects.filter(
+            user=validated_data['user'], catalog__normalized=normalized
+        ).first()
+        return existing or super().create(validated_data)
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """many related field that looks up all of its pks in one query instead
+    of one query each
+    """
+    default_error_messages = {
+        'does_not_exist': _(
+            'Invalid pk(s) "{pk_values}" - object does not exist.'
+        ),
+    }
+    # pk => object for a whole batch, set by BulkListSerializer while it
+    # validates its items
+    resolved = None
+
+    def resolve(self, values):
+        """look up every valid pk in values (a list of pks each) with one
+        query; bad ones are left to to_internal_value
+        """
+        pk_field = self.child_relation.get_queryset().model._meta.pk
+        pks = set()
+        for value in values:
+            if isinstance(value, str) or not hasattr(value, '__iter__'):
+                continue
+            for item in value:
+                try:
+                    pks.add(pk_field.to_python(item))
+                except (DjangoValidationError, TypeError):
+                    pass
+        return self.child_relation.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        queryset = self.child_relation.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            try:
+                pk = pk_field.to_python(item)
+            except DjangoValidationError:
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+            if pk not in pks:
+                pks.append(pk)
+        found = self.resolved
+        if found is None:
+            found = queryset.in_bulk(pks)
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            # report every bad pk at once instead of stopping at the first
+            self.fail(
+                'does_not_exist',
+                pk_values=', '.join(str(pk) for pk in missing)
+            )
+        return [found[pk] for pk in pks]
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """pk related field that only accepts objects owned by the requesting user
+
+    with many=True all the pks are checked with a single query (see
+    BatchedManyRelatedField)
+    """
 
-class RecipeSerializer(serializers.ModelSerializer):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()
+        # otherwise you could attach someone else's tag to your recipe by
+        # guessing its id
+        return queryset.filter(user=request.user)
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+def _param_names(request, param):
+    # GET rather than query_params so a plain django request (i.e. in tests)
+    # works too
+    value = request.GET.get(param, '') if request is not None else ''
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def requested_fields(request, serializer_class):
+    """return (fields, expand) asked for with
+    ?fields=id,title&expand=tags,ingredients
+
+    fields is None when every field is wanted; only GETs are sparse so expand
+    can never swap out a writable field
+    """
+    if request is None or request.method != 'GET':
+        return None, set()
+    fields = _param_names(request, FIELDS_PARAM)
+    unknown = set(fields) - set(serializer_class.Meta.fields)
+    if unknown:
+        raise serializers.ValidationError({
+            FIELDS_PARAM: [
+                _('Unknown fields: %s.') % ', '.join(sorted(unknown))
+            ]
+        })
+    expand = set(_param_names(request, EXPAND_PARAM))
+    unknown = expand - set(serializer_class.expandable)
+    if unknown:
+        raise serializers.ValidationError({
+            EXPAND_PARAM: [
+                _('Cannot expand: %s.') % ', '.join(sorted(unknown))
+            ]
+        })
+    fields = set(fields) | {'id'} if fields else None
+    if fields is not None:
+        # nothing to expand if it isnt rendered
+        expand &= fields
+    return fields, expand
+
+class SparseFieldsMixin(serializers.Serializer):
+    """render only the ?fields= asked for and nest the ?expand= relations
+    instead of listing their ids
+    """
+    # relation field => serializer used to nest it
+    expandable = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = requested_fields(
+            self.context.get('request'), type(self)
+        )
+        for name in expand:
+            fields[name] = self.expandable[name](many=True, read_only=True)
+        if only is not None:
+            for name in set(fields) - only:
+                fields.pop(name)
+        return fields
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """serialize a recipe"""
     # creates a pk related field and allow many and the qset that will be all the ingredients
     #list ingredients with the ids 
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
     
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
+    expandable = {'tags': TagSerializer, 'ingredients': IngredientSerializer}
     
     class Meta:
         model = Recipe
         fields=('id', 'title', 'tags', 'ingredients', 'time_minutes', 'price', 'link')
         read_only_fields = ('id',)
+        list_serializer_class = BulkListSerializer
 
 class RecipeDetailSerializer(RecipeSerializer):
     """serialize a recipe detail"""
     # cant create a recipe b/c read_only is True
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    
+    class Meta(RecipeSerializer.Meta):
+        # the image variants are filled in in the background after an upload;
+        # null until image_status is ready
+        fields = RecipeSerializer.Meta.fields + (
+            'image', 'image_thumbnail', 'image_webp', 'image_width',
+            'image_height', 'image_status'
+        )
+        read_only_fields = fields
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """serializer for uploading images to recipes"""
@@ -48,5 +425,5 @@ class RecipeImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         # this serializer is only for images therefore only needs the id and image fields
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
\ No newline at end of file
+        fields = ('id', 'image', 'image_status')
+        read_only_fields = ('id', 'image_status')
\ No newline at end of file
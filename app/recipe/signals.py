@@ -0,0 +1,261 @@
+import functools
+from decimal import Decimal
+import threading
+from contextlib import contextmanager
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_delete, m2m_changed
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from core.models import Tag, Ingredient, Recipe
+from recipe import cache, stats
+
+_state = threading.local()
+
+
+@contextmanager
+def suppressed():
+    """skip the recipe/tag/ingredient handlers below for the current thread
+
+    used by the bulk endpoints which do the same work once for the whole
+    batch (see touch_related)
+    """
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def unless_suppressed(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, 'suppressed', False):
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user(sender, instance, created=True, **kwargs):
+    """start a new user (or one that was deleted) with an empty cache"""
+    # ids can get reused (e.g. sqlite) so never let a new user see old entries
+    if created:
+        cache.invalidate(instance.pk, *cache.RESOURCES)
+
+
+@receiver(post_save, sender=Recipe)
+@unless_suppressed
+def invalidate_recipe_saved(sender, instance, **kwargs):
+    cache.invalidate(instance.user_id, cache.RECIPES)
+
+
+@receiver(post_delete, sender=Recipe)
+@unless_suppressed
+def invalidate_recipe_deleted(sender, instance, **kwargs):
+    # deleting a recipe also removes its tags/ingredients links which changes
+    # ?assigned_only=1
+    cache.invalidate(instance.user_id, *cache.RESOURCES)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@unless_suppressed
+def invalidate_tag(sender, instance, **kwargs):
+    # recipe details have the tag names nested in them
+    cache.invalidate(instance.user_id, cache.TAGS, cache.RECIPES)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@unless_suppressed
+def invalidate_ingredient(sender, instance, **kwargs):
+    cache.invalidate(instance.user_id, cache.INGREDIENTS, cache.RECIPES)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@unless_suppressed
+def invalidate_recipe_tags(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        cache.invalidate(instance.user_id, cache.RECIPES, cache.TAGS)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@unless_suppressed
+def invalidate_recipe_ingredients(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        cache.invalidate(instance.user_id, cache.RECIPES, cache.INGREDIENTS)
+
+
+# updated_at is what the etags are built from so it has to change whenever
+# what the api returns for an object changes, not just when the row itself is
+# saved. queryset.update() is used so this doesnt fire post_save again
+
+
+def touch(queryset):
+    """bump updated_at on every object in the queryset"""
+    queryset.update(updated_at=timezone.now())
+
+
+def _link_field(through, model):
+    """return the name of the fk on a m2m table that points at model"""
+    for field in through._meta.get_fields():
+        if field.is_relation and field.related_model is model:
+            return field.name
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@unless_suppressed
+def touch_m2m(sender, instance, action, model, pk_set, **kwargs):
+    """bump both sides of a recipe <-> tag/ingredient link when it changes"""
+    if action in ('post_add', 'post_remove'):
+        touch(type(instance).objects.filter(pk=instance.pk))
+        touch(model.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        # pk_set is None for clear so touch the other side before the links
+        # are gone
+        links = sender.objects.filter(
+            **{_link_field(sender, type(instance)): instance}
+        )
+        touch(model.objects.filter(
+            pk__in=links.values(f'{_link_field(sender, model)}_id')
+        ))
+    elif action == 'post_clear':
+        touch(type(instance).objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@unless_suppressed
+def touch_recipes_of_renamed(sender, instance, created, **kwargs):
+    """recipe details nest tag/ingredient names so a rename changes the
+    recipe
+    """
+    if not created:
+        touch(instance.recipe_set.all())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+@unless_suppressed
+def touch_recipes_of_deleted(sender, instance, **kwargs):
+    touch(instance.recipe_set.all())
+
+
+@receiver(pre_delete, sender=Recipe)
+@unless_suppressed
+def touch_attrs_of_deleted_recipe(sender, instance, **kwargs):
+    """deleting a recipe can drop its tags/ingredients out of
+    ?assigned_only=1
+    """
+    touch(instance.tags.all())
+    touch(instance.ingredients.all())
+
+
+def touch_related(model, pks):
+    """bump updated_at on everything linked to the given
+    recipes/tags/ingredients
+    """
+    if model is Recipe:
+        touch(Tag.objects.filter(recipe__in=pks))
+        touch(Ingredient.objects.filter(recipe__in=pks))
+    else:
+        touch(Recipe.objects.filter(**{
+            f'{model._meta.model_name}s__in': pks
+        }))
+
+
+# the RecipeStats counters on tags/ingredients. these run inside the
+# transaction of the change that fires them (m2m add/remove/clear are atomic)
+# so the counts cant drift from the links. the bulk endpoints recompute the
+# affected rows with stats.refresh instead
+
+
+def _recipe_numbers(recipe, sign):
+    return sign * recipe.time_minutes, sign * Decimal(str(recipe.price))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@unless_suppressed
+def update_stats_m2m(sender, instance, action, reverse, model, pk_set,
+                     **kwargs):
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    # pre_ for removing so only the links that really exist (and are about to
+    # go) are counted
+    sign = 1 if action == 'post_add' else -1
+    links = sender.objects.filter(
+        **{_link_field(sender, type(instance)): instance}
+    )
+    other_id = f'{_link_field(sender, model)}_id'
+    if action == 'pre_remove':
+        links = links.filter(**{f'{other_id}__in': pk_set})
+    if not reverse:
+        # recipe.tags.add(...); instance is the recipe
+        if action == 'post_add':
+            pks = pk_set
+        else:
+            pks = set(links.values_list(other_id, flat=True))
+        # each of the tags gains/loses this one recipe
+        stats.change(model, pks, sign, *_recipe_numbers(instance, sign))
+    else:
+        # tag.recipe_set.add(...); instance is the tag/ingredient
+        if action == 'post_add':
+            recipes = Recipe.objects.filter(pk__in=pk_set)
+        else:
+            recipes = Recipe.objects.filter(pk__in=links.values('recipe_id'))
+        count, time_minutes, price = stats.totals(recipes)
+        stats.change(
+            type(instance),
+            [instance.pk],
+            sign * count,
+            sign * time_minutes,
+            sign * price
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+@unless_suppressed
+def update_stats_recipe_deleted(sender, instance, **kwargs):
+    """the links of a deleted recipe are removed without m2m_changed"""
+    for model, pks in stats.linked(Recipe, [instance.pk]).items():
+        stats.change(model, pks, -1, *_recipe_numbers(instance, -1))
+
+
+def _changes_numbers(update_fields):
+    return (
+        update_fields is None
+        or {'time_minutes', 'price'} & set(update_fields)
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+@unless_suppressed
+def remember_recipe_numbers(sender, instance, update_fields=None, **kwargs):
+    instance._saved_numbers = None
+    if instance.pk is not None and _changes_numbers(update_fields):
+        instance._saved_numbers = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('time_minutes', 'price').first()
+
+
+@receiver(post_save, sender=Recipe)
+@unless_suppressed
+def update_stats_recipe_saved(sender, instance, created, **kwargs):
+    """move the tags/ingredients totals by however much the recipe's
+    time/price changed
+    """
+    saved = getattr(instance, '_saved_numbers', None)
+    if created or not saved:
+        return
+    time_minutes = instance.time_minutes - saved[0]
+    price = Decimal(str(instance.price)) - saved[1]
+    if time_minutes or price:
+        for model, pks in stats.linked(Recipe, [instance.pk]).items():
+            stats.change(model, pks, 0, time_minutes, price)
+        # the tag/ingredient lists can show the averages
+        cache.invalidate(instance.user_id, cache.TAGS, cache.INGREDIENTS)
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import (
+    Count, F, IntegerField, DecimalField, Subquery, OuterRef, Sum, Value
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.models import Tag, Ingredient, Recipe
+
+# the models with RecipeStats counters and the m2m field on Recipe that links
+# them
+STATS_FIELDS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+def change(model, pks, count, time_minutes, price):
+    """add to (or take away from with negative numbers) the counters of the
+    tags/ingredients in pks
+
+    one UPDATE with F() so concurrent changes to the same tag cant lose each
+    other's counts
+    """
+    if not pks or not (count or time_minutes or price):
+        return
+    model.objects.filter(pk__in=pks).update(
+        recipe_count=F('recipe_count') + count,
+        total_time_minutes=F('total_time_minutes') + time_minutes,
+        total_price=F('total_price') + Decimal(str(price)),
+        updated_at=timezone.now()
+    )
+
+
+def totals(recipes):
+    """return (count, total time, total price) of a recipe queryset"""
+    result = recipes.aggregate(
+        count=Count('id'), time_minutes=Sum('time_minutes'), price=Sum('price')
+    )
+    return result['count'], result['time_minutes'] or 0, result['price'] or 0
+
+
+def linked(model, pks):
+    """return {Tag: tag pks, Ingredient: ingredient pks} on the recipes in
+    pks (nothing for other models)
+    """
+    if model is not Recipe:
+        return {}
+    return {
+        stats_model: set(
+            Recipe._meta.get_field(field).remote_field.through.objects.filter(
+                recipe_id__in=pks
+            ).values_list(f'{stats_model._meta.model_name}_id', flat=True)
+        )
+        for stats_model, field in STATS_FIELDS.items()
+    }
+
+
+def refresh(model, pks):
+    """recompute the counters of the tags/ingredients in pks from their
+    recipes
+    """
+    through = Recipe._meta.get_field(STATS_FIELDS[model]).remote_field.through
+    fk = f'{model._meta.model_name}_id'
+    links = through.objects.filter(
+        **{fk: OuterRef('pk')}
+    ).order_by().values(fk)
+
+    def aggregate(expression, output_field):
+        return Coalesce(
+            Subquery(
+                links.annotate(value=expression).values('value'),
+                output_field=output_field
+            ),
+            Value(0),
+            output_field=output_field
+        )
+
+    pks = list(pks)
+    batch_size = settings.API_BULK_BATCH_SIZE
+    for i in range(0, len(pks), batch_size):
+        model.objects.filter(pk__in=pks[i:i + batch_size]).update(
+            recipe_count=aggregate(Count('recipe_id'), IntegerField()),
+            total_time_minutes=aggregate(
+                Sum('recipe__time_minutes'), IntegerField()
+            ),
+            total_price=aggregate(
+                Sum('recipe__price'),
+                DecimalField(max_digits=14, decimal_places=2)
+            ),
+            updated_at=timezone.now()
+        )
+
+
+def refresh_linked(stale):
+    """refresh every {model: pks} returned by linked"""
+    for model, pks in stale.items():
+        refresh(model, pks)
@@ -38,7 +38,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         "test that get requests only get ingredients belonging to the user"
@@ -51,8 +51,8 @@ class PrivateIngredientsApiTests(TestCase):
         ingredient = Ingredient.objects.create(user=self.user, name='Salt')
         res = self.client.get(INGREDIENTS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
         
     def test_create_ingredient_successful(self):
         payload = {'name': 'cabbage'}
@@ -82,8 +82,8 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, res.data) 
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results']) 
+        self.assertNotIn(serializer2.data, res.data['results'])
     
     def test_retrieve_ingredients_assigned_unique(self):
         """test filtering ingredients by assgined recipe returns unique items"""
@@ -106,4 +106,70 @@ class PrivateIngredientsApiTests(TestCase):
         
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
         
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']), 1)
+    def test_autocomplete_ingredients(self):
+        """test autocomplete finds the user's ingredients by what was typed"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Sea salt')
+        Ingredient.objects.create(user=self.user, name='Pepper')
+
+        res = self.client.get(
+            reverse('recipe:ingredient-autocomplete'), {'q': 'sal'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([i['name'] for i in res.data], ['Salt', 'Sea salt'])
+
+    def test_create_existing_ingredient_returns_it(self):
+        """test creating an ingredient the user already has returns it"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Sea salt')
+
+        res = self.client.post(INGREDIENTS_URL, {'name': 'sea  SALT'})
+
+        self.assertEqual(res.data, {'id': ingredient.id, 'name': 'Sea salt'})
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_create_ingredients_deduplicated(self):
+        """test bulk created ingredients are merged with existing ones"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(
+            reverse('recipe:ingredient-bulk'),
+            [{'name': 'salt'}, {'name': 'Pepper'}, {'name': 'PEPPER'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        ids = [ingredient['id'] for ingredient in res.data]
+        self.assertEqual(ids[0], salt.id)
+        self.assertEqual(ids[1], ids[2])
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_rename_ingredient_to_existing_fails(self):
+        """test an ingredient cant be renamed to another of the user's"""
+        Ingredient.objects.create(user=self.user, name='Salt')
+        pepper = Ingredient.objects.create(user=self.user, name='Pepper')
+
+        res = self.client.patch(
+            reverse('recipe:ingredient-bulk'),
+            [{'id': pepper.id, 'name': 'SALT'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        pepper.refresh_from_db()
+        self.assertEqual(pepper.name, 'Pepper')
+
+    def test_bulk_rename_ingredient(self):
+        """test renaming an ingredient moves it to the new catalog entry"""
+        pepper = Ingredient.objects.create(user=self.user, name='Pepper')
+
+        res = self.client.patch(
+            reverse('recipe:ingredient-bulk'),
+            [{'id': pepper.id, 'name': 'Black pepper'}],
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pepper.refresh_from_db()
+        self.assertEqual(pepper.catalog.normalized, 'black pepper')
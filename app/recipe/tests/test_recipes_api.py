@@ -1,19 +1,33 @@
 # allows u to make temp files
+import io
 import tempfile
+from decimal import Decimal
 import os
+from unittest import skipUnless
+from unittest.mock import patch
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Recipe, Tag, Ingredient
+from recipe import cache as response_cache, images
+from recipe.pagination import RecipeSearchCursorPagination
+from recipe.search import prefix_tsquery, search_recipes, search_words
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 # -list indicates that we using the listing api for functionality; i.e. we using dat listviewset
 # /api/recipe/recipes
 RECIPES_URL = reverse('recipe:recipe-list')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
 
 def image_upload_url(recipe_id):
     """return image upload url"""
@@ -71,7 +85,7 @@ class PrivateRecipeApiTests(TestCase):
         # want 2 return data s list so we have to add many=True
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
         
     def test_recipes_limited_to_user(self):
         user2 = get_user_model().objects.create_user(
@@ -87,7 +101,7 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(recipes), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_view_recipe_detail(self):
         """test viewing a recipe detail"""
@@ -154,6 +168,63 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
     
+    def test_create_recipe_validates_ingredients_in_one_query(self):
+        """test the ingredient ids are checked with one query however many"""
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            for i in range(10)
+        ]
+        payload = {
+            'title': 'Stew',
+            'tags': [],
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'time_minutes': 60,
+            'price': '20.00'
+        }
+        serializer = RecipeSerializer(
+            data=payload,
+            context={'request': APIRequestFactory().get('/')}
+        )
+        serializer.context['request'].user = self.user
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(
+            serializer.validated_data['ingredients'], ingredients
+        )
+
+    def test_create_recipe_other_users_tag_rejected(self):
+        """test you cant add another user's tag to your recipe"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        tag = sample_tag(user=user2)
+        payload = {
+            'title': 'Avocaddd',
+            'tags': [tag.id],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_recipe_reports_all_missing_tags(self):
+        """test every missing tag id is reported in one error"""
+        tag = sample_tag(user=self.user)
+        payload = {
+            'title': 'Avocaddd',
+            'tags': [tag.id, 9998, 9999],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('9998, 9999', res.data['tags'][0])
+
     def test_partial_update_recipe(self):
         """updating with patch (used for updating fields in payload)"""
         recipe = sample_recipe(user=self.user)
@@ -194,6 +265,829 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+class RecipeFilterTests(TestCase):
+    """test the any/all tag and ingredient filters"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.salt = sample_ingredient(user=self.user, name='Salt')
+        self.both = sample_recipe(user=self.user, title='Salad')
+        self.both.tags.add(self.vegan, self.quick)
+        self.both.ingredients.add(self.salt)
+        self.vegan_only = sample_recipe(user=self.user, title='Tofu')
+        self.vegan_only.tags.add(self.vegan)
+
+    def _ids(self, res):
+        return {recipe['id'] for recipe in res.data['results']}
+
+    def test_filter_tags_any_unique(self):
+        """test matching any tag returns each recipe once"""
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id},{self.quick.id}'}
+        )
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(set(ids), {self.both.id, self.vegan_only.id})
+
+    def test_filter_tags_all(self):
+        """test matching all tags only returns recipes with every tag"""
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{self.vegan.id},{self.quick.id}',
+            'tags_match': 'all'
+        })
+
+        self.assertEqual(self._ids(res), {self.both.id})
+
+    def test_filter_tags_and_ingredients_unique(self):
+        """test filtering by tags and ingredients doesnt duplicate recipes"""
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{self.vegan.id},{self.quick.id}',
+            'ingredients': f'{self.salt.id}'
+        })
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(self._ids(res), {self.both.id})
+
+    def test_filter_invalid_match_mode(self):
+        """test an unknown match mode is a bad request"""
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id}', 'tags_match': 'some'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_invalid_ids(self):
+        """test non numeric ids are a bad request"""
+        res = self.client.get(RECIPES_URL, {'ingredients': 'salt'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RecipeSearchTests(TestCase):
+    """test searching recipes by title, tag and ingredient names"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.soup = sample_recipe(user=self.user, title='Chicken soup')
+        self.curry = sample_recipe(user=self.user, title='Green curry')
+        self.curry.ingredients.add(
+            sample_ingredient(user=self.user, name='Chicken')
+        )
+        self.salad = sample_recipe(user=self.user, title='Salad')
+        self.salad.tags.add(sample_tag(user=self.user, name='Vegan'))
+
+    def _ids(self, res):
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_title_tags_and_ingredients(self):
+        """test a search matches titles, then tag/ingredient names"""
+        res = self.client.get(RECIPES_URL, {'search': 'chicken'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._ids(res), [self.soup.id, self.curry.id])
+
+        res = self.client.get(RECIPES_URL, {'search': 'vegan'})
+        self.assertEqual(self._ids(res), [self.salad.id])
+
+    def test_search_prefix_and_every_word(self):
+        """test every word has to match and words match as prefixes"""
+        res = self.client.get(RECIPES_URL, {'search': 'chick cur'})
+
+        self.assertEqual(self._ids(res), [self.curry.id])
+
+    def test_search_ignores_query_syntax(self):
+        """test tsquery operators in a search are treated as plain text"""
+        res = self.client.get(RECIPES_URL, {'search': "soup & !(:*'"})
+
+        self.assertEqual(self._ids(res), [self.soup.id])
+
+    def test_search_limited_to_user(self):
+        """test other users' recipes are never found"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        sample_recipe(user=user2, title='Chicken pie')
+
+        res = self.client.get(RECIPES_URL, {'search': 'chicken'})
+
+        self.assertEqual(self._ids(res), [self.soup.id, self.curry.id])
+
+    def test_search_paginated(self):
+        """test search results can be paged through with the cursor"""
+        for i in range(3):
+            sample_recipe(user=self.user, title=f'Chicken {i}')
+
+        res = self.client.get(
+            RECIPES_URL, {'search': 'chicken', 'page_size': 2}
+        )
+        ids = self._ids(res)
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += self._ids(res)
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(ids[-1], self.curry.id)
+
+    def _page_through(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        ids = self._ids(res)
+        # bounded so paging that repeats rows fails instead of never ending
+        while res.data['next'] and len(ids) <= Recipe.objects.count():
+            res = self.client.get(res.data['next'])
+            ids += self._ids(res)
+        return ids
+
+    @patch.object(RecipeSearchCursorPagination, 'offset_cutoff', 1)
+    def test_search_paginated_tied_ranks(self):
+        """test tied ranks across pages come once each in rank, id order"""
+        for i in range(5):
+            sample_recipe(user=self.user, title='Chicken pie')
+
+        ids = self._page_through({'search': 'chicken', 'page_size': 2})
+
+        expected = search_recipes(
+            Recipe.objects.filter(user=self.user), 'chicken'
+        ).order_by('-rank', '-id')
+        self.assertEqual(ids, [recipe.id for recipe in expected])
+
+    @skipUnless(connection.vendor == 'postgresql', 'ts_rank needs postgres')
+    def test_search_paginated_tied_ts_rank(self):
+        """test recipes with the same ts_rank page exactly on postgres"""
+        recipes = [
+            sample_recipe(user=self.user, title='Pumpkin pie')
+            for _ in range(5)
+        ]
+
+        ids = self._page_through({'search': 'pumpkin', 'page_size': 2})
+
+        self.assertEqual(
+            ids, sorted((recipe.id for recipe in recipes), reverse=True)
+        )
+
+    def test_prefix_tsquery(self):
+        """test the postgres query matches every word as a prefix"""
+        self.assertEqual(
+            prefix_tsquery(search_words("chicken & so'up")),
+            'chicken:* & so:* & up:*'
+        )
+
+class RecipeStatsTests(TestCase):
+    """test the recipe counts and totals kept on tags and ingredients"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+        self.quick = sample_recipe(
+            user=self.user, time_minutes=10, price=Decimal('4.00')
+        )
+        self.slow = sample_recipe(
+            user=self.user, time_minutes=50, price=Decimal('6.50')
+        )
+
+    def assertStats(self, obj, count, time_minutes, price):
+        obj.refresh_from_db()
+        self.assertEqual(
+            (obj.recipe_count, obj.total_time_minutes, obj.total_price),
+            (count, time_minutes, Decimal(price))
+        )
+
+    def test_stats_follow_links(self):
+        """test adding and removing links from either side keeps the counts"""
+        self.quick.tags.add(self.tag)
+        self.slow.tags.add(self.tag)
+        self.quick.ingredients.add(self.ingredient)
+        self.assertStats(self.tag, 2, 60, '10.50')
+        self.assertStats(self.ingredient, 1, 10, '4.00')
+
+        # removing something that isnt linked changes nothing
+        self.quick.ingredients.remove(
+            sample_ingredient(user=self.user, name='Salt')
+        )
+        self.quick.tags.remove(self.tag)
+        self.assertStats(self.tag, 1, 50, '6.50')
+
+        self.tag.recipe_set.add(self.quick)
+        self.assertStats(self.tag, 2, 60, '10.50')
+        self.tag.recipe_set.remove(self.slow)
+        self.assertStats(self.tag, 1, 10, '4.00')
+
+        self.quick.tags.clear()
+        self.assertStats(self.tag, 0, 0, '0')
+
+    def test_stats_follow_recipe_changes(self):
+        """test changing or deleting a recipe updates its tags"""
+        self.quick.tags.add(self.tag)
+        self.slow.tags.add(self.tag)
+
+        self.slow.time_minutes = 30
+        self.slow.price = Decimal('1.50')
+        self.slow.save()
+        self.assertStats(self.tag, 2, 40, '5.50')
+
+        self.slow.delete()
+        self.assertStats(self.tag, 1, 10, '4.00')
+
+    def test_stats_follow_bulk_changes(self):
+        """test the bulk endpoint recounts the tags/ingredients it touches"""
+        self.quick.tags.add(self.tag)
+        payload = [
+            {
+                'title': f'Recipe {i}', 'time_minutes': 20, 'price': '2.00',
+                'tags': [self.tag.id], 'ingredients': [self.ingredient.id]
+            }
+            for i in range(2)
+        ]
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+        self.assertStats(self.tag, 3, 50, '8.00')
+        self.assertStats(self.ingredient, 2, 40, '4.00')
+
+        self.client.patch(
+            RECIPES_BULK_URL,
+            [{'id': self.quick.id, 'tags': []}],
+            format='json'
+        )
+        self.assertStats(self.tag, 2, 40, '4.00')
+
+        self.client.delete(
+            RECIPES_BULK_URL, [res.data[0]['id']], format='json'
+        )
+        self.assertStats(self.tag, 1, 20, '2.00')
+        self.assertStats(self.ingredient, 1, 20, '2.00')
+
+    def test_stats_fields_optional(self):
+        """test the tag list only has the stats when asked for"""
+        self.quick.tags.add(self.tag)
+        self.slow.tags.add(self.tag)
+        url = reverse('recipe:tag-list')
+
+        res = self.client.get(url)
+        self.assertNotIn('recipe_count', res.data['results'][0])
+
+        res = self.client.get(url, {'stats': 1})
+        self.assertEqual(res.data['results'][0]['recipe_count'], 2)
+        self.assertEqual(res.data['results'][0]['avg_time_minutes'], 30)
+        self.assertEqual(res.data['results'][0]['avg_price'], '5.25')
+
+class RecipeCacheTests(TestCase):
+    """test the per user response cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_repeat_list_served_from_cache(self):
+        """test listing the same recipes again only runs the etag query"""
+        res1 = self.client.get(RECIPES_URL)
+        with self.assertNumQueries(1):
+            res2 = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res1.data, res2.data)
+
+    def test_query_params_normalized(self):
+        """test the order of the query params doesnt matter"""
+        self.client.get(RECIPES_URL, {'page_size': 5, 'tags_match': 'any'})
+        with self.assertNumQueries(1):
+            self.client.get(f'{RECIPES_URL}?tags_match=any&page_size=5')
+
+    def test_recipe_update_invalidates(self):
+        """test editing a recipe busts the cached list and detail"""
+        url = detail_url(self.recipe.id)
+        self.client.get(RECIPES_URL)
+        self.client.get(url)
+
+        self.client.patch(url, {'title': 'New title'})
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data['results'][0]['title'], 'New title')
+        res = self.client.get(url)
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_tag_changes_invalidate_recipe_detail(self):
+        """test attaching and renaming a tag busts the cached detail"""
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+        tag = sample_tag(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+
+        res = self.client.get(url)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegan')
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(url)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_other_users_changes_dont_invalidate(self):
+        """test another user's writes dont bust this user's cache"""
+        self.client.get(RECIPES_URL)
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        sample_recipe(user=user2)
+
+        with self.assertNumQueries(1):
+            self.client.get(RECIPES_URL)
+
+class RecipeBulkTests(TestCase):
+    """test the recipes bulk endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def test_bulk_create(self):
+        """test creating many recipes with their tags and ingredients"""
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [self.tag.id],
+                'ingredients': [self.ingredient.id]
+            }
+            for i in range(3)
+        ]
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [self.tag])
+            self.assertEqual(list(recipe.ingredients.all()), [self.ingredient])
+        self.assertEqual(res.data[0]['tags'], [self.tag.id])
+
+    def test_bulk_create_invalid_writes_nothing(self):
+        """test one bad item means none of the recipes are created"""
+        payload = [
+            {'title': 'Good', 'time_minutes': 10, 'price': '5.00'},
+            {'title': 'Bad', 'price': '5.00'}
+        ]
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        """test patching many recipes at once"""
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        recipe2.tags.add(self.tag)
+        new_tag = sample_tag(user=self.user, name='New')
+        payload = [
+            {'id': recipe1.id, 'title': 'First'},
+            {'id': recipe2.id, 'tags': [new_tag.id]}
+        ]
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        self.assertEqual(recipe1.title, 'First')
+        self.assertEqual(list(recipe2.tags.all()), [new_tag])
+
+    def test_bulk_update_invalidates_cache(self):
+        """test the cached list doesnt go stale after a bulk update"""
+        recipe = sample_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(
+            RECIPES_BULK_URL,
+            [{'id': recipe.id, 'title': 'Bulk'}],
+            format='json'
+        )
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data['results'][0]['title'], 'Bulk')
+
+    def test_bulk_delete(self):
+        """test deleting many recipes at once"""
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        keep = sample_recipe(user=self.user)
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, [recipe1.id, recipe2.id], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recipe.objects.all()), [keep])
+
+    def test_bulk_validation_queries_flat(self):
+        """test the tags/ingredients of every item are looked up together"""
+        recipes = [sample_recipe(user=self.user) for i in range(10)]
+        tag2 = sample_tag(user=self.user, name='Dessert')
+
+        def patch_recipes(count):
+            payload = [
+                {
+                    'id': recipe.id,
+                    'tags': [self.tag.id, tag2.id],
+                    'ingredients': [self.ingredient.id]
+                }
+                for recipe in recipes[:count]
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.patch(
+                    RECIPES_BULK_URL, payload, format='json'
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(patch_recipes(1), patch_recipes(10))
+
+    def test_bulk_bool_ids_rejected(self):
+        """test true/false arent taken as the ids 1 and 0"""
+        recipe = sample_recipe(user=self.user, id=1)
+
+        res = self.client.delete(RECIPES_BULK_URL, [True], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_other_users_recipes_rejected(self):
+        """test you cant bulk update or delete another user's recipes"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        recipe = sample_recipe(user=user2)
+
+        res = self.client.delete(RECIPES_BULK_URL, [recipe.id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['missing'], [str(recipe.id)])
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+class RecipeCacheCommitTests(TransactionTestCase):
+    """test the cache is invalidated again once a change commits"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.recipe = sample_recipe(user=self.user)
+
+    def _list_key(self):
+        return response_cache.response_key(
+            self.user.pk,
+            response_cache.RECIPES,
+            'list',
+            RECIPES_URL,
+            QueryDict()
+        )
+
+    def test_cached_before_commit_not_served(self):
+        """test a response cached before the change committed isnt served"""
+        with transaction.atomic():
+            self.recipe.title = 'New title'
+            self.recipe.save()
+            # what a concurrent request that read before the commit would
+            # cache its response under
+            stale_key = self._list_key()
+
+        self.assertNotEqual(self._list_key(), stale_key)
+
+    def test_rolled_back_change(self):
+        """test nothing waits for a commit that never happens"""
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.recipe.save()
+            key = self._list_key()
+            raise ValueError
+
+        self.assertEqual(self._list_key(), key)
+
+class RecipeConditionalGetTests(TestCase):
+    """test the ETag/Last-Modified support"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """test sending back the etag gets a 304 with no body"""
+        res = self.client.get(RECIPES_URL)
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+
+        # only the etag query runs
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_detail_if_modified_since(self):
+        """test If-Modified-Since is answered with a 304"""
+        url = detail_url(self.recipe.id)
+        res = self.client.get(url)
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_bad_id_not_found(self):
+        """test an id that isnt a number is a 404"""
+        res = self.client.get('/api/recipe/recipes/abc/')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_changes_etag(self):
+        """test editing the recipe changes the etag"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(url, {'title': 'New title'})
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'New title')
+
+    def test_tag_rename_changes_recipe_etag(self):
+        """test renaming a tag on a recipe changes the recipe's etag"""
+        tag = sample_tag(user=self.user)
+        self.recipe.tags.add(tag)
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        tag.name = 'Renamed'
+        tag.save()
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_changes_list_etag(self):
+        """test deleting a recipe changes the list etag"""
+        newer = sample_recipe(user=self.user, title='Newer')
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        self.recipe.delete()
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['id'], newer.id)
+
+class RecipePaginationTests(TestCase):
+    """test paging through the recipes with a cursor"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_paginated_by_cursor(self):
+        """test following the next links returns every recipe once"""
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['previous'])
+
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [recipe['id'] for recipe in res.data['results']]
+
+        expected = Recipe.objects.filter(user=self.user).order_by('-id')
+        self.assertEqual(ids, [recipe.id for recipe in expected])
+
+    @patch('recipe.pagination.RecipeCursorPagination.max_page_size', 3)
+    def test_page_size_capped(self):
+        """test that clients cant ask for more than the max page size"""
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIsNotNone(res.data['next'])
+
+class RecipeQueryCountTests(TestCase):
+    """test that the recipe endpoints dont do a query per recipe"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _create_recipes(self, count):
+        """create recipes that each have a tag and an ingredient"""
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            # a user can only have each ingredient once so name it after the
+            # recipe
+            recipe.ingredients.add(sample_ingredient(
+                user=self.user, name=f'Ingredient {recipe.id}'
+            ))
+
+    def test_list_recipes_constant_queries(self):
+        """test listing 1 or many recipes costs the same number of queries"""
+        self._create_recipes(1)
+        # 1 for the etag, 1 for the recipes, 1 for the tags and 1 for the
+        # ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 1)
+
+        self._create_recipes(10)
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 11)
+
+    def test_list_recipes_data_unchanged(self):
+        """test the optimized list returns the same data as the serializer"""
+        self._create_recipes(3)
+        res = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_retrieve_recipe_constant_queries(self):
+        """test the recipe detail doesnt query per tag or ingredient"""
+        recipe = sample_recipe(user=self.user)
+        for i in range(5):
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        serializer = RecipeDetailSerializer(recipe)
+        self.assertEqual(res.data, serializer.data)
+
+class RecipeSparseFieldsTests(TestCase):
+    """test ?fields= and ?expand= on the recipe endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def test_list_only_requested_fields(self):
+        """test a list can be stripped to a few fields"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data['results'],
+            [{'id': self.recipe.id, 'title': self.recipe.title}]
+        )
+
+    def test_list_fields_always_has_id(self):
+        """test the id is rendered even when it isnt asked for"""
+        res = self.client.get(RECIPES_URL, {'fields': 'title'})
+
+        self.assertEqual(set(res.data['results'][0]), {'id', 'title'})
+
+    def test_list_expand(self):
+        """test tags and ingredients can be nested in a list"""
+        res = self.client.get(RECIPES_URL, {'expand': 'tags,ingredients'})
+
+        result = res.data['results'][0]
+        self.assertEqual(
+            result['tags'], [{'id': self.tag.id, 'name': self.tag.name}]
+        )
+        self.assertEqual(
+            result['ingredients'],
+            [{'id': self.ingredient.id, 'name': self.ingredient.name}]
+        )
+        self.assertIn('time_minutes', result)
+
+    def test_list_expand_with_stats(self):
+        """test expanded tags can have their stats"""
+        res = self.client.get(
+            RECIPES_URL, {'fields': 'tags', 'expand': 'tags', 'stats': '1'}
+        )
+
+        tag = res.data['results'][0]['tags'][0]
+        self.assertEqual(tag['recipe_count'], 1)
+        self.assertEqual(tag['avg_time_minutes'], 10)
+
+    def test_expand_only_requested_fields(self):
+        """test expanding a relation that isnt in fields doesnt add it"""
+        res = self.client.get(
+            RECIPES_URL, {'fields': 'title', 'expand': 'tags'}
+        )
+
+        self.assertEqual(set(res.data['results'][0]), {'id', 'title'})
+
+    def test_retrieve_only_requested_fields(self):
+        """test the detail can be stripped too"""
+        res = self.client.get(
+            detail_url(self.recipe.id), {'fields': 'title,tags,image_status'}
+        )
+
+        self.assertEqual(
+            set(res.data), {'id', 'title', 'tags', 'image_status'}
+        )
+        self.assertEqual(res.data['tags'][0]['name'], self.tag.name)
+
+    def test_unknown_fields_rejected(self):
+        """test asking for fields or expansions that dont exist is a 400"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,user'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(RECIPES_URL, {'expand': 'link'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
+
+    def test_sparse_list_constant_queries(self):
+        """test sparse and expanded lists dont query per recipe"""
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+
+        # 1 for the etag and 1 for the recipes
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+        self.assertEqual(len(res.data['results']), 6)
+
+        # and 1 for the tags
+        with self.assertNumQueries(3):
+            self.client.get(
+                RECIPES_URL,
+                {'fields': 'title,tags', 'expand': 'tags', 'stats': '1'}
+            )
+
+    def test_expand_ignored_on_create(self):
+        """test expand cant turn the writable relations read only"""
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 5,
+            'price': 1.00,
+            'tags': [self.tag.id],
+            'ingredients': [self.ingredient.id]
+        }
+        res = self.client.post(
+            f'{RECIPES_URL}?expand=tags', payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['tags'], [self.tag.id])
+
 class RecipeImageUploadTests(TestCase):
     
     def setUp(self):
@@ -207,7 +1101,10 @@ class RecipeImageUploadTests(TestCase):
     
     # runs at the end; want 2 remove test files from system
     def tearDown(self):
+        self.recipe.refresh_from_db()
         self.recipe.image.delete()
+        self.recipe.image_thumbnail.delete()
+        self.recipe.image_webp.delete()
     
     def test_upload_image_to_recipe(self):
         """test uploading an image to recipe"""
@@ -227,6 +1124,90 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
     
+    def test_upload_image_pending(self):
+        """test the upload returns before the variants are made"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.data['image_status'], 'pending')
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_upload_image_variants(self):
+        """test the thumbnail and webp copies are made without metadata"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            exif = Image.Exif()
+            # camera make
+            exif[0x010f] = 'Camera'
+            Image.new('RGB', (2000, 1000)).save(
+                ntf, format='JPEG', exif=exif.tobytes()
+            )
+            ntf.seek(0)
+            self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'ready')
+        self.assertEqual(
+            (self.recipe.image_width, self.recipe.image_height), (2000, 1000)
+        )
+        with Image.open(self.recipe.image_thumbnail.path) as thumbnail:
+            self.assertEqual(max(thumbnail.size), 300)
+            self.assertEqual(len(thumbnail.getexif()), 0)
+        with Image.open(self.recipe.image_webp.path) as webp:
+            self.assertEqual(webp.format, 'WEBP')
+            self.assertEqual(webp.size, (1600, 800))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertTrue(res.data['image_thumbnail'].endswith('_thumb.jpg'))
+        self.assertTrue(res.data['image_webp'].endswith('_web.webp'))
+
+    def _process_failing(self, exception, failure):
+        """process the recipe image under a failing patch, return the recipe"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+        self.recipe.image.save('test.jpg', ContentFile(buffer.getvalue()))
+        with failure, self.assertRaises(exception):
+            images.process_recipe_image(self.recipe.id, self.recipe.image.name)
+        self.recipe.refresh_from_db()
+        return self.recipe
+
+    def test_upload_image_encode_fails(self):
+        """test an error from pillow after the image opened marks it failed"""
+        real_encode = images._encode
+
+        def encode(image, max_size, format, **options):
+            if format == 'WEBP':
+                # what pillow raises when it was built without libwebp
+                raise KeyError('WEBP')
+            return real_encode(image, max_size, format, **options)
+        recipe = self._process_failing(
+            KeyError, patch('recipe.images._encode', side_effect=encode)
+        )
+
+        self.assertEqual(recipe.image_status, 'failed')
+        self.assertFalse(recipe.image_thumbnail)
+
+    def test_upload_image_save_fails(self):
+        """test the variants saved before a failure are deleted"""
+        real_save = default_storage.save
+        saved = []
+
+        def save(name, content):
+            if name.endswith('.webp'):
+                raise OSError('disk full')
+            saved.append(real_save(name, content))
+            return saved[-1]
+        recipe = self._process_failing(
+            OSError, patch.object(default_storage, 'save', side_effect=save)
+        )
+
+        self.assertEqual(recipe.image_status, 'failed')
+        self.assertEqual(len(saved), 1)
+        self.assertFalse(default_storage.exists(saved[0]))
+
     def test_upload_image_bad_request(self):
         url = image_upload_url(self.recipe.id)
         res = self.client.post(url, {'image': 'notimage'}, format='multipart')
@@ -251,9 +1232,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
     
     def test_filter_recipes_by_ingredients(self):
         """test returning recipes with specific ingredients"""
@@ -274,6 +1255,6 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
\ No newline at end of file
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
\ No newline at end of file
@@ -1,14 +1,19 @@
+from unittest.mock import MagicMock, patch
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import Tag, Recipe
+from recipe.pagination import RecipeAttrCursorPagination
 from recipe.serializers import TagSerializer
 
 # add the -list at the end to indicate that we are using list model
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 class PublicTagsApiTests(TestCase):
     """test the publicly avaialable tags api"""
@@ -39,7 +44,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
     
     def test_tags_limited_to_user(self):
         """test that tags returned are for the authenticated user"""
@@ -54,8 +59,8 @@ class PrivateTagsApiTests(TestCase):
         
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         # want the len to equal 1 b/c we only  
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
     
     def test_create_tag_successful(self):
         """test creating a new tag"""
@@ -88,8 +93,8 @@ class PrivateTagsApiTests(TestCase):
         
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
     
     def test_retrieve_tags_assigned_unique(self):
         """test filtering tags by assgined returns unique items"""
@@ -112,4 +117,135 @@ class PrivateTagsApiTests(TestCase):
         
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']), 1)
+    def test_retrieve_tags_assigned_uses_exists(self):
+        """test filtering by assigned uses a subquery, not join + distinct"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00,
+            user=self.user
+        )
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        sql = queries.captured_queries[-1]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tag_detail_not_routed(self):
+        """test that tags dont have a detail url"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+
+        res = self.client.get(f'{TAGS_URL}{tag.id}/')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_assigned_etag_changes(self):
+        """test adding a tag to a recipe changes the assigned_only etag"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00,
+            user=self.user
+        )
+        etag = self.client.get(TAGS_URL, {'assigned_only': 1})['ETag']
+
+        recipe.tags.add(tag)
+
+        res = self.client.get(
+            TAGS_URL, {'assigned_only': 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_create_tags(self):
+        """test creating many tags at once"""
+        payload = [{'name': 'Vegan'}, {'name': 'Quick'}]
+        res = self.client.post(
+            reverse('recipe:tag-bulk'), payload, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        names = Tag.objects.filter(user=self.user).values_list(
+            'name', flat=True
+        )
+        self.assertEqual(set(names), {'Vegan', 'Quick'})
+
+    def test_autocomplete_tags(self):
+        """test autocomplete returns the user's tags, prefix matches first"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Vegetarian')
+        Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='Not vegan')
+        Tag.objects.create(user=self.user, name='Vegetarian')
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': ' veg '})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data],
+            ['Vegan', 'Vegetarian', 'Not vegan']
+        )
+
+    def test_autocomplete_tags_limit(self):
+        """test autocomplete returns at most ?limit= tags"""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_autocomplete_prefix_uses_ilike(self):
+        """test the prefix match is ILIKE so the trigram index can serve it"""
+        queryset = Tag.objects.filter(name__ilike_startswith='veg')
+        lookup = queryset.query.where.children[0]
+
+        self.assertEqual(
+            lookup.get_rhs_op(MagicMock(vendor='postgresql'), '%s'),
+            'ILIKE %s'
+        )
+
+    def test_autocomplete_tags_empty(self):
+        """test autocomplete with nothing typed returns nothing"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': ''})
+
+        self.assertEqual(res.data, [])
+
+    # drf's cursor skips rows with the same name with an offset capped at
+    # offset_cutoff (1000) past which it repeats rows; the cursor has to point
+    # at the exact row instead so that cap doesnt matter
+    @patch.object(RecipeAttrCursorPagination, 'offset_cutoff', 1)
+    def test_paging_duplicate_names(self):
+        """test tags sharing a name across pages come back once, both ways"""
+        names = ('Vegan', 'Quick', 'Quick', 'Quick', 'Quick', 'Quick', 'Easy')
+        for name in names:
+            Tag.objects.create(user=self.user, name=name)
+        tags = Tag.objects.filter(user=self.user).order_by('-name', '-id')
+        expected = [tag.id for tag in tags]
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        ids = [tag['id'] for tag in res.data['results']]
+        # bounded so paging that repeats rows fails instead of never ending
+        while res.data['next'] and len(ids) <= len(expected):
+            res = self.client.get(res.data['next'])
+            ids += [tag['id'] for tag in res.data['results']]
+        self.assertEqual(ids, expected)
+
+        back = [tag['id'] for tag in res.data['results']]
+        while res.data['previous'] and len(back) <= len(expected):
+            res = self.client.get(res.data['previous'])
+            back = [tag['id'] for tag in res.data['results']] + back
+        self.assertEqual(back, expected)
@@ -1,15 +1,242 @@
+import hashlib
+from functools import partial
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import (
+    Count, Exists, Max, OuterRef, Prefetch, prefetch_related_objects
+)
+from core.authentication import CachedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from core.tasks import run_in_background
+from recipe import serializers, cache, signals, stats
+from recipe.autocomplete import autocomplete, AUTOCOMPLETE_PARAM
+from recipe.filters import filter_recipes
+from recipe.images import process_recipe_image, PENDING_IMAGE_FIELDS
+from recipe.pagination import (
+    RecipeCursorPagination, RecipeAttrCursorPagination,
+    RecipeSearchCursorPagination
+)
+from recipe.search import search_recipes, SEARCH_PARAM
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+IMAGE_FIELDS = (
+    'image', 'image_thumbnail', 'image_webp', 'image_width', 'image_height',
+    'image_status'
+)
+
+class CachedResponseMixin:
+    """cache list/retrieve responses per user until one of their objects
+    changes
+    """
+    # which namespace in recipe/cache.py the responses are stored under
+    cache_resource = None
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        key = cache.response_key(
+            request.user.pk,
+            self.cache_resource,
+            self.action,
+            request.path,
+            request.query_params
+        )
+        store = cache.get_cache()
+        data = store.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            store.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+class ConditionalGetMixin:
+    """add ETag/Last-Modified to list/retrieve and answer 304 when the client
+    is up to date
+    """
+
+    def _conditional_state(self, request, queryset):
+        """return (etag, last_modified) of the rows a response is built from"""
+        # one aggregate query; count is there so deleting an older row still
+        # changes the etag
+        state = queryset.order_by().aggregate(
+            last_modified=Max('updated_at'),
+            count=Count('id')
+        )
+        raw = repr((
+            request.user.pk,
+            request.path,
+            sorted(request.query_params.lists()),
+            request.accepted_renderer.format,
+            state['last_modified'],
+            state['count']
+        ))
+        etag = '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+        return etag, state['last_modified']
+
+    def _conditional_response(
+        self, handler, request, queryset, *args, **kwargs
+    ):
+        etag, last_modified = self._conditional_state(request, queryset)
+        # http dates only go down to the second
+        last_modified = last_modified and int(last_modified.timestamp())
+        # returns a 304 (without ever touching the serializer) if the client's
+        # copy is still good
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _detail_queryset(self):
+        """return the queryset of the object a detail response is built from"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            # same as get_object(); /recipes/abc/ is a 404, not a 500
+            raise Http404
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional_response(
+            super().list, request, queryset, *args, **kwargs
+        )
+
+class BulkMixin:
+    """adds /bulk/ to a viewset for creating (POST), updating (PATCH) or
+    deleting (DELETE) many objects at once
+
+    POST   [{...}, {...}]            => 201 with the created objects
+    PATCH  [{"id": 1, ...}, ...]     => 200 with the updated objects
+    DELETE [1, 2, 3]                 => 204
+    everything happens in one transaction; if one item is invalid nothing is
+    written
+    """
+
+    def _bulk_items(self, request):
+        """return the list sent in the body or raise a 400"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError('Expected a non empty list.')
+        if len(items) > settings.API_BULK_MAX_ITEMS:
+            raise ValidationError(
+                f'Cannot send more than {settings.API_BULK_MAX_ITEMS} items '
+                f'at once.'
+            )
+        return items
+
+    def _bulk_objects(self, request, ids):
+        """return the user's objects for ids in the same order or raise a 400
+        listing the missing ones
+        """
+        # bool is a subclass of int so true/false would pass as ids 1 and 0
+        if not all(
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in ids
+        ):
+            raise ValidationError('Expected a list of IDs.')
+        if len(set(ids)) != len(ids):
+            raise ValidationError('IDs must be unique.')
+        found = self.queryset.filter(user=request.user).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise ValidationError({'missing': missing})
+        return [found[pk] for pk in ids]
+
+    def _bulk_done(self, request, pks):
+        """do the work the (suppressed) model signals would have done for
+        each object
+        """
+        signals.touch_related(self.queryset.model, pks)
+        cache.invalidate(request.user.pk, *cache.RESOURCES)
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """create, update or delete a list of objects"""
+        items = self._bulk_items(request)
+        model = self.queryset.model
+        with transaction.atomic(), signals.suppressed():
+            if request.method == 'DELETE':
+                objs = self._bulk_objects(request, items)
+                pks = [obj.pk for obj in objs]
+                # links go away with the objects so touch what they were
+                # linked to first
+                signals.touch_related(model, pks)
+                stale = stats.linked(model, pks)
+                self.queryset.filter(pk__in=pks).delete()
+                stats.refresh_linked(stale)
+                # only once the rows are gone (and again on commit, see
+                # cache.invalidate)
+                cache.invalidate(request.user.pk, *cache.RESOURCES)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+
+            stale = {}
+            if request.method == 'POST':
+                serializer = self.get_serializer(data=items, many=True)
+                serializer.is_valid(raise_exception=True)
+                objs = serializer.save(user=request.user)
+                response_status = status.HTTP_201_CREATED
+            else:
+                if not all(isinstance(item, dict) for item in items):
+                    raise ValidationError('Expected a list of objects.')
+                objs = self._bulk_objects(
+                    request, [item.get('id') for item in items]
+                )
+                pks = [obj.pk for obj in objs]
+                # touch whatever the objects were linked to before the update
+                # changes it
+                signals.touch_related(model, pks)
+                stale = stats.linked(model, pks)
+                serializer = self.get_serializer(
+                    objs, data=items, many=True, partial=True
+                )
+                serializer.is_valid(raise_exception=True)
+                objs = serializer.save()
+                response_status = status.HTTP_200_OK
+            pks = [obj.pk for obj in objs]
+            # recount the tags/ingredients the recipes were on before and are
+            # on now
+            for stats_model, stats_pks in stats.linked(model, pks).items():
+                stale.setdefault(stats_model, set()).update(stats_pks)
+            stats.refresh_linked(stale)
+            self._bulk_done(request, pks)
+
+        # the response has the m2m ids in it so load them all in one go
+        prefetch_related_objects(
+            objs, *[field.name for field in model._meta.many_to_many]
+        )
+        return Response(serializer.data, status=response_status)
+
+class BaseRecipeAttrViewSet(
+    BulkMixin,
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    viewsets.GenericViewSet,
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin
+):
     """base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrCursorPagination
     
     # this is what is called when the ListModelMixin is called (i.e)
     def get_queryset(self):
@@ -22,9 +249,44 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixi
         )
         queryset = self.queryset
         if assigned_only:
-            # only get tags and ingredients that are assigned to recipes (b/c if recipe is null then the recipe field is null)
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+            # only get tags and ingredients that are on at least one recipe
+            queryset = queryset.filter(self._assigned_to_recipe())
+        return queryset.filter(user=self.request.user).order_by('-name')
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """return the user's tags/ingredients best matching ?q= for a
+        type-ahead (cached like list)
+        """
+        return self._cached_response(self._autocomplete, request)
+
+    def _autocomplete(self, request):
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.API_AUTOCOMPLETE_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        limit = max(1, min(limit, settings.API_AUTOCOMPLETE_MAX_LIMIT))
+        queryset = autocomplete(
+            self.get_queryset().only('id', 'name'),
+            request.query_params.get(AUTOCOMPLETE_PARAM, ''),
+            limit
+        )
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def _assigned_to_recipe(self):
+        """return an EXISTS subquery that is true when the object is on a
+        recipe
+        """
+        # checking the m2m table with EXISTS stops at the first match; joining
+        # through it would give a row per recipe which then had to be deduped
+        # with DISTINCT
+        model = self.queryset.model
+        through = model.recipe_set.through
+        return Exists(
+            through.objects.filter(**{model._meta.model_name: OuterRef('pk')})
+        )
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -37,37 +299,104 @@ class TagViewSet(BaseRecipeAttrViewSet):
     """manage tags in the database"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    cache_resource = cache.TAGS
     
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """manages ingredients in the database"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    cache_resource = cache.INGREDIENTS
     
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    BulkMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet
+):
     """manage recipes in db"""
+    cache_resource = cache.RECIPES
     
     serializer_class = serializers.RecipeSerializer
-    queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    # the search vector is only ever read by postgres itself
+    queryset = Recipe.objects.defer('search_vector')
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
-    
-    def _params_to_ints(self, qs):
-        """convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    pagination_class = RecipeCursorPagination
     
     # default action
     def get_queryset(self):
         """retrieve the recipes for the authenticated user"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        # ?tags=1,2&tags_match=all ; see recipe/filters.py
+        queryset = filter_recipes(self.queryset, self.request.query_params)
+        if self._is_search():
+            # ?search=chicken soup ; see recipe/search.py
+            queryset = search_recipes(
+                queryset, self.request.query_params[SEARCH_PARAM]
+            )
+        queryset = self._optimize_queryset(queryset)
         return queryset.filter(user=self.request.user)
+
+    def _is_search(self):
+        return (
+            self.action == 'list'
+            and SEARCH_PARAM in self.request.query_params
+        )
+
+    @property
+    def paginator(self):
+        """search results are paged best match first instead of newest first"""
+        if not hasattr(self, '_paginator') and self._is_search():
+            self._paginator = RecipeSearchCursorPagination()
+        return super().paginator
+
+    def _optimize_queryset(self, queryset):
+        """load only the columns and relations the action's serializer
+        renders
+        """
+        # without this every recipe in a list costs 2 extra queries (one for
+        # tags and one for ingredients)
+        if self.action in ('list', 'retrieve'):
+            # ?fields=id,title&expand=tags ; see serializers.requested_fields
+            serializer_class = self.get_serializer_class()
+            fields, expand = serializers.requested_fields(
+                self.request, serializer_class
+            )
+            if fields is None:
+                fields = set(serializer_class.Meta.fields)
+            relations = {'tags': Tag, 'ingredients': Ingredient}
+            prefetches = []
+            for name, model in relations.items():
+                if name not in fields:
+                    continue
+                # listing ids doesnt need the names
+                columns = ('id',)
+                if name in expand or self.action == 'retrieve':
+                    columns += ('name',)
+                    if serializers.stats_requested(self.request):
+                        columns += (
+                            serializers.RecipeStatsFieldsMixin.stats_columns
+                        )
+                prefetches.append(
+                    Prefetch(name, queryset=model.objects.only(*columns))
+                )
+            return queryset.only(
+                *(fields - set(relations))
+            ).prefetch_related(*prefetches)
+        elif self.action == 'upload_image':
+            # user and updated_at are needed when it gets saved (cache
+            # invalidation and etags)
+            return queryset.only('id', 'user', 'updated_at', *IMAGE_FIELDS)
+        return queryset
+    # default action
+    def retrieve(self, request, *args, **kwargs):
+        """retrieve a recipe (cached and with etags)"""
+        # not in the mixins b/c defining retrieve there would give
+        # tags/ingredients a detail url they dont support
+        return self._conditional_response(
+            partial(self._cached_response, super().retrieve),
+            request,
+            self._detail_queryset(),
+            *args,
+            **kwargs
+        )
+    
     # default action
     def get_serializer_class(self):
         """return appro serializer class"""
@@ -97,7 +426,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         
         # first make sure that the serializer we get is correct
         if serializer.is_valid():
-            serializer.save()
+            # the resized copies are made in the background so the client
+            # doesnt wait for them
+            recipe = serializer.save(**PENDING_IMAGE_FIELDS)
+            run_in_background(
+                process_recipe_image, recipe.pk, recipe.image.name
+            )
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from core.models import (
+    Song, ANALYSIS_PENDING, ANALYSIS_READY, ANALYSIS_FAILED, song_peaks_path
+)
+from core.tasks import run_in_background, run_in_process
+from song.features import extract_features
+from song.index import song_index
+
+
+@contextmanager
+def local_copy(name):
+    """yield a path on local disk for a stored file; copies it to a temp file
+    if the storage isnt local
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+    _, ext = os.path.splitext(name)
+    with tempfile.NamedTemporaryFile(suffix=ext) as tmp:
+        with default_storage.open(name, 'rb') as f:
+            shutil.copyfileobj(f, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def save_peaks(path):
+    """move a sidecar written by the analysis into storage; returns its name
+    or '' if none was written
+    """
+    if not os.path.getsize(path):
+        return ''
+    with open(path, 'rb') as f:
+        return default_storage.save(song_peaks_path(None, path), File(f))
+
+
+def analyze_song(song_id, file_name):
+    """extract a song's audio features and waveform peaks in the process pool
+    and save them
+    """
+    # only save the results if the song still has the file that was analyzed
+    song = Song.objects.filter(pk=song_id, file=file_name)
+    fd, peaks_path = tempfile.mkstemp(suffix='.peaks')
+    os.close(fd)
+    try:
+        with local_copy(file_name) as path:
+            result = run_in_process(extract_features, path, peaks_path)
+        result['peaks'] = save_peaks(peaks_path)
+    except Exception:
+        song.update(analysis_status=ANALYSIS_FAILED, updated_at=timezone.now())
+        raise
+    finally:
+        os.remove(peaks_path)
+    if not song.update(
+        analysis_status=ANALYSIS_READY, updated_at=timezone.now(), **result
+    ) and result['peaks']:
+        # the song was deleted or got a new file while it was being analyzed
+        default_storage.delete(result['peaks'])
+    # this process sees the new song straight away; others on their next
+    # refresh
+    song_index.refresh(force=True)
+
+
+def set_song_file(song, file_name):
+    """point a song at an audio file that is already in storage and queue its
+    analysis
+    """
+    if song.peaks:
+        song.peaks.delete(save=False)
+    song.file = file_name
+    song.duration = None
+    song.tempo = None
+    song.key = ''
+    song.features = None
+    song.peaks = ''
+    song.analysis_status = ANALYSIS_PENDING
+    song.save()
+    queue_analysis(song)
+
+
+def queue_analysis(song):
+    run_in_background(analyze_song, song.pk, song.file.name)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SongConfig(AppConfig):
+    name = 'song'
+
+    def ready(self):
+        # connects the similarity index signals
+        from song import signals  # noqa
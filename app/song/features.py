@@ -0,0 +1,72 @@
+"""audio feature extraction
+
+runs in the worker processes of core.tasks.get_process_pool so nothing here
+may touch django or the db
+"""
+import numpy as np
+from song.peaks import write_peaks
+
+SAMPLE_RATE = 22050
+N_MFCC = 20
+PITCH_CLASSES = (
+    'C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'
+)
+# mfcc means + mfcc stds + chroma + centroid, bandwidth, rolloff, zero
+# crossing rate, rms
+FEATURE_SIZE = N_MFCC * 2 + len(PITCH_CLASSES) + 5
+FEATURE_DTYPE = np.float32
+
+# Krumhansl-Kessler key profiles
+MAJOR_PROFILE = np.array(
+    [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+)
+MINOR_PROFILE = np.array(
+    [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+)
+
+
+def estimate_key(chroma):
+    """return the best matching key (i.e. 'A minor') for a 12 bin average
+    chroma
+    """
+    best_score, best_key = None, ''
+    for mode, profile in (('major', MAJOR_PROFILE), ('minor', MINOR_PROFILE)):
+        for tonic in range(len(PITCH_CLASSES)):
+            score = np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+            if best_score is None or score > best_score:
+                best_score, best_key = score, f'{PITCH_CLASSES[tonic]} {mode}'
+    return best_key
+
+
+def extract_features(path, peaks_path=None):
+    """decode an audio file and return its duration, tempo, key and feature
+    vector (as float32 bytes)
+
+    when peaks_path is given the waveform peaks sidecar is written there from
+    the same decoded audio
+    """
+    # imported here so the web processes never pay for importing librosa
+    import librosa
+
+    y, sr = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+    if peaks_path is not None:
+        write_peaks(peaks_path, y, sr)
+    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC)
+    spectral = [
+        librosa.feature.spectral_centroid(y=y, sr=sr).mean(),
+        librosa.feature.spectral_bandwidth(y=y, sr=sr).mean(),
+        librosa.feature.spectral_rolloff(y=y, sr=sr).mean(),
+        librosa.feature.zero_crossing_rate(y).mean(),
+        librosa.feature.rms(y=y).mean(),
+    ]
+    vector = np.concatenate([
+        mfcc.mean(axis=1), mfcc.std(axis=1), chroma, spectral
+    ]).astype(FEATURE_DTYPE)
+    return {
+        'duration': float(librosa.get_duration(y=y, sr=sr)),
+        'tempo': float(np.atleast_1d(tempo)[0]),
+        'key': estimate_key(chroma),
+        'features': vector.tobytes(),
+    }
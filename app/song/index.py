@@ -0,0 +1,181 @@
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from core.models import Song, ANALYSIS_READY
+from song.features import FEATURE_SIZE, FEATURE_DTYPE
+
+
+class SongIndex:
+    """the feature vectors of every analyzed song kept in one numpy matrix for
+    similarity search
+
+    each process has its own copy. it is loaded on first use and after that
+    only songs analyzed since the last refresh are read from the db (by
+    updated_at) so songs analyzed in other processes show up within
+    SONG_INDEX_REFRESH_INTERVAL seconds. an index with refresh_interval=None
+    never reads the db
+
+    updated_at is set when a song is saved, not when its transaction commits,
+    so a song can become visible with an updated_at older than one already
+    read. every refresh reads the last `overlap` seconds again and skips the
+    songs it already has at that updated_at
+    """
+
+    def __init__(self, refresh_interval=0, overlap=60):
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self, capacity=1024):
+        self._vectors = np.zeros(
+            (capacity, FEATURE_SIZE), dtype=FEATURE_DTYPE
+        )
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._users = np.zeros(capacity, dtype=np.int64)
+        # song id => row in the matrix
+        self._rows = {}
+        self._size = 0
+        self._loaded = False
+        self._last_updated_at = None
+        # song id => updated_at it was indexed at, for the songs read again in
+        # the overlap
+        self._indexed_at = {}
+        self._last_refresh = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def normalize(vectors):
+        """scale rows to unit length so a dot product is the cosine similarity
+
+        log compresses the big spectral values (hz) so they dont drown out the
+        mfccs
+        """
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return (vectors / norms).astype(FEATURE_DTYPE)
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._vectors = np.resize(self._vectors, (capacity, FEATURE_SIZE))
+        self._ids = np.resize(self._ids, capacity)
+        self._users = np.resize(self._users, capacity)
+
+    def add_many(self, ids, user_ids, vectors):
+        """add or replace songs in the index; vectors is an (n, FEATURE_SIZE)
+        array of raw features
+        """
+        vectors = self.normalize(np.asarray(vectors, dtype=FEATURE_DTYPE))
+        with self._lock:
+            self._grow(self._size + len(ids))
+            for song_id, user_id, vector in zip(ids, user_ids, vectors):
+                row = self._rows.get(song_id)
+                if row is None:
+                    row = self._size
+                    self._rows[song_id] = row
+                    self._size += 1
+                self._ids[row] = song_id
+                self._users[row] = user_id or 0
+                self._vectors[row] = vector
+
+    def remove(self, song_id):
+        """stop a song from being returned (its row is left in place but never
+        matches)
+        """
+        with self._lock:
+            self._indexed_at.pop(song_id, None)
+            row = self._rows.get(song_id)
+            if row is not None:
+                self._users[row] = -1
+
+    def refresh(self, force=False):
+        """load the songs analyzed since the last refresh"""
+        if self.refresh_interval is None:
+            return
+        now = time.monotonic()
+        size = FEATURE_SIZE * np.dtype(FEATURE_DTYPE).itemsize
+        with self._lock:
+            if (
+                not force and self._loaded
+                and now - self._last_refresh < self.refresh_interval
+            ):
+                return
+            self._last_refresh = now
+            songs = Song.objects.filter(analysis_status=ANALYSIS_READY)
+            if self._last_updated_at is not None:
+                songs = songs.filter(
+                    updated_at__gte=self._last_updated_at - self.overlap
+                )
+            ids, user_ids, vectors = [], [], []
+            for song_id, user_id, features, updated_at in songs.values_list(
+                'id', 'user_id', 'features', 'updated_at'
+            ).iterator():
+                if self._indexed_at.get(song_id) == updated_at:
+                    continue
+                self._indexed_at[song_id] = updated_at
+                if features is None or len(features) != size:
+                    continue
+                ids.append(song_id)
+                user_ids.append(user_id)
+                vectors.append(np.frombuffer(features, dtype=FEATURE_DTYPE))
+                if (
+                    self._last_updated_at is None
+                    or updated_at > self._last_updated_at
+                ):
+                    self._last_updated_at = updated_at
+            if ids:
+                self.add_many(ids, user_ids, np.vstack(vectors))
+            self._loaded = True
+
+    def vector(self, song_id):
+        """return the normalized vector of a song or None if it isnt indexed"""
+        with self._lock:
+            row = self._rows.get(song_id)
+            return None if row is None else self._vectors[row].copy()
+
+    def similar(self, song_id, user_id, limit=10):
+        """return [(song id, cosine similarity)] of the user's songs most like
+        song_id, best first
+        """
+        self.refresh()
+        with self._lock:
+            row = self._rows.get(song_id)
+            if row is None:
+                return []
+            size = self._size
+            vectors = self._vectors[:size]
+            users = self._users[:size]
+            ids = self._ids[:size]
+            # one matrix-vector product scores every song at once
+            scores = vectors @ vectors[row]
+        scores[users != user_id] = -np.inf
+        scores[row] = -np.inf
+        limit = min(limit, size)
+        if limit <= 0:
+            return []
+        # only sort the top `limit` instead of all the scores
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(ids[i]), float(scores[i]))
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+song_index = SongIndex(
+    refresh_interval=settings.SONG_INDEX_REFRESH_INTERVAL,
+    overlap=settings.SONG_INDEX_REFRESH_OVERLAP
+)
@@ -0,0 +1,198 @@
+"""waveform peaks and a low resolution mel spectrogram precomputed for the
+client's scrubber
+
+written once by the analysis (in the process pool, so nothing here may touch
+django or the db) to a sidecar file that is laid out so any section can be
+memory mapped or served as is without decoding anything:
+
+    header  16 bytes: magic, version, number of sections, sample rate,
+            mel bins
+    table   24 bytes per section: kind, level (samples per frame), frames,
+            bytes per frame, offset
+    data    each section starts on a 64 byte boundary
+
+waveform frames are (min, max) int8 pairs scaled from -1..1, spectrogram
+frames are N_MELS uint8 values scaled from -80..0 db
+"""
+import mmap
+import struct
+from collections import namedtuple
+import numpy as np
+
+MAGIC = b'SPKS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIHH')
+SECTION = struct.Struct('<BxxxIIIQ')
+ALIGN = 64
+
+WAVEFORM = 'waveform'
+SPECTROGRAM = 'spectrogram'
+KINDS = (WAVEFORM, SPECTROGRAM)
+KIND_DTYPES = {WAVEFORM: np.int8, SPECTROGRAM: np.uint8}
+
+# samples per frame of each resolution level, finest first; each level is 4x
+# coarser than the one before
+WAVEFORM_LEVELS = (256, 1024, 4096, 16384)
+SPECTROGRAM_LEVELS = (2048, 8192)
+N_MELS = 64
+TOP_DB = 80.0
+# how many spectrogram frames are transformed at a time, keeps memory flat for
+# long songs
+FFT_BATCH = 1024
+
+Header = namedtuple('Header', ['sample_rate', 'n_mels', 'sections'])
+Section = namedtuple(
+    'Section', ['kind', 'level', 'frames', 'frame_size', 'offset']
+)
+
+
+def _pool(values, factor, reduce):
+    """combine every `factor` values of the first axis with reduce (the last
+    group is padded with its edge)
+    """
+    extra = -len(values) % factor
+    if extra:
+        pad = [(0, extra)] + [(0, 0)] * (values.ndim - 1)
+        values = np.pad(values, pad, mode='edge')
+    groups = values.reshape(len(values) // factor, factor, *values.shape[1:])
+    return reduce(groups, axis=1)
+
+
+def waveform_levels(y):
+    """return [(level, (frames, 2) int8 array of min/max)] for every
+    WAVEFORM_LEVELS
+    """
+    base = WAVEFORM_LEVELS[0]
+    y = np.asarray(y, dtype=np.float32)
+    if not len(y):
+        y = np.zeros(1, dtype=np.float32)
+    y = np.pad(y, (0, -len(y) % base))
+    blocks = y.reshape(-1, base)
+    mins, maxs = blocks.min(axis=1), blocks.max(axis=1)
+    levels = []
+    for i, level in enumerate(WAVEFORM_LEVELS):
+        if i:
+            factor = level // WAVEFORM_LEVELS[i - 1]
+            mins = _pool(mins, factor, np.min)
+            maxs = _pool(maxs, factor, np.max)
+        peaks = np.stack([mins, maxs], axis=1)
+        peaks = np.clip(np.round(peaks * 127), -128, 127)
+        levels.append((level, peaks.astype(np.int8)))
+    return levels
+
+
+def mel_filters(sr, n_fft, n_mels=N_MELS):
+    """return a (n_mels, n_fft // 2 + 1) matrix of triangular mel filters
+    (htk mel scale)
+    """
+    fft_freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    mels = np.linspace(0, 2595 * np.log10(1 + (sr / 2) / 700), n_mels + 2)
+    hz = 700 * (10 ** (mels / 2595) - 1)
+    lower = (fft_freqs - hz[:-2, None]) / (hz[1:-1, None] - hz[:-2, None])
+    upper = (hz[2:, None] - fft_freqs) / (hz[2:, None] - hz[1:-1, None])
+    return np.maximum(0, np.minimum(lower, upper)).astype(np.float32)
+
+
+def spectrogram_levels(y, sr):
+    """return [(level, (frames, N_MELS) uint8 array)] for every
+    SPECTROGRAM_LEVELS
+    """
+    n_fft = SPECTROGRAM_LEVELS[0]
+    y = np.asarray(y, dtype=np.float32)
+    if not len(y):
+        y = np.zeros(1, dtype=np.float32)
+    # one window per frame, no overlap; it only has to look right at a glance
+    frames = np.pad(y, (0, -len(y) % n_fft)).reshape(-1, n_fft)
+    window = np.hanning(n_fft).astype(np.float32)
+    filters = mel_filters(sr, n_fft)
+    mel = np.empty((len(frames), N_MELS), dtype=np.float32)
+    for start in range(0, len(frames), FFT_BATCH):
+        batch = frames[start:start + FFT_BATCH] * window
+        power = np.abs(np.fft.rfft(batch, axis=1)) ** 2
+        mel[start:start + FFT_BATCH] = power @ filters.T
+    db = 10 * np.log10(np.maximum(mel, 1e-10))
+    db = np.maximum(db - db.max(), -TOP_DB)
+    levels = []
+    for i, level in enumerate(SPECTROGRAM_LEVELS):
+        if i:
+            db = _pool(db, level // SPECTROGRAM_LEVELS[i - 1], np.max)
+        scaled = np.round((db + TOP_DB) / TOP_DB * 255)
+        levels.append((level, scaled.astype(np.uint8)))
+    return levels
+
+
+def write_peaks(path, y, sr):
+    """compute the peaks and spectrogram of decoded mono audio and write them
+    to a sidecar file
+    """
+    arrays = [(WAVEFORM, level, a) for level, a in waveform_levels(y)]
+    arrays += [
+        (SPECTROGRAM, level, a) for level, a in spectrogram_levels(y, sr)
+    ]
+    offset = HEADER.size + SECTION.size * len(arrays)
+    table = []
+    for kind, level, array in arrays:
+        offset += -offset % ALIGN
+        table.append(
+            Section(kind, level, array.shape[0], array.shape[1], offset)
+        )
+        offset += array.nbytes
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(table), sr, N_MELS, 0))
+        for s in table:
+            f.write(SECTION.pack(
+                KINDS.index(s.kind), s.level, s.frames, s.frame_size, s.offset
+            ))
+        for s, (_, _, array) in zip(table, arrays):
+            f.write(b'\0' * (s.offset - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def read_header(f):
+    """read the header and section table from the start of an open sidecar
+    file
+    """
+    data = f.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise ValueError('Not a peaks file.')
+    magic, version, count, sample_rate, n_mels, _ = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a peaks file.')
+    data = f.read(SECTION.size * count)
+    if len(data) != SECTION.size * count:
+        raise ValueError('Truncated peaks file.')
+    sections = [
+        Section(KINDS[kind], level, frames, frame_size, offset)
+        for kind, level, frames, frame_size, offset
+        in SECTION.iter_unpack(data)
+    ]
+    return Header(sample_rate, n_mels, sections)
+
+
+def find_section(header, kind, level=None):
+    """return the section of a kind at a level (the finest if level is None)
+    or None
+    """
+    for s in header.sections:
+        if s.kind == kind and (level is None or s.level == level):
+            return s
+    return None
+
+
+def section_array(buffer, section):
+    """return a (frames, frame_size) view of a section of a buffer holding
+    the whole file (no copy)
+    """
+    return np.frombuffer(
+        buffer, dtype=KIND_DTYPES[section.kind],
+        count=section.frames * section.frame_size, offset=section.offset
+    ).reshape(section.frames, section.frame_size)
+
+
+def open_peaks(path):
+    """memory map a sidecar file; returns the header and the map to pass to
+    section_array
+    """
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        return header, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+from core.models import Song
+
+
+class SongSerializer(serializers.ModelSerializer):
+    """serialize a song"""
+
+    class Meta:
+        model = Song
+        fields = (
+            'id', 'title', 'file', 'duration', 'tempo', 'key',
+            'analysis_status'
+        )
+        # everything but the title and file is worked out from the audio
+        read_only_fields = (
+            'id', 'duration', 'tempo', 'key', 'analysis_status'
+        )
+        # the file can also be sent later through a chunked upload (see the
+        # upload app)
+        extra_kwargs = {'file': {'required': False}}
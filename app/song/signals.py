@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from core.models import Song
+from song.index import song_index
+
+
+@receiver(post_delete, sender=Song)
+def remove_from_index(sender, instance, **kwargs):
+    song_index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=Song)
+def delete_peaks(sender, instance, **kwargs):
+    if instance.peaks:
+        instance.peaks.delete(save=False)
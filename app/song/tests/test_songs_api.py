@@ -0,0 +1,498 @@
+import io
+import os
+import tempfile
+import wave
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import (
+    APIClient, APIRequestFactory, force_authenticate
+)
+from core.models import Song
+from song import features, peaks
+from song.views import SongViewSet
+from song.index import song_index
+
+try:
+    import librosa  # noqa
+    HAS_LIBROSA = True
+except ImportError:
+    HAS_LIBROSA = False
+
+SONGS_URL = reverse('song:song-list')
+
+
+def detail_url(song_id):
+    return reverse('song:song-detail', args=[song_id])
+
+
+def sample_wav(seconds=1, frequency=440, rate=22050):
+    """return the bytes of a mono wav with a sine wave in it"""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * frequency * t) * 16000).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def sample_result():
+    return {
+        'duration': 1.0,
+        'tempo': 120.0,
+        'key': 'A minor',
+        'features': np.ones(
+            features.FEATURE_SIZE, features.FEATURE_DTYPE
+        ).tobytes(),
+    }
+
+
+class PublicSongApiTests(TestCase):
+    """test unauthenticated song API access"""
+
+    def test_auth_required(self):
+        res = APIClient().get(SONGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class PrivateSongApiTests(TestCase):
+    """test uploading and viewing songs"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        for song in Song.objects.all():
+            song.file.delete()
+
+    def _upload(self, title='Song'):
+        return self.client.post(
+            SONGS_URL,
+            {
+                'title': title,
+                'file': SimpleUploadedFile('song.wav', sample_wav())
+            },
+            format='multipart'
+        )
+
+    @patch('song.analysis.extract_features', return_value=sample_result())
+    def test_upload_song_analyzed(self, extract):
+        """test uploading a song runs the analysis and saves the results"""
+        res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(extract.call_count, 1)
+        song = Song.objects.get(id=res.data['id'])
+        self.assertEqual(song.analysis_status, 'ready')
+        self.assertEqual(song.key, 'A minor')
+        self.assertEqual(song.tempo, 120.0)
+        self.assertEqual(
+            len(bytes(song.features)),
+            features.FEATURE_SIZE * np.dtype(features.FEATURE_DTYPE).itemsize
+        )
+
+        res = self.client.get(detail_url(song.id))
+        self.assertEqual(res.data['key'], 'A minor')
+        self.assertNotIn('features', res.data)
+
+    @patch('song.analysis.extract_features', side_effect=ValueError)
+    def test_upload_song_analysis_failed(self, extract):
+        """test a file that cant be analyzed is marked failed"""
+        with self.assertRaises(ValueError):
+            self._upload()
+
+        self.assertEqual(Song.objects.get().analysis_status, 'failed')
+
+    @patch('song.analysis.extract_features', return_value=sample_result())
+    def test_songs_limited_to_user(self, extract):
+        """test only the user's own songs are listed"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        Song.objects.create(user=user2, title='Theirs')
+        self._upload(title='Mine')
+
+        res = self.client.get(SONGS_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['title'], 'Mine')
+
+
+class FeatureTests(TestCase):
+    """test the audio feature extraction"""
+
+    def test_estimate_key(self):
+        """test the key is found from a chroma that matches a key profile"""
+        self.assertEqual(
+            features.estimate_key(features.MAJOR_PROFILE), 'C major'
+        )
+        a_minor = np.roll(features.MINOR_PROFILE, 9)
+        self.assertEqual(features.estimate_key(a_minor), 'A minor')
+
+    @skipUnless(HAS_LIBROSA, 'librosa is not installed')
+    def test_extract_features(self):
+        """test extracting the features of a real audio file"""
+        with tempfile.NamedTemporaryFile(suffix='.wav') as ntf:
+            ntf.write(sample_wav(seconds=2))
+            ntf.flush()
+            result = features.extract_features(ntf.name)
+
+        self.assertAlmostEqual(result['duration'], 2.0, places=1)
+        self.assertEqual(
+            len(result['features']),
+            features.FEATURE_SIZE * np.dtype(features.FEATURE_DTYPE).itemsize
+        )
+
+
+def similar_url(song_id):
+    return reverse('song:song-similar', args=[song_id])
+
+
+def analyzed_song(user, title, vector):
+    """create an analyzed song with the given feature vector"""
+    vector = np.resize(
+        np.asarray(vector, features.FEATURE_DTYPE), features.FEATURE_SIZE
+    )
+    return Song.objects.create(
+        user=user,
+        title=title,
+        analysis_status='ready',
+        features=vector.tobytes()
+    )
+
+
+class SimilarSongsApiTests(TestCase):
+    """test finding similar songs"""
+
+    def setUp(self):
+        song_index.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        song_index.clear()
+
+    def test_similar_songs_ordered(self):
+        """test similar songs come most similar first, without the song"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        close = analyzed_song(self.user, 'Close', [1, 2, 4])
+        far = analyzed_song(self.user, 'Far', [9, 0, 0])
+
+        res = self.client.get(similar_url(song.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([s['id'] for s in res.data], [close.id, far.id])
+        self.assertGreater(
+            res.data[0]['similarity'], res.data[1]['similarity']
+        )
+
+    def test_similar_songs_limited_to_user(self):
+        """test other users' songs are never returned"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        analyzed_song(user2, 'Theirs', [1, 2, 3])
+
+        res = self.client.get(similar_url(song.id))
+
+        self.assertEqual(res.data, [])
+
+    def test_similar_songs_limit(self):
+        """test the number of results can be limited"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        for i in range(3):
+            analyzed_song(self.user, f'Song {i}', [i, 2, 3])
+
+        res = self.client.get(similar_url(song.id), {'limit': 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_similar_songs_limit_at_least_one(self):
+        """test a limit below 1 is raised to 1 instead of returning nothing"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        analyzed_song(self.user, 'Other', [1, 2, 4])
+
+        for limit in (0, -5):
+            res = self.client.get(similar_url(song.id), {'limit': limit})
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(res.data), 1)
+
+    def test_similar_song_not_analyzed(self):
+        """test a song without features cant be searched from"""
+        song = Song.objects.create(user=self.user, title='Song')
+
+        res = self.client.get(similar_url(song.id))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleted_song_not_returned(self):
+        """test a deleted song is removed from the index"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        other = analyzed_song(self.user, 'Other', [1, 2, 4])
+        self.client.get(similar_url(song.id))
+
+        other.delete()
+        res = self.client.get(similar_url(song.id))
+
+        self.assertEqual(res.data, [])
+        self.assertEqual(song_index.similar(song.id, self.user.id), [])
+
+    def test_index_picks_up_new_songs(self):
+        """test songs analyzed after the index loaded are found on refresh"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        self.assertEqual(song_index.similar(song.id, self.user.id), [])
+
+        other = analyzed_song(self.user, 'Other', [1, 2, 4])
+        song_index.refresh(force=True)
+
+        matches = song_index.similar(song.id, self.user.id)
+        self.assertEqual([song_id for song_id, _ in matches], [other.id])
+
+    def test_index_picks_up_late_commits(self):
+        """test a song committed with an older updated_at is still found"""
+        song = analyzed_song(self.user, 'Song', [1, 2, 3])
+        song_index.refresh(force=True)
+
+        # saved before song but committed after the refresh above
+        late = analyzed_song(self.user, 'Late', [1, 2, 4])
+        Song.objects.filter(pk=late.pk).update(
+            updated_at=song.updated_at - timedelta(seconds=10)
+        )
+        song_index.refresh(force=True)
+
+        matches = song_index.similar(song.id, self.user.id)
+        self.assertEqual([song_id for song_id, _ in matches], [late.id])
+
+
+def peaks_url(song_id, kind=None):
+    if kind is None:
+        return reverse('song:song-peaks', args=[song_id])
+    return reverse('song:song-peaks-data', args=[song_id, kind])
+
+
+def sample_audio(seconds=2, rate=features.SAMPLE_RATE):
+    """return decoded mono audio rising from silence to a full scale sine
+    wave
+    """
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * 440 * t) * t / seconds).astype(np.float32)
+
+
+def fake_extract_features(path, peaks_path=None):
+    """stand in for the analysis that writes peaks without needing librosa"""
+    if peaks_path is not None:
+        peaks.write_peaks(peaks_path, sample_audio(), features.SAMPLE_RATE)
+    return sample_result()
+
+
+class PeaksFileTests(TestCase):
+    """test writing and reading the waveform peaks sidecar"""
+
+    def test_write_and_map_peaks(self):
+        """test every level is written and can be read back without decoding"""
+        y = sample_audio()
+        with tempfile.NamedTemporaryFile(suffix='.peaks') as ntf:
+            peaks.write_peaks(ntf.name, y, features.SAMPLE_RATE)
+            header, buffer = peaks.open_peaks(ntf.name)
+            finest = peaks.section_array(
+                buffer, peaks.find_section(header, peaks.WAVEFORM, 256)
+            )
+            coarsest = peaks.section_array(
+                buffer, peaks.find_section(header, peaks.WAVEFORM, 16384)
+            )
+            spectrogram = peaks.section_array(
+                buffer, peaks.find_section(header, peaks.SPECTROGRAM)
+            )
+
+            self.assertEqual(header.sample_rate, features.SAMPLE_RATE)
+            self.assertEqual(
+                len(header.sections),
+                len(peaks.WAVEFORM_LEVELS) + len(peaks.SPECTROGRAM_LEVELS)
+            )
+            self.assertTrue(
+                all(s.offset % peaks.ALIGN == 0 for s in header.sections)
+            )
+            self.assertEqual(finest.shape, (int(np.ceil(len(y) / 256)), 2))
+            self.assertEqual(coarsest.shape, (int(np.ceil(len(y) / 16384)), 2))
+            self.assertEqual(spectrogram.shape[1], peaks.N_MELS)
+            # the sine gets louder so the last peaks are the biggest
+            self.assertEqual(finest[-1, 1], 127)
+            self.assertLess(finest[0, 1], 10)
+            self.assertEqual(coarsest[:, 1].max(), finest[:, 1].max())
+            self.assertEqual(coarsest[:, 0].min(), finest[:, 0].min())
+
+    def test_not_a_peaks_file(self):
+        """test reading something that isnt a sidecar fails"""
+        with self.assertRaises(ValueError):
+            peaks.read_header(io.BytesIO(b'not a peaks file'))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class SongPeaksApiTests(TestCase):
+    """test serving the waveform peaks of a song"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        with patch(
+            'song.analysis.extract_features',
+            side_effect=fake_extract_features
+        ):
+            res = self.client.post(
+                SONGS_URL,
+                {
+                    'title': 'Song',
+                    'file': SimpleUploadedFile('song.wav', sample_wav())
+                },
+                format='multipart'
+            )
+        self.song = Song.objects.get(id=res.data['id'])
+        with default_storage.open(self.song.peaks.name, 'rb') as f:
+            self.header = peaks.read_header(f)
+
+    def tearDown(self):
+        for song in Song.objects.all():
+            song.file.delete()
+            song.peaks.delete()
+
+    def _section(self, kind, level):
+        with default_storage.open(self.song.peaks.name, 'rb') as f:
+            section = peaks.find_section(self.header, kind, level)
+            f.seek(section.offset)
+            return section, f.read(section.frames * section.frame_size)
+
+    def test_peaks_levels(self):
+        """test the available levels are listed"""
+        res = self.client.get(peaks_url(self.song.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['sample_rate'], features.SAMPLE_RATE)
+        self.assertEqual(
+            [level['level'] for level in res.data['waveform']],
+            list(peaks.WAVEFORM_LEVELS)
+        )
+        self.assertEqual(
+            res.data['spectrogram'][0]['frame_size'], peaks.N_MELS
+        )
+
+    def test_get_waveform_level(self):
+        """test a level is sent as the raw bytes of its section"""
+        section, data = self._section(peaks.WAVEFORM, 1024)
+
+        res = self.client.get(
+            peaks_url(self.song.id, 'waveform'), {'level': 1024}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/octet-stream')
+        self.assertEqual(int(res['X-Peaks-Frames']), section.frames)
+        self.assertEqual(b''.join(res.streaming_content), data)
+
+    def test_get_spectrogram_range(self):
+        """test part of a level can be requested with a Range header"""
+        _, data = self._section(peaks.SPECTROGRAM, 2048)
+
+        res = self.client.get(
+            peaks_url(self.song.id, 'spectrogram'), HTTP_RANGE='bytes=64-127'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(res['Content-Range'], f'bytes 64-127/{len(data)}')
+        self.assertEqual(b''.join(res.streaming_content), data[64:128])
+
+        res = self.client.get(
+            peaks_url(self.song.id, 'spectrogram'), HTTP_RANGE='bytes=-10'
+        )
+        self.assertEqual(b''.join(res.streaming_content), data[-10:])
+
+    def test_range_sendfile(self):
+        """test a range is sent as a file a wsgi server can sendfile()
+
+        positioned at its start and stopping at its end
+        """
+        section, data = self._section(peaks.SPECTROGRAM, 2048)
+
+        # straight to the view; the test client wraps the content which hides
+        # the file from it
+        request = APIRequestFactory().get(
+            peaks_url(self.song.id, 'spectrogram'), HTTP_RANGE='bytes=64-'
+        )
+        force_authenticate(request, self.user)
+        view = SongViewSet.as_view({'get': 'peaks_data'})
+        res = view(request, pk=self.song.id, kind='spectrogram')
+
+        fileno = res.file_to_stream.fileno()
+        self.assertEqual(os.lseek(fileno, 0, os.SEEK_CUR), section.offset + 64)
+        self.assertEqual(int(res['Content-Length']), len(data) - 64)
+        self.assertEqual(b''.join(res.streaming_content), data[64:])
+        res.close()
+
+    def test_range_not_satisfiable(self):
+        """test a range past the end of the level is refused"""
+        res = self.client.get(
+            peaks_url(self.song.id, 'waveform'), HTTP_RANGE='bytes=100000000-'
+        )
+
+        self.assertEqual(res.status_code, 416)
+
+    def test_unknown_level(self):
+        """test asking for a level that wasnt computed fails"""
+        res = self.client.get(
+            peaks_url(self.song.id, 'waveform'), {'level': 3}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_modified(self):
+        """test a level the client already has isnt sent again"""
+        res = self.client.get(peaks_url(self.song.id, 'waveform'))
+
+        res = self.client.get(
+            peaks_url(self.song.id, 'waveform'), HTTP_IF_NONE_MATCH=res['ETag']
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_peaks_not_ready(self):
+        """test a song without peaks gives a 404"""
+        song = Song.objects.create(user=self.user, title='Pending')
+
+        res = self.client.get(peaks_url(song.id, 'waveform'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleting_song_deletes_peaks(self):
+        """test the sidecar is removed with its song"""
+        name = self.song.peaks.name
+
+        self.client.delete(detail_url(self.song.id))
+
+        self.assertFalse(default_storage.exists(name))
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from song import views
+
+router = DefaultRouter()
+router.register('songs', views.SongViewSet)
+app_name = 'song'
+urlpatterns = [
+    path('', include(router.urls))
+]
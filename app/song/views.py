@@ -0,0 +1,202 @@
+import re
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from core.authentication import CachedTokenAuthentication
+from core.models import Song, ANALYSIS_PENDING, ANALYSIS_READY
+from recipe.pagination import RecipeCursorPagination
+from song import serializers
+from song.peaks import KINDS, find_section, read_header
+from song.analysis import queue_analysis
+from song.index import song_index
+from upload.files import LimitedReader, READ_SIZE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """return (start, end) inclusive for a single range Range header, None to
+    send everything or raise ValueError if the range is outside the content
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    # anything we dont understand (i.e. multiple ranges) gets the whole
+    # content, which http allows
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # last n bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+class FileRange(LimitedReader):
+    """file like object for FileResponse that reads length bytes of an open
+    file from start
+
+    fileno() is the file's own so a wsgi server with wsgi.file_wrapper
+    (gunicorn's sync/gthread workers) sends it with sendfile() straight from
+    the page cache, from the file's position for Content-Length bytes;
+    anything else (asgi, the dev server, storages without a local file) reads
+    it in READ_SIZE blocks that stop at the range's end
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        super().__init__(f, length)
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def close(self):
+        self.stream.close()
+
+
+class SongViewSet(viewsets.GenericViewSet,
+                  mixins.ListModelMixin,
+                  mixins.RetrieveModelMixin,
+                  mixins.CreateModelMixin,
+                  mixins.DestroyModelMixin):
+    """upload and manage songs"""
+    serializer_class = serializers.SongSerializer
+    # the feature vector is only needed by the analysis/similarity code so
+    # never load it here
+    queryset = Song.objects.defer('features')
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+
+    def get_queryset(self):
+        """retrieve the songs for the authenticated user"""
+        return self.queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        """save the song and analyze it off the request"""
+        if serializer.validated_data.get('file'):
+            song = serializer.save(
+                user=self.request.user, analysis_status=ANALYSIS_PENDING
+            )
+            queue_analysis(song)
+        else:
+            serializer.save(user=self.request.user)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """return the user's songs that sound most like this one"""
+        song = self.get_object()
+        if song.analysis_status != ANALYSIS_READY:
+            raise ValidationError('Song has not been analyzed yet.')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        limit = max(1, min(limit, settings.SONG_SIMILAR_MAX_LIMIT))
+        # ask for a few extra in case some were deleted in another process
+        # since the index last refreshed
+        matches = song_index.similar(song.pk, request.user.pk, limit + 5)
+        songs = self.get_queryset().in_bulk(
+            [song_id for song_id, _ in matches]
+        )
+        results = []
+        for song_id, score in matches:
+            if song_id in songs and len(results) < limit:
+                data = self.get_serializer(songs[song_id]).data
+                data['similarity'] = round(score, 4)
+                results.append(data)
+        return Response(results)
+
+    def _peaks_header(self, song):
+        if not song.peaks:
+            raise NotFound('The waveform of this song is not ready yet.')
+        with default_storage.open(song.peaks.name, 'rb') as f:
+            return read_header(f)
+
+    @action(methods=['GET'], detail=True)
+    def peaks(self, request, pk=None):
+        """return the resolution levels of the song's waveform peaks and
+        spectrogram
+        """
+        header = self._peaks_header(self.get_object())
+        data = {'sample_rate': header.sample_rate}
+        for kind in KINDS:
+            data[kind] = [
+                {
+                    'level': s.level,
+                    'frames': s.frames,
+                    'frame_size': s.frame_size
+                }
+                for s in header.sections if s.kind == kind
+            ]
+        return Response(data)
+
+    @action(
+        methods=['GET'], detail=True, url_name='peaks-data',
+        url_path=f'peaks/(?P<kind>{"|".join(KINDS)})'
+    )
+    def peaks_data(self, request, kind, pk=None):
+        """send one level of the song's peaks straight from the sidecar file as
+        raw bytes
+
+        ?level= picks the samples per frame (the finest by default) and a Range
+        header gets part of it
+        """
+        song = self.get_object()
+        header = self._peaks_header(song)
+        level = request.query_params.get('level')
+        try:
+            section = find_section(header, kind, level and int(level))
+        except ValueError:
+            section = None
+        if section is None:
+            levels = ', '.join(
+                str(s.level) for s in header.sections if s.kind == kind
+            )
+            raise ValidationError({'level': f'Must be one of {levels}.'})
+
+        # sidecars get a new name every time a song is analyzed so a level
+        # never changes under its etag
+        etag = f'"{song.peaks.name.rsplit("/", 1)[-1]}-{kind}-{section.level}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+
+        size = section.frames * section.frame_size
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range or (0, size - 1)
+        response = FileResponse(
+            FileRange(
+                default_storage.open(song.peaks.name, 'rb'),
+                section.offset + start,
+                end - start + 1
+            ),
+            status=206 if byte_range else 200,
+            content_type='application/octet-stream'
+        )
+        response.block_size = READ_SIZE
+        response['Content-Length'] = end - start + 1
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        response['X-Peaks-Level'] = section.level
+        response['X-Peaks-Frames'] = section.frames
+        response['X-Peaks-Frame-Size'] = section.frame_size
+        response['X-Peaks-Sample-Rate'] = header.sample_rate
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,59 @@
+import hashlib
+from django.core.files.storage import default_storage
+
+# how much is read from the request/storage at a time; memory use per upload
+# never goes above this
+READ_SIZE = 64 * 1024
+
+
+class LimitedReader:
+    """file like wrapper that reads at most limit bytes from a stream (i.e.
+    the request body)
+    """
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(min(size, READ_SIZE))
+        self.remaining -= len(data)
+        self.bytes_read += len(data)
+        return data
+
+
+class PartsReader:
+    """file like object that reads the stored chunks of an upload one after
+    the other and hashes them on the way
+    """
+
+    def __init__(self, parts):
+        self._names = iter([part.file for part in parts])
+        self._current = None
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = READ_SIZE
+        while True:
+            if self._current is None:
+                name = next(self._names, None)
+                if name is None:
+                    return b''
+                self._current = default_storage.open(name, 'rb')
+            data = self._current.read(size)
+            if data:
+                self.sha256.update(data)
+                return data
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
@@ -0,0 +1,39 @@
+from django.conf import settings
+from rest_framework import serializers
+from core.models import ChunkedUpload
+from upload.targets import TARGETS
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    """serializer for starting a chunked upload and checking on it"""
+    target = serializers.ChoiceField(choices=sorted(TARGETS))
+
+    class Meta:
+        model = ChunkedUpload
+        fields = (
+            'id', 'target', 'object_id', 'filename', 'size', 'offset', 'status'
+        )
+        read_only_fields = ('id', 'offset', 'status')
+
+    def validate_size(self, value):
+        if value is not None and value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Ensure this value is less than or equal to '
+                f'{settings.CHUNKED_UPLOAD_MAX_SIZE}.'
+            )
+        return value
+
+    def validate(self, attrs):
+        """make sure the object the file is for exists and belongs to the user
+        before accepting any bytes
+        """
+        TARGETS[attrs['target']].get_object(
+            self.context['request'].user, attrs.get('object_id')
+        )
+        return attrs
+
+
+class FinalizeSerializer(serializers.Serializer):
+    """serializer for finishing a chunked upload"""
+    # hex sha256 of the whole file; checked against what was actually received
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
@@ -0,0 +1,64 @@
+from PIL import Image
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import ValidationError
+from core.models import Recipe, Song, recipe_image_file_path, song_file_path
+from recipe.images import set_recipe_image
+from recipe.serializers import RecipeImageSerializer
+from song.analysis import set_song_file
+from song.serializers import SongSerializer
+
+
+class RecipeImageTarget:
+    """a chunked upload that becomes a recipe's image"""
+    serializer_class = RecipeImageSerializer
+
+    def get_object(self, user, object_id):
+        try:
+            return Recipe.objects.get(user=user, pk=object_id)
+        except (Recipe.DoesNotExist, TypeError, ValueError):
+            raise ValidationError({'object_id': 'Recipe not found.'})
+
+    def file_path(self, filename):
+        return recipe_image_file_path(None, filename)
+
+    def validate(self, name):
+        """make sure the uploaded file really is an image (same check as
+        ImageField)
+        """
+        try:
+            with default_storage.open(name, 'rb') as f:
+                Image.open(f).verify()
+        except Exception:
+            raise ValidationError('Upload a valid image.')
+
+    def attach(self, obj, name):
+        set_recipe_image(obj, name)
+
+
+class SongFileTarget:
+    """a chunked upload that becomes a song's audio file"""
+    serializer_class = SongSerializer
+
+    def get_object(self, user, object_id):
+        try:
+            return Song.objects.defer('features').get(user=user, pk=object_id)
+        except (Song.DoesNotExist, TypeError, ValueError):
+            raise ValidationError({'object_id': 'Song not found.'})
+
+    def file_path(self, filename):
+        return song_file_path(None, filename, generate_uuid=True)
+
+    def validate(self, name):
+        # audio is only decoded by the analysis; a bad file shows up as
+        # analysis_status failed
+        pass
+
+    def attach(self, obj, name):
+        set_song_file(obj, name)
+
+
+# ChunkedUpload.target => what to do with the finished file
+TARGETS = {
+    'recipe_image': RecipeImageTarget(),
+    'song_file': SongFileTarget(),
+}
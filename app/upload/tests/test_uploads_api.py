@@ -0,0 +1,174 @@
+import hashlib
+import io
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import ChunkedUpload, Recipe
+
+UPLOADS_URL = reverse('upload:chunkedupload-list')
+
+
+def detail_url(upload_id):
+    return reverse('upload:chunkedupload-detail', args=[upload_id])
+
+
+def chunk_url(upload_id, offset):
+    url = reverse('upload:chunkedupload-chunk', args=[upload_id])
+    return f'{url}?offset={offset}'
+
+
+def finalize_url(upload_id):
+    return reverse('upload:chunkedupload-finalize', args=[upload_id])
+
+
+def sample_image_bytes():
+    """return the bytes of a small jpeg"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (50, 50)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class PublicUploadApiTests(TestCase):
+    """test unauthenticated upload API access"""
+
+    def test_auth_required(self):
+        res = APIClient().post(UPLOADS_URL, {})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class PrivateUploadApiTests(TestCase):
+    """test uploading a recipe image in chunks"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=5.00
+        )
+        self.data = sample_image_bytes()
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+        self.recipe.image_thumbnail.delete()
+        self.recipe.image_webp.delete()
+
+    def _start(self, **params):
+        payload = {
+            'target': 'recipe_image',
+            'object_id': self.recipe.id,
+            'filename': 'photo.jpg',
+            'size': len(self.data)
+        }
+        payload.update(params)
+        return self.client.post(UPLOADS_URL, payload, format='json')
+
+    def _send(self, upload_id, offset, data):
+        return self.client.put(
+            chunk_url(upload_id, offset),
+            data,
+            content_type='application/octet-stream'
+        )
+
+    def test_upload_in_chunks(self):
+        """test sending an image in two chunks and finalizing it"""
+        res = self._start()
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        upload_id = res.data['id']
+        half = len(self.data) // 2
+
+        res = self._send(upload_id, 0, self.data[:half])
+        self.assertEqual(res.data['offset'], half)
+        res = self._send(upload_id, half, self.data[half:])
+        self.assertEqual(res.data['offset'], len(self.data))
+
+        res = self.client.post(
+            finalize_url(upload_id),
+            {'sha256': hashlib.sha256(self.data).hexdigest()},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        with default_storage.open(self.recipe.image.name, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.recipe.image_status, 'ready')
+        upload = ChunkedUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.status, 'complete')
+        self.assertFalse(upload.parts.exists())
+
+    def test_wrong_offset_conflict(self):
+        """test a chunk at the wrong offset gets told where to resume from"""
+        upload_id = self._start().data['id']
+        self._send(upload_id, 0, self.data[:10])
+
+        res = self._send(upload_id, 0, self.data[:10])
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], 10)
+        res = self.client.get(detail_url(upload_id))
+        self.assertEqual(res.data['offset'], 10)
+
+    def test_checksum_mismatch(self):
+        """test finalizing with the wrong checksum doesnt attach the file"""
+        upload_id = self._start().data['id']
+        self._send(upload_id, 0, self.data)
+
+        res = self.client.post(
+            finalize_url(upload_id), {'sha256': '0' * 64}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_not_an_image(self):
+        """test a file that isnt an image is rejected on finalize"""
+        self.data = b'not an image'
+        upload_id = self._start().data['id']
+        self._send(upload_id, 0, self.data)
+
+        res = self.client.post(
+            finalize_url(upload_id),
+            {'sha256': hashlib.sha256(self.data).hexdigest()},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipe_rejected(self):
+        """test you cant upload an image to someone else's recipe"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        recipe = Recipe.objects.create(
+            user=user2, title='Theirs', time_minutes=10, price=5.00
+        )
+
+        res = self._start(object_id=recipe.id)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_abort_deletes_chunks(self):
+        """test deleting an upload removes its stored chunks"""
+        upload_id = self._start().data['id']
+        self._send(upload_id, 0, self.data[:10])
+        name = ChunkedUpload.objects.get(id=upload_id).parts.get().file
+
+        res = self.client.delete(detail_url(upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(default_storage.exists(name))
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from upload import views
+
+router = DefaultRouter()
+router.register('uploads', views.ChunkedUploadViewSet)
+app_name = 'upload'
+urlpatterns = [
+    path('', include(router.urls))
+]
@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from core.authentication import CachedTokenAuthentication
+from core.models import (
+    ChunkedUpload, ChunkedUploadPart, chunk_file_path, UPLOAD_ACTIVE,
+    UPLOAD_COMPLETE
+)
+from upload import serializers
+from upload.files import LimitedReader, PartsReader
+from upload.targets import TARGETS
+
+
+class ChunkedUploadViewSet(viewsets.GenericViewSet,
+                           mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin):
+    """upload a big file in pieces and resume after a dropped connection
+
+    POST   /uploads/                     {target, object_id, filename, size}
+                                         => upload with offset 0
+    PUT    /uploads/:id/chunk/?offset=N  raw bytes; N has to be the offset
+    GET    /uploads/:id/                 => offset (where to resume from)
+    POST   /uploads/:id/finalize/        {sha256} => the object the file was
+                                         attached to
+    DELETE /uploads/:id/                 give up and throw away the chunks
+    """
+    serializer_class = serializers.ChunkedUploadSerializer
+    queryset = ChunkedUpload.objects.all()
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def _check_active(self, upload):
+        if upload.status != UPLOAD_ACTIVE:
+            raise ValidationError('Upload is already finalized.')
+
+    def _conflict(self, upload):
+        """tell the client where to resume from"""
+        upload.refresh_from_db(fields=['offset'])
+        return Response(
+            {
+                'detail': 'Offset does not match the upload.',
+                'offset': upload.offset
+            },
+            status=status.HTTP_409_CONFLICT
+        )
+
+    def _delete_parts(self, upload):
+        for name in upload.parts.values_list('file', flat=True):
+            default_storage.delete(name)
+        upload.parts.all().delete()
+
+    @action(methods=['PUT'], detail=True)
+    def chunk(self, request, pk=None):
+        """append the request body to the upload"""
+        upload = self.get_object()
+        self._check_active(upload)
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError('offset and Content-Length are required.')
+        if offset != upload.offset:
+            return self._conflict(upload)
+        if length <= 0:
+            raise ValidationError('Chunk is empty.')
+        if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            return Response(
+                {
+                    'detail': 'Chunks cannot be bigger than '
+                    f'{settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE} bytes.'
+                },
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        total = upload.size or settings.CHUNKED_UPLOAD_MAX_SIZE
+        if offset + length > total:
+            raise ValidationError('Chunk goes past the end of the file.')
+
+        # the body is streamed into storage a bit at a time; it is never read
+        # into memory as a whole
+        reader = LimitedReader(request.stream, length)
+        name = default_storage.save(
+            chunk_file_path(upload.id, offset),
+            File(reader, name=upload.filename)
+        )
+        if reader.bytes_read != length:
+            default_storage.delete(name)
+            raise ValidationError('Chunk is shorter than its Content-Length.')
+        try:
+            with transaction.atomic():
+                ChunkedUploadPart.objects.create(
+                    upload=upload, offset=offset, size=length, file=name
+                )
+                # only moves forward if no other request appended in the
+                # meantime
+                updated = ChunkedUpload.objects.filter(
+                    pk=upload.pk, offset=offset
+                ).update(offset=offset + length)
+                if not updated:
+                    raise IntegrityError
+        except IntegrityError:
+            default_storage.delete(name)
+            return self._conflict(upload)
+        return Response({'offset': offset + length})
+
+    @action(methods=['POST'], detail=True)
+    def finalize(self, request, pk=None):
+        """join the chunks into the final file, check it and attach it to its
+        object
+        """
+        upload = self.get_object()
+        self._check_active(upload)
+        serializer = serializers.FinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = TARGETS[upload.target]
+        obj = target.get_object(request.user, upload.object_id)
+
+        parts = list(upload.parts.order_by('offset'))
+        expected_offset = 0
+        for part in parts:
+            if part.offset != expected_offset:
+                raise ValidationError('Upload is missing chunks.')
+            expected_offset += part.size
+        if not parts or expected_offset != upload.offset:
+            raise ValidationError('Upload is missing chunks.')
+        if upload.size is not None and expected_offset != upload.size:
+            return self._conflict(upload)
+
+        reader = PartsReader(parts)
+        try:
+            name = default_storage.save(
+                target.file_path(upload.filename),
+                File(reader, name=upload.filename)
+            )
+        finally:
+            reader.close()
+        sha256 = serializer.validated_data['sha256'].lower()
+        if reader.sha256.hexdigest() != sha256:
+            default_storage.delete(name)
+            raise ValidationError(
+                {'sha256': 'Checksum does not match the uploaded data.'}
+            )
+        try:
+            target.validate(name)
+        except ValidationError:
+            default_storage.delete(name)
+            raise
+
+        with transaction.atomic():
+            target.attach(obj, name)
+            upload.status = UPLOAD_COMPLETE
+            upload.save(update_fields=['status'])
+        self._delete_parts(upload)
+        return Response(
+            target.serializer_class(
+                obj, context=self.get_serializer_context()
+            ).data
+        )
+
+    def perform_destroy(self, instance):
+        self._delete_parts(instance)
+        instance.delete()
@@ -1,6 +1,8 @@
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from core.authentication import CachedTokenAuthentication
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 class CreateUserView(generics.CreateAPIView):
@@ -16,9 +18,12 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
     # typically with api view it would link 2 item and u would get the objects for that; instead we gonna just retrieve the authenticated logged in user
     def get_object(self):
         # b/c we have the authentication classes we can just grab the user form the request
-        return self.request.user
\ No newline at end of file
+        # request.user can be a copy from the token cache so load it again;
+        # saving the copy would write back whatever it held (i.e. an old
+        # password hash or is_active)
+        return get_user_model().objects.get(pk=self.request.user.pk)
\ No newline at end of file